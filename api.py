@@ -0,0 +1,383 @@
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, abort, current_app, g, jsonify, make_response, request, session
+from sqlalchemy import insert, literal, union_all
+from sqlalchemy.orm import joinedload
+
+from auth import authenticate, get_current_user, has_role, start_session
+from booking import book_appointment, bulk_set_status, BookingError, SlotTaken, BULK_ACTIONS
+import cache
+from models import db, User, Appointment, Treatment, ArchivedAppointment, ArchivedTreatment, DoctorAvailability
+from pagination import keyset_paginate, InvalidCursor
+from schedule import expand
+from search import search_users
+from slots import free_slots, serialize_slots, booking_window
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def error(status, message):
+    return make_response(jsonify(error=message), status)
+
+
+def fail(status, message):
+    abort(error(status, message))
+
+
+def api_auth(*roles):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'user_id' not in session:
+                return error(401, 'Authentication required.')
+            role = next((r for r in roles if has_role(r)), None)
+            if role is None:
+                return error(403, 'You do not have permission to access this resource.')
+            g.api_role = role
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def json_body():
+    # Requiring a JSON content type keeps cross-site form posts out, which is
+    # why the blueprint can be exempt from CSRF tokens.
+    if not request.is_json:
+        fail(415, 'Request body must be JSON.')
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        fail(400, 'Request body must be a JSON object.')
+    return payload
+
+
+def parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        fail(400, f'{name} must be a date in YYYY-MM-DD format.')
+
+
+def parse_time(value, name):
+    try:
+        return datetime.strptime(value, '%H:%M').time()
+    except (TypeError, ValueError):
+        fail(400, f'{name} must be a time in HH:MM format.')
+
+
+def date_arg(name):
+    value = request.args.get(name)
+    return parse_date(value, name) if value else None
+
+
+def conditional(payload):
+    response = jsonify(payload)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def user_json(user):
+    return {
+        'id': user.id,
+        'name': user.name,
+        'email': user.email,
+        'phone': user.phone,
+        'role': user.role,
+        'department_id': user.department_id,
+        'is_active': user.is_active,
+    }
+
+
+def appointment_json(appointment):
+    return {
+        'id': appointment.id,
+        'patient_id': appointment.patient_id,
+        'patient': appointment.patient.name,
+        'doctor_id': appointment.doctor_id,
+        'doctor': appointment.doctor.name,
+        'date': appointment.date.isoformat(),
+        'time': appointment.time.strftime('%H:%M'),
+        'status': appointment.status,
+        'reason': appointment.reason,
+    }
+
+
+def clock(minute):
+    return '%02d:%02d' % divmod(minute, 60)
+
+
+def availability_json(doctor_id, day, start, end):
+    return {
+        'doctor_id': doctor_id,
+        'date': day.isoformat(),
+        'start_time': clock(start),
+        'end_time': clock(end),
+    }
+
+
+def treatment_json(treatment):
+    return {
+        'id': treatment.id,
+        'appointment_id': treatment.appointment_id,
+        'patient_id': treatment.appointment.patient_id,
+        'doctor_id': treatment.appointment.doctor_id,
+        'date': treatment.appointment.date.isoformat(),
+        'diagnosis': treatment.diagnosis,
+        'prescription': treatment.prescription,
+        'notes': treatment.notes,
+    }
+
+
+def per_page_arg():
+    return max(1, min(request.args.get('per_page', current_app.config['APPOINTMENTS_PER_PAGE'], type=int), 500))
+
+
+def keyset_response(query, columns, serializer):
+    try:
+        page = keyset_paginate(query, columns, cursor=request.args.get('cursor'), per_page=per_page_arg())
+    except InvalidCursor:
+        return error(400, 'Invalid cursor.')
+    return conditional({'items': [serializer(item) for item in page], 'next_cursor': page.next_cursor})
+
+
+def search_response(fields, filters):
+    page = request.args.get('page', 1, type=int)
+    query = request.args.get('q', '')
+    if query:
+        results = search_users(query, fields, filters=filters, page=page, per_page=per_page_arg())
+    else:
+        results = User.query.filter(*filters).order_by(User.id).paginate(
+            page=page, per_page=per_page_arg(), error_out=False
+        )
+    return conditional({
+        'items': [user_json(user) for user in results.items],
+        'page': results.page,
+        'pages': results.pages,
+        'total': results.total,
+    })
+
+
+@api.route('/session', methods=['POST'])
+def create_session():
+    payload = json_body()
+    user = authenticate(payload.get('email'), payload.get('password'))
+    if not user:
+        return error(401, 'Invalid email or password.')
+    start_session(user)
+    return jsonify(user_json(user))
+
+
+@api.route('/session', methods=['DELETE'])
+def delete_session():
+    session.clear()
+    return '', 204
+
+
+@api.route('/doctors')
+@api_auth('Admin', 'Doctor', 'Patient')
+def list_doctors():
+    filters = [User.role == 'Doctor', User.is_active == True]
+    department_id = request.args.get('department_id', type=int)
+    if department_id:
+        filters.append(User.department_id == department_id)
+    return search_response(('name', 'email'), filters)
+
+
+@api.route('/doctors/<int:doctor_id>/slots')
+@api_auth('Admin', 'Doctor', 'Patient')
+def doctor_slots(doctor_id):
+    start_date, end_date = booking_window()
+    start_date = date_arg('start') or start_date
+    end_date = date_arg('end') or end_date
+    if end_date < start_date or (end_date - start_date).days > 366:
+        return error(400, 'Date range must be between 0 and 366 days.')
+    return conditional({
+        'doctor_id': doctor_id,
+        'slots': serialize_slots(free_slots(doctor_id, start_date, end_date)),
+    })
+
+
+@api.route('/patients')
+@api_auth('Admin')
+def list_patients():
+    return search_response(('name', 'email', 'phone'), [User.role == 'Patient'])
+
+
+@api.route('/appointments')
+@api_auth('Admin', 'Doctor', 'Patient')
+def list_appointments():
+    query = Appointment.query.options(joinedload(Appointment.patient), joinedload(Appointment.doctor))
+    if g.api_role == 'Doctor':
+        query = query.filter(Appointment.doctor_id == session['user_id'])
+    elif g.api_role == 'Patient':
+        query = query.filter(Appointment.patient_id == session['user_id'])
+
+    status = request.args.get('status')
+    doctor_id = request.args.get('doctor_id', type=int)
+    date_from = date_arg('date_from')
+    date_to = date_arg('date_to')
+    if status:
+        query = query.filter(Appointment.status == status)
+    if doctor_id:
+        query = query.filter(Appointment.doctor_id == doctor_id)
+    if date_from:
+        query = query.filter(Appointment.date >= date_from)
+    if date_to:
+        query = query.filter(Appointment.date <= date_to)
+
+    return keyset_response(query, [Appointment.date, Appointment.time, Appointment.id], appointment_json)
+
+
+@api.route('/appointments', methods=['POST'])
+@api_auth('Patient')
+def create_appointment():
+    payload = json_body()
+    doctor_id = payload.get('doctor_id')
+    if not isinstance(doctor_id, int):
+        return error(400, 'doctor_id must be an integer.')
+    try:
+        appointment = book_appointment(
+            patient_id=session['user_id'],
+            doctor_id=doctor_id,
+            appointment_date=parse_date(payload.get('date'), 'date'),
+            appointment_time=parse_time(payload.get('time'), 'time'),
+            reason=payload.get('reason')
+        )
+    except BookingError as exc:
+        return error(409 if isinstance(exc, SlotTaken) else 422, exc.message)
+    return make_response(jsonify(appointment_json(appointment)), 201)
+
+
+@api.route('/appointments/bulk', methods=['POST'])
+@api_auth('Admin')
+def bulk_appointments():
+    payload = json_body()
+    status = BULK_ACTIONS.get(payload.get('action'))
+    ids = payload.get('ids')
+    if status is None:
+        return error(400, 'action must be one of: %s.' % ', '.join(BULK_ACTIONS))
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        return error(400, 'ids must be a list of integers.')
+    if len(ids) > current_app.config['API_BULK_LIMIT']:
+        return error(400, 'At most %d ids per request.' % current_app.config['API_BULK_LIMIT'])
+
+    report = bulk_set_status(status, ids=ids)
+    return jsonify(results=[
+        {'id': appointment_id, 'result': result, 'status': current}
+        for appointment_id, (result, current) in report.items()
+    ])
+
+
+@api.route('/availability')
+@api_auth('Admin', 'Doctor', 'Patient')
+def list_availability():
+    doctor_id = request.args.get('doctor_id', type=int)
+    if g.api_role == 'Doctor':
+        doctor_id = session['user_id']
+    if not doctor_id:
+        return error(400, 'doctor_id is required.')
+    start_date, end_date = booking_window()
+    # The same working hours free_slots cuts into slots: weekly rules and
+    # single days, less time off and holidays.
+    days = expand(date_arg('start') or start_date, date_arg('end') or end_date, [doctor_id])
+    return conditional({'items': [
+        availability_json(doctor_id, day, start, end) for _, day, intervals in days for start, end in intervals
+    ]})
+
+
+@api.route('/availability/bulk', methods=['POST'])
+@api_auth('Admin', 'Doctor')
+def bulk_availability():
+    items = json_body().get('items')
+    if not isinstance(items, list) or not items:
+        return error(400, 'items must be a non-empty list.')
+    if len(items) > current_app.config['API_BULK_LIMIT']:
+        return error(400, 'At most %d items per request.' % current_app.config['API_BULK_LIMIT'])
+
+    rows = []
+    for n, item in enumerate(items):
+        if not isinstance(item, dict):
+            return error(400, f'items[{n}] must be an object.')
+        doctor_id = session['user_id'] if g.api_role == 'Doctor' else item.get('doctor_id')
+        if not isinstance(doctor_id, int):
+            return error(400, f'items[{n}].doctor_id must be an integer.')
+        start_time = parse_time(item.get('start_time'), f'items[{n}].start_time')
+        end_time = parse_time(item.get('end_time'), f'items[{n}].end_time')
+        if end_time <= start_time:
+            return error(400, f'items[{n}] must end after it starts.')
+        rows.append({
+            'doctor_id': doctor_id,
+            'date': parse_date(item.get('date'), f'items[{n}].date'),
+            'start_time': start_time,
+            'end_time': end_time,
+            'is_available': True,
+        })
+
+    doctor_ids = {row['doctor_id'] for row in rows}
+    known = {i for (i,) in db.session.query(User.id).filter(User.id.in_(doctor_ids), User.role == 'Doctor')}
+    if doctor_ids - known:
+        return error(400, 'Unknown doctor ids: %s.' % ', '.join(map(str, sorted(doctor_ids - known))))
+
+    db.session.execute(insert(DoctorAvailability), rows)
+    cache.changed('availability')
+    db.session.commit()
+    return make_response(jsonify(created=len(rows)), 201)
+
+
+def _treatment_keys(criteria):
+    # Archived treatments keep their ids, but an id freed in the hot table
+    # can be reused, so (id, source) is the page key.
+    selects = [
+        db.select(literal(source).label('source'), treatment.id.label('id')).join(
+            appointment, appointment.id == treatment.appointment_id
+        ).where(*criteria(appointment))
+        for source, treatment, appointment in (
+            ('hot', Treatment, Appointment), ('archive', ArchivedTreatment, ArchivedAppointment)
+        )
+    ]
+    return union_all(*selects).subquery()
+
+
+@api.route('/treatments')
+@api_auth('Admin', 'Doctor', 'Patient')
+def list_treatments():
+    patient_id = request.args.get('patient_id', type=int)
+
+    def criteria(appointment):
+        filters = []
+        if g.api_role == 'Doctor':
+            filters.append(appointment.doctor_id == session['user_id'])
+        elif g.api_role == 'Patient':
+            filters.append(appointment.patient_id == session['user_id'])
+        if patient_id:
+            filters.append(appointment.patient_id == patient_id)
+        return filters
+
+    keys = _treatment_keys(criteria)
+    try:
+        page = keyset_paginate(db.session.query(keys.c.source, keys.c.id), [keys.c.id, keys.c.source],
+                               cursor=request.args.get('cursor'), per_page=per_page_arg())
+    except InvalidCursor:
+        return error(400, 'Invalid cursor.')
+
+    loaded = {}
+    for source, model in (('hot', Treatment), ('archive', ArchivedTreatment)):
+        ids = [i for s, i in page if s == source]
+        if ids:
+            for treatment in model.query.options(joinedload(model.appointment)).filter(model.id.in_(ids)):
+                loaded[source, treatment.id] = treatment
+    items = [loaded[source, i] for source, i in page if (source, i) in loaded]
+    return conditional({'items': [treatment_json(item) for item in items], 'next_cursor': page.next_cursor})
+
+
+@api.route('/me')
+@api_auth('Admin', 'Doctor', 'Patient')
+def me():
+    return jsonify(user_json(get_current_user()))
+
+
+def init_app(app, csrf):
+    app.config.setdefault('API_BULK_LIMIT', 1000)
+    csrf.exempt(api)
+    app.register_blueprint(api)
@@ -1,87 +1,138 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Blueprint, Flask, Response, current_app, render_template, request, redirect, url_for, session, flash, abort, jsonify, stream_with_context
 from flask_wtf.csrf import CSRFProtect
-from models import db, User, Department, Appointment, Treatment, DoctorAvailability
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from models import db, User, Department, Appointment, Treatment, DoctorPatient, DoctorAvailability, AvailabilityRule, AvailabilityException
+from pagination import keyset_paginate, InvalidCursor
+from migrations import upgrade
+from booking import book_appointment, cancel_appointment, bulk_set_status, BookingError, BULK_ACTIONS, TRANSITIONS
+from slots import free_slots, serialize_slots, booking_window
+from schedule import expand, available_doctor_ids, as_time, weekday_mask, mask_weekdays, WEEKDAYS
+from config import CONFIGS
+import database
+from auth import get_current_user, active_user, login_redirect, authenticate, start_session, login_required, role_required
+import stats
+import roster
+import archive
+import reports
+import events
+import replicas
+import responses
+from responses import conditional
+import search
+from search import search_users
+import api
+import passwords
+import cache
+import metrics
+import jobs
+import notifications
+from notifications import status_changed
+from cache import fragment
+from export import export_appointments, FORMATS
+from importer import import_records, ImportReadError, KINDS as IMPORT_KINDS, FORMATS as IMPORT_FORMATS
+from stats import get_counters, breakdown
 from datetime import datetime, timedelta, date, time
-from functools import wraps
+from time import sleep
+import click
+import io
+import json
 import os
 
-app = Flask(__name__)
-
-if not os.environ.get('SESSION_SECRET'):
-    print("WARNING: SESSION_SECRET not set. Using development key. DO NOT USE IN PRODUCTION!")
-    app.config['SECRET_KEY'] = 'development-key-please-change'
-else:
-    app.config['SECRET_KEY'] = os.environ.get('SESSION_SECRET')
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///hospital.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['WTF_CSRF_ENABLED'] = True
-
-csrf = CSRFProtect(app)
-db.init_app(app)
-
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Please log in to access this page.', 'warning')
-            return redirect(url_for('login'))
-        return f(*args, **kwargs)
-    return decorated_function
-
-def role_required(role):
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            if 'user_id' not in session:
-                flash('Please log in to access this page.', 'warning')
-                return redirect(url_for('login'))
-            user = User.query.get(session['user_id'])
-            if not user or user.role != role:
-                flash('You do not have permission to access this page.', 'danger')
-                return redirect(url_for('index'))
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
-
-@app.route('/')
+APPOINTMENT_STATUSES = ['Pending', 'Booked', 'Completed', 'Cancelled']
+
+DEFAULT_DEPARTMENTS = [
+    ('Cardiology', 'Heart and cardiovascular system'),
+    ('Neurology', 'Brain and nervous system'),
+    ('Orthopedics', 'Bones and joints'),
+    ('Pediatrics', 'Children healthcare'),
+    ('Dermatology', 'Skin conditions'),
+    ('General Medicine', 'General health issues')
+]
+
+csrf = CSRFProtect()
+main = Blueprint('main', __name__, cli_group=None)
+
+def create_app(config=None):
+    """Build the application.
+
+    Settings come from the class in ``config.CONFIGS`` named by HOSPITAL_ENV
+    (development by default), then the file in HOSPITAL_SETTINGS, then
+    HOSPITAL_* environment variables, then ``config``.
+    """
+    app = Flask(__name__)
+    env = os.environ.get('HOSPITAL_ENV', 'development')
+    if env not in CONFIGS:
+        raise RuntimeError(f'Unknown HOSPITAL_ENV {env!r}; use one of {", ".join(CONFIGS)}.')
+    app.config.from_object(CONFIGS[env])
+    app.config.from_envvar('HOSPITAL_SETTINGS', silent=True)
+    app.config.from_prefixed_env('HOSPITAL')
+    app.config.update(config or {})
+    
+    if not app.config['SECRET_KEY']:
+        if env == 'production':
+            raise RuntimeError('SESSION_SECRET must be set when HOSPITAL_ENV is production.')
+        print("WARNING: SESSION_SECRET not set. Using development key. DO NOT USE IN PRODUCTION!")
+        app.config['SECRET_KEY'] = 'development-key-please-change'
+    
+    csrf.init_app(app)
+    database.init_app(app)
+    replicas.init_app(app)
+    metrics.init_app(app)
+    passwords.init_app(app)
+    cache.init_app(app)
+    jobs.init_app(app)
+    notifications.init_app(app)
+    stats.init_app(app)
+    roster.init_app(app)
+    archive.init_app(app)
+    reports.init_app(app)
+    events.init_app(app)
+    search.init_app(app)
+    responses.init_app(app)
+    api.init_app(app, csrf)
+    app.register_blueprint(main)
+    return app
+
+@main.route('/')
 def index():
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
+    if 'user_id' in session and not active_user():
+        return login_redirect()
+    user = get_current_user()
+    if user:
         if user.role == 'Admin':
-            return redirect(url_for('admin_dashboard'))
+            return redirect(url_for('main.admin_dashboard'))
         elif user.role == 'Doctor':
-            return redirect(url_for('doctor_dashboard'))
+            return redirect(url_for('main.doctor_dashboard'))
         elif user.role == 'Patient':
-            return redirect(url_for('patient_dashboard'))
+            return redirect(url_for('main.patient_dashboard'))
     return render_template('index.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
         
-        user = User.query.filter_by(email=email).first()
+        user = authenticate(email, password)
         
-        if user and user.check_password(password) and user.is_active:
-            session['user_id'] = user.id
-            session['user_name'] = user.name
-            session['user_role'] = user.role
+        if user:
+            start_session(user)
             flash(f'Welcome back, {user.name}!', 'success')
             
             if user.role == 'Admin':
-                return redirect(url_for('admin_dashboard'))
+                return redirect(url_for('main.admin_dashboard'))
             elif user.role == 'Doctor':
-                return redirect(url_for('doctor_dashboard'))
+                return redirect(url_for('main.doctor_dashboard'))
             elif user.role == 'Patient':
-                return redirect(url_for('patient_dashboard'))
+                return redirect(url_for('main.patient_dashboard'))
         else:
             flash('Invalid email or password.', 'danger')
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@main.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -94,7 +145,7 @@ def register():
         
         if User.query.filter_by(email=email).first():
             flash('Email already registered.', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         
         user = User(
             name=name,
@@ -114,53 +165,62 @@ def register():
         db.session.commit()
         
         flash('Registration successful! Please log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     
     return render_template('register.html')
 
-@app.route('/logout')
+@main.route('/logout')
 def logout():
     session.clear()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/admin/dashboard')
+@main.route('/admin/dashboard')
 @role_required('Admin')
 def admin_dashboard():
-    total_doctors = User.query.filter_by(role='Doctor', is_active=True).count()
-    total_patients = User.query.filter_by(role='Patient', is_active=True).count()
-    total_appointments = Appointment.query.count()
-    pending_appointments = Appointment.query.filter_by(status='Pending').count()
+    counters = get_counters()
     
-    recent_appointments = Appointment.query.order_by(Appointment.created_at.desc()).limit(10).all()
+    recent_appointments = Appointment.query.options(
+        joinedload(Appointment.patient),
+        joinedload(Appointment.doctor)
+    ).order_by(Appointment.created_at.desc()).limit(10).all()
+    
+    department_names = dict(db.session.query(Department.id, Department.name))
+    department_counts = [
+        (department_names.get(int(key), 'Unknown') if key != 'none' else 'No Department', total)
+        for key, total in breakdown(counters, 'appointments:department:').items()
+        if total
+    ]
     
     return render_template('admin/dashboard.html',
-                         total_doctors=total_doctors,
-                         total_patients=total_patients,
-                         total_appointments=total_appointments,
-                         pending_appointments=pending_appointments,
+                         total_doctors=counters['users:Doctor'],
+                         total_patients=counters['users:Patient'],
+                         total_appointments=counters['appointments:total'],
+                         pending_appointments=counters['appointments:status:Pending'],
+                         status_counts=[(status, counters['appointments:status:' + status]) for status in APPOINTMENT_STATUSES],
+                         department_counts=sorted(department_counts, key=lambda item: -item[1]),
                          recent_appointments=recent_appointments)
 
-@app.route('/admin/doctors')
+@main.route('/admin/doctors')
 @role_required('Admin')
+@conditional(User, Department)
 def admin_doctors():
     search_query = request.args.get('search', '')
     
     if search_query:
-        doctors = User.query.filter(
-            User.role == 'Doctor',
-            db.or_(
-                User.name.ilike(f'%{search_query}%'),
-                User.email.ilike(f'%{search_query}%')
-            )
-        ).all()
+        doctors = search_users(
+            search_query,
+            fields=('name', 'email'),
+            filters=[User.role == 'Doctor'],
+            page=request.args.get('page', 1, type=int)
+        )
     else:
         doctors = User.query.filter_by(role='Doctor').all()
     
     departments = Department.query.all()
     return render_template('admin/doctors.html', doctors=doctors, departments=departments)
 
-@app.route('/admin/doctor/add', methods=['POST'])
+@main.route('/admin/doctor/add', methods=['POST'])
 @role_required('Admin')
 def admin_add_doctor():
     name = request.form.get('name')
@@ -171,7 +231,7 @@ def admin_add_doctor():
     
     if User.query.filter_by(email=email).first():
         flash('Email already exists.', 'danger')
-        return redirect(url_for('admin_doctors'))
+        return redirect(url_for('main.admin_doctors'))
     
     doctor = User(
         name=name,
@@ -186,9 +246,9 @@ def admin_add_doctor():
     db.session.commit()
     
     flash('Doctor added successfully.', 'success')
-    return redirect(url_for('admin_doctors'))
+    return redirect(url_for('main.admin_doctors'))
 
-@app.route('/admin/doctor/edit/<int:doctor_id>', methods=['POST'])
+@main.route('/admin/doctor/edit/<int:doctor_id>', methods=['POST'])
 @role_required('Admin')
 def admin_edit_doctor(doctor_id):
     doctor = User.query.get_or_404(doctor_id)
@@ -198,6 +258,7 @@ def admin_edit_doctor(doctor_id):
     doctor.phone = request.form.get('phone')
     department_id = request.form.get('department_id')
     doctor.department_id = department_id if department_id else None
+    doctor.slot_minutes = request.form.get('slot_minutes', type=int) or None
     
     password = request.form.get('password')
     if password:
@@ -205,37 +266,36 @@ def admin_edit_doctor(doctor_id):
     
     db.session.commit()
     flash('Doctor updated successfully.', 'success')
-    return redirect(url_for('admin_doctors'))
+    return redirect(url_for('main.admin_doctors'))
 
-@app.route('/admin/doctor/delete/<int:doctor_id>', methods=['POST'])
+@main.route('/admin/doctor/delete/<int:doctor_id>', methods=['POST'])
 @role_required('Admin')
 def admin_delete_doctor(doctor_id):
     doctor = User.query.get_or_404(doctor_id)
     doctor.is_active = False
     db.session.commit()
     flash('Doctor removed successfully.', 'success')
-    return redirect(url_for('admin_doctors'))
+    return redirect(url_for('main.admin_doctors'))
 
-@app.route('/admin/patients')
+@main.route('/admin/patients')
 @role_required('Admin')
+@conditional(User)
 def admin_patients():
     search_query = request.args.get('search', '')
     
     if search_query:
-        patients = User.query.filter(
-            User.role == 'Patient',
-            db.or_(
-                User.name.ilike(f'%{search_query}%'),
-                User.email.ilike(f'%{search_query}%'),
-                User.phone.ilike(f'%{search_query}%')
-            )
-        ).all()
+        patients = search_users(
+            search_query,
+            fields=('name', 'email', 'phone'),
+            filters=[User.role == 'Patient'],
+            page=request.args.get('page', 1, type=int)
+        )
     else:
         patients = User.query.filter_by(role='Patient').all()
     
     return render_template('admin/patients.html', patients=patients)
 
-@app.route('/admin/patient/edit/<int:patient_id>', methods=['POST'])
+@main.route('/admin/patient/edit/<int:patient_id>', methods=['POST'])
 @role_required('Admin')
 def admin_edit_patient(patient_id):
     patient = User.query.get_or_404(patient_id)
@@ -247,45 +307,252 @@ def admin_edit_patient(patient_id):
     
     db.session.commit()
     flash('Patient updated successfully.', 'success')
-    return redirect(url_for('admin_patients'))
+    return redirect(url_for('main.admin_patients'))
 
-@app.route('/admin/patient/delete/<int:patient_id>', methods=['POST'])
+@main.route('/admin/patient/delete/<int:patient_id>', methods=['POST'])
 @role_required('Admin')
 def admin_delete_patient(patient_id):
     patient = User.query.get_or_404(patient_id)
     patient.is_active = False
     db.session.commit()
     flash('Patient removed successfully.', 'success')
-    return redirect(url_for('admin_patients'))
+    return redirect(url_for('main.admin_patients'))
+
+def parse_date_arg(name):
+    value = request.values.get(name, '')
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        abort(400)
 
-@app.route('/admin/appointments')
+def parse_date_field(name, required=False):
+    value = request.form.get(name, '')
+    if not value:
+        if required:
+            raise ValueError('Please choose a date.')
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Dates must be in YYYY-MM-DD format.')
+
+def parse_time_field(name, required=False):
+    value = request.form.get(name, '')
+    if not value:
+        if required:
+            raise ValueError('Please choose a start and end time.')
+        return None
+    try:
+        return datetime.strptime(value, '%H:%M').time()
+    except ValueError:
+        raise ValueError('Times must be in HH:MM format.')
+
+def appointment_filters():
+    status = request.values.get('status', '')
+    doctor_id = request.values.get('doctor_id', type=int)
+    date_from = parse_date_arg('date_from')
+    date_to = parse_date_arg('date_to')
+    
+    criteria = []
+    if status:
+        criteria.append(Appointment.status == status)
+    if doctor_id:
+        criteria.append(Appointment.doctor_id == doctor_id)
+    if date_from:
+        criteria.append(Appointment.date >= date_from)
+    if date_to:
+        criteria.append(Appointment.date <= date_to)
+    
+    filters = {
+        'status': status,
+        'doctor_id': doctor_id or '',
+        'date_from': request.values.get('date_from', ''),
+        'date_to': request.values.get('date_to', '')
+    }
+    return criteria, filters
+
+@main.route('/admin/appointments')
 @role_required('Admin')
+@conditional(Appointment, User, Department)
 def admin_appointments():
-    appointments = Appointment.query.order_by(Appointment.date.desc(), Appointment.time.desc()).all()
-    return render_template('admin/appointments.html', appointments=appointments)
+    criteria, filters = appointment_filters()
+    per_page = min(request.args.get('per_page', current_app.config['APPOINTMENTS_PER_PAGE'], type=int), 200)
+    
+    query = Appointment.query.options(
+        joinedload(Appointment.patient),
+        joinedload(Appointment.doctor).joinedload(User.department)
+    ).filter(*criteria)
+    
+    try:
+        page = keyset_paginate(
+            query,
+            [Appointment.date, Appointment.time, Appointment.id],
+            cursor=request.args.get('cursor'),
+            per_page=max(per_page, 1)
+        )
+    except InvalidCursor:
+        abort(400)
+    
+    doctors = db.session.query(User.id, User.name).filter(User.role == 'Doctor').order_by(User.name).all()
+    
+    return render_template('admin/appointments.html',
+                         appointments=page,
+                         page=page,
+                         doctors=doctors,
+                         filters=filters,
+                         page_args={k: v for k, v in filters.items() if v},
+                         statuses=APPOINTMENT_STATUSES)
 
-@app.route('/admin/appointment/approve/<int:appointment_id>', methods=['POST'])
+@main.route('/admin/appointments/bulk', methods=['POST'])
 @role_required('Admin')
-def admin_approve_appointment(appointment_id):
-    appointment = Appointment.query.get_or_404(appointment_id)
-    appointment.status = 'Booked'
+def admin_bulk_appointments():
+    status = BULK_ACTIONS.get(request.form.get('action'))
+    if status is None:
+        abort(400)
+    
+    criteria, filters = appointment_filters()
+    
+    if request.form.get('scope') == 'filter':
+        report = bulk_set_status(status, criteria=criteria + [Appointment.status.in_(TRANSITIONS[status])])
+    else:
+        ids = request.form.getlist('appointment_ids', type=int)
+        if not ids:
+            flash('Select at least one appointment.', 'warning')
+            return redirect(url_for('main.admin_appointments', **{k: v for k, v in filters.items() if v}))
+        report = bulk_set_status(status, ids=ids)
+    
+    results = [(appointment_id, result, current) for appointment_id, (result, current) in report.items()]
+    updated = sum(1 for _, result, _ in results if result == 'updated')
+    
+    return render_template('admin/bulk_report.html',
+                         action=request.form.get('action'),
+                         results=results,
+                         updated=updated,
+                         page_args={k: v for k, v in filters.items() if v})
+
+@main.route('/admin/export/appointments')
+@role_required('Admin')
+def admin_export_appointments():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400)
+    
+    chunks = export_appointments(
+        fmt,
+        feed=request.args.get('feed') or None,
+        date_from=parse_date_arg('date_from'),
+        date_to=parse_date_arg('date_to'),
+        doctor_id=request.args.get('doctor_id', type=int),
+        department_id=request.args.get('department_id', type=int)
+    )
+    filename = f"appointments-{date.today().isoformat()}.{fmt}"
+    return Response(stream_with_context(chunks),
+                    mimetype=FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@main.route('/admin/import', methods=['GET', 'POST'])
+@role_required('Admin')
+def admin_import():
+    report = None
+    
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in IMPORT_KINDS or not upload or not upload.filename:
+            flash('Choose what to import and a file to upload.', 'danger')
+            return redirect(url_for('main.admin_import'))
+        
+        extension = upload.filename.rsplit('.', 1)[-1].lower()
+        fmt = {'jsonl': 'ndjson'}.get(extension, extension)
+        if fmt not in IMPORT_FORMATS:
+            flash('Upload a .csv, .json or .ndjson file.', 'danger')
+            return redirect(url_for('main.admin_import'))
+        
+        try:
+            report = import_records(kind, io.TextIOWrapper(upload.stream, encoding='utf-8-sig'), fmt)
+        except ImportReadError as exc:
+            if not exc.report.inserted:
+                flash('The file could not be read. Check its format and encoding.', 'danger')
+                return redirect(url_for('main.admin_import'))
+            flash(f'The file could not be read to the end. The {exc.report.inserted} records before the error '
+                  'were imported; check its format and encoding before importing the rest.', 'danger')
+            report = exc.report
+    
+    return render_template('admin/import.html', report=report, kinds=IMPORT_KINDS)
+
+@main.route('/admin/reports')
+@role_required('Admin')
+def admin_reports():
+    period = request.args.get('period') or str(date.today().year)
+    report = None
+    try:
+        report = reports.get_report(period, refresh=request.args.get('refresh', type=int) == 1)
+    except reports.ReportError as exc:
+        flash(str(exc), 'danger')
+    return render_template('admin/reports.html', period=period, report=report)
+
+@main.route('/admin/holidays', methods=['GET', 'POST'])
+@role_required('Admin')
+def admin_holidays():
+    if request.method == 'POST':
+        try:
+            holiday = AvailabilityException(
+                date=parse_date_field('date', required=True),
+                reason=request.form.get('reason') or None
+            )
+        except ValueError as exc:
+            flash(str(exc), 'danger')
+            return redirect(url_for('main.admin_holidays'))
+        db.session.add(holiday)
+        db.session.commit()
+        flash('Holiday added. No appointments can be booked on that day.', 'success')
+        return redirect(url_for('main.admin_holidays'))
+    
+    holidays = AvailabilityException.query.filter(
+        AvailabilityException.doctor_id == None,
+        AvailabilityException.date >= date.today()
+    ).order_by(AvailabilityException.date).all()
+    return render_template('admin/holidays.html', holidays=holidays)
+
+@main.route('/admin/holidays/delete/<int:holiday_id>', methods=['POST'])
+@role_required('Admin')
+def admin_delete_holiday(holiday_id):
+    holiday = AvailabilityException.query.filter_by(id=holiday_id, doctor_id=None).first_or_404()
+    db.session.delete(holiday)
     db.session.commit()
-    flash('Appointment approved successfully.', 'success')
-    return redirect(url_for('admin_appointments'))
+    flash('Holiday removed.', 'success')
+    return redirect(url_for('main.admin_holidays'))
 
-@app.route('/admin/appointment/cancel/<int:appointment_id>', methods=['POST'])
+@main.route('/admin/appointment/approve/<int:appointment_id>', methods=['POST'])
+@role_required('Admin')
+def admin_approve_appointment(appointment_id):
+    result, status = bulk_set_status('Booked', ids=[appointment_id])[appointment_id]
+    if result == 'not_found':
+        abort(404)
+    if result == 'updated':
+        flash('Appointment approved successfully.', 'success')
+    else:
+        flash(f'Only pending appointments can be approved; this one is {status}.', 'danger')
+    return redirect(url_for('main.admin_appointments'))
+
+@main.route('/admin/appointment/cancel/<int:appointment_id>', methods=['POST'])
 @role_required('Admin')
 def admin_cancel_appointment(appointment_id):
-    appointment = Appointment.query.get_or_404(appointment_id)
-    appointment.status = 'Cancelled'
-    db.session.commit()
-    flash('Appointment cancelled successfully.', 'info')
-    return redirect(url_for('admin_appointments'))
+    result, status = cancel_appointment(appointment_id)
+    if result == 'not_found':
+        abort(404)
+    if result == 'updated':
+        flash('Appointment cancelled successfully.', 'info')
+    else:
+        flash(f'Only pending or booked appointments can be cancelled; this one is {status}.', 'danger')
+    return redirect(url_for('main.admin_appointments'))
 
-@app.route('/doctor/dashboard')
+@main.route('/doctor/dashboard')
 @role_required('Doctor')
 def doctor_dashboard():
-    doctor = User.query.get(session['user_id'])
+    doctor = get_current_user()
     
     today = date.today()
     week_later = today + timedelta(days=7)
@@ -297,32 +564,38 @@ def doctor_dashboard():
         Appointment.status == 'Booked'  # Only show approved appointments to doctors
     ).order_by(Appointment.date, Appointment.time).all()
     
-    patients = db.session.query(User).join(
-        Appointment, User.id == Appointment.patient_id
-    ).filter(
-        Appointment.doctor_id == doctor.id
-    ).distinct().all()
+    patients = DoctorPatient.query.options(joinedload(DoctorPatient.patient)).filter(
+        DoctorPatient.doctor_id == doctor.id
+    ).order_by(DoctorPatient.last_visit.desc().nullslast(), DoctorPatient.patient_id).paginate(
+        page=request.args.get('page', 1, type=int),
+        per_page=current_app.config['PATIENTS_PER_PAGE'],
+        error_out=False
+    )
     
     return render_template('doctor/dashboard.html',
                          doctor=doctor,
                          upcoming_appointments=upcoming_appointments,
                          patients=patients)
 
-@app.route('/doctor/appointments')
+@main.route('/doctor/appointments')
 @role_required('Doctor')
+@conditional(Appointment, User)
 def doctor_appointments():
-    doctor = User.query.get(session['user_id'])
-    appointments = Appointment.query.filter_by(doctor_id=doctor.id).order_by(Appointment.date.desc(), Appointment.time.desc()).all()
+    appointments = Appointment.query.filter_by(doctor_id=session['user_id']).order_by(Appointment.date.desc(), Appointment.time.desc()).all()
     return render_template('doctor/appointments.html', appointments=appointments)
 
-@app.route('/doctor/appointment/complete/<int:appointment_id>', methods=['GET', 'POST'])
+@main.route('/doctor/appointment/complete/<int:appointment_id>', methods=['GET', 'POST'])
 @role_required('Doctor')
 def doctor_complete_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     
     if appointment.doctor_id != session['user_id']:
         flash('Unauthorized access.', 'danger')
-        return redirect(url_for('doctor_dashboard'))
+        return redirect(url_for('main.doctor_dashboard'))
+    
+    if appointment.status not in TRANSITIONS['Completed']:
+        flash(f'Only booked appointments can be completed; this one is {appointment.status}.', 'danger')
+        return redirect(url_for('main.doctor_appointments'))
     
     if request.method == 'POST':
         diagnosis = request.form.get('diagnosis')
@@ -339,89 +612,163 @@ def doctor_complete_appointment(appointment_id):
         )
         
         db.session.add(treatment)
-        db.session.commit()
+        status_changed([appointment.id], 'Completed')
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Completed by a concurrent request that already saved a treatment.
+            db.session.rollback()
+            flash('This appointment has already been completed.', 'danger')
+            return redirect(url_for('main.doctor_appointments'))
         
         flash('Appointment completed and treatment recorded.', 'success')
-        return redirect(url_for('doctor_appointments'))
+        return redirect(url_for('main.doctor_appointments'))
     
     return render_template('doctor/complete_appointment.html', appointment=appointment)
 
-@app.route('/doctor/appointment/cancel/<int:appointment_id>', methods=['POST'])
+@main.route('/doctor/appointment/cancel/<int:appointment_id>', methods=['POST'])
 @role_required('Doctor')
 def doctor_cancel_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     
     if appointment.doctor_id != session['user_id']:
         flash('Unauthorized access.', 'danger')
-        return redirect(url_for('doctor_dashboard'))
+        return redirect(url_for('main.doctor_dashboard'))
     
-    appointment.status = 'Cancelled'
-    db.session.commit()
-    
-    flash('Appointment cancelled.', 'info')
-    return redirect(url_for('doctor_appointments'))
+    result, status = cancel_appointment(appointment.id)
+    if result == 'updated':
+        flash('Appointment cancelled.', 'info')
+    else:
+        flash(f'Only pending or booked appointments can be cancelled; this one is {status}.', 'danger')
+    return redirect(url_for('main.doctor_appointments'))
 
-@app.route('/doctor/patient/<int:patient_id>')
+@main.route('/doctor/patient/<int:patient_id>')
 @role_required('Doctor')
 def doctor_patient_history(patient_id):
     patient = User.query.get_or_404(patient_id)
     
-    appointments = Appointment.query.filter_by(
-        patient_id=patient_id,
-        doctor_id=session['user_id'],
-        status='Completed'
-    ).order_by(Appointment.date.desc()).all()
+    doctor_id = session['user_id']
+    include_archived = request.args.get('archived', type=int) == 1
+    appointments = archive.history(
+        lambda model: [model.patient_id == patient_id, model.doctor_id == doctor_id, model.status == 'Completed'],
+        include_archived=include_archived,
+        page=request.args.get('page', 1, type=int)
+    )
     
-    return render_template('doctor/patient_history.html', patient=patient, appointments=appointments)
+    return render_template('doctor/patient_history.html', patient=patient, appointments=appointments,
+                         include_archived=include_archived)
 
-@app.route('/doctor/availability', methods=['GET', 'POST'])
+@main.route('/doctor/availability', methods=['GET', 'POST'])
 @role_required('Doctor')
 def doctor_availability():
-    doctor = User.query.get(session['user_id'])
+    doctor_id = session['user_id']
     
     if request.method == 'POST':
-        date_str = request.form.get('date')
-        start_time_str = request.form.get('start_time')
-        end_time_str = request.form.get('end_time')
+        kind = request.form.get('kind', 'date')
+        try:
+            start_time_obj = parse_time_field('start_time', required=kind != 'time_off')
+            end_time_obj = parse_time_field('end_time', required=kind != 'time_off')
+            if kind == 'rule':
+                entry = AvailabilityRule(
+                    doctor_id=doctor_id,
+                    weekdays=weekday_mask(request.form.getlist('weekdays', type=int)),
+                    start_time=start_time_obj,
+                    end_time=end_time_obj,
+                    valid_from=parse_date_field('valid_from'),
+                    valid_until=parse_date_field('valid_until')
+                )
+                if not entry.weekdays:
+                    raise ValueError('Choose at least one weekday.')
+            elif kind == 'time_off':
+                if (start_time_obj is None) != (end_time_obj is None):
+                    raise ValueError('Give both a start and an end time, or neither for the whole day.')
+                entry = AvailabilityException(
+                    doctor_id=doctor_id,
+                    date=parse_date_field('date', required=True),
+                    start_time=start_time_obj,
+                    end_time=end_time_obj,
+                    reason=request.form.get('reason') or None
+                )
+            else:
+                entry = DoctorAvailability(
+                    doctor_id=doctor_id,
+                    date=parse_date_field('date', required=True),
+                    start_time=start_time_obj,
+                    end_time=end_time_obj
+                )
+            if start_time_obj and end_time_obj and end_time_obj <= start_time_obj:
+                raise ValueError('End time must be after start time.')
+        except ValueError as exc:
+            flash(str(exc), 'danger')
+            return redirect(url_for('main.doctor_availability'))
         
-        availability_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        start_time_obj = datetime.strptime(start_time_str, '%H:%M').time()
-        end_time_obj = datetime.strptime(end_time_str, '%H:%M').time()
-        
-        availability = DoctorAvailability(
-            doctor_id=doctor.id,
-            date=availability_date,
-            start_time=start_time_obj,
-            end_time=end_time_obj
-        )
-        
-        db.session.add(availability)
+        db.session.add(entry)
         db.session.commit()
         
-        flash('Availability added successfully.', 'success')
-        return redirect(url_for('doctor_availability'))
-    
-    today = date.today()
-    week_later = today + timedelta(days=7)
+        flash('Availability updated successfully.', 'success')
+        return redirect(url_for('main.doctor_availability'))
     
-    availabilities = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == doctor.id,
-        DoctorAvailability.date >= today,
-        DoctorAvailability.date <= week_later
-    ).order_by(DoctorAvailability.date).all()
+    start_date, end_date = booking_window()
+    schedule = [
+        (day, [(as_time(start), as_time(end)) for start, end in intervals])
+        for _, day, intervals in expand(start_date, end_date, [doctor_id])
+    ]
+    rules = AvailabilityRule.query.filter_by(doctor_id=doctor_id).order_by(AvailabilityRule.start_time).all()
+    time_off = AvailabilityException.query.filter(
+        AvailabilityException.doctor_id == doctor_id,
+        AvailabilityException.date >= start_date
+    ).order_by(AvailabilityException.date).all()
     
-    return render_template('doctor/availability.html', availabilities=availabilities)
+    return render_template('doctor/availability.html',
+                         schedule=schedule,
+                         rules=rules,
+                         time_off=time_off,
+                         weekdays=WEEKDAYS,
+                         mask_weekdays=mask_weekdays)
+
+@main.route('/doctor/availability/rule/delete/<int:rule_id>', methods=['POST'])
+@role_required('Doctor')
+def doctor_delete_rule(rule_id):
+    rule = AvailabilityRule.query.filter_by(id=rule_id, doctor_id=session['user_id']).first_or_404()
+    db.session.delete(rule)
+    db.session.commit()
+    flash('Weekly hours removed.', 'success')
+    return redirect(url_for('main.doctor_availability'))
 
-@app.route('/patient/dashboard')
+@main.route('/doctor/availability/time-off/delete/<int:exception_id>', methods=['POST'])
+@role_required('Doctor')
+def doctor_delete_time_off(exception_id):
+    exception = AvailabilityException.query.filter_by(id=exception_id, doctor_id=session['user_id']).first_or_404()
+    db.session.delete(exception)
+    db.session.commit()
+    flash('Time off removed.', 'success')
+    return redirect(url_for('main.doctor_availability'))
+
+@main.route('/patient/dashboard')
 @role_required('Patient')
 def patient_dashboard():
-    patient = User.query.get(session['user_id'])
-    departments = Department.query.all()
+    patient = get_current_user()
     
     today = date.today()
     week_later = today + timedelta(days=7)
     
-    available_doctors = User.query.filter_by(role='Doctor', is_active=True).all()
+    department_cards = fragment(
+        'patient/department_cards', ('departments',),
+        lambda: render_template('patient/_department_cards.html', departments=Department.query.all())
+    )
+    
+    def render_available_doctors():
+        available_doctors = User.query.options(joinedload(User.department)).filter(
+            User.role == 'Doctor',
+            User.is_active == True,
+            User.id.in_(available_doctor_ids(today, week_later))
+        ).order_by(User.name).limit(6).all()
+        return render_template('patient/_available_doctors.html', available_doctors=available_doctors)
+    
+    available_doctors = fragment(
+        'patient/available_doctors', ('doctors', 'departments', 'availability'),
+        render_available_doctors, today=today
+    )
     
     upcoming_appointments = Appointment.query.filter(
         Appointment.patient_id == patient.id,
@@ -431,131 +778,144 @@ def patient_dashboard():
     
     return render_template('patient/dashboard.html',
                          patient=patient,
-                         departments=departments,
+                         department_cards=department_cards,
                          available_doctors=available_doctors,
                          upcoming_appointments=upcoming_appointments)
 
-@app.route('/patient/doctors')
+@main.route('/patient/doctors')
 @role_required('Patient')
 def patient_doctors():
     search_query = request.args.get('search', '')
     department_id = request.args.get('department_id', '')
     
-    query = User.query.filter_by(role='Doctor', is_active=True)
-    
-    if search_query:
-        query = query.filter(User.name.ilike(f'%{search_query}%'))
-    
-    if department_id:
-        query = query.filter_by(department_id=department_id)
+    def render_doctor_list():
+        filters = [User.role == 'Doctor', User.is_active == True]
+        if department_id:
+            filters.append(User.department_id == department_id)
+        
+        if search_query:
+            doctors = search_users(
+                search_query,
+                fields=('name',),
+                filters=filters,
+                page=request.args.get('page', 1, type=int)
+            )
+        else:
+            doctors = User.query.options(joinedload(User.department)).filter(*filters).all()
+        return render_template('patient/_doctor_list.html', doctors=doctors)
     
-    doctors = query.all()
-    departments = Department.query.all()
+    doctor_list = fragment('patient/doctor_list', ('doctors', 'departments'), render_doctor_list,
+                           args=request.args.to_dict())
+    department_options = fragment(
+        'patient/department_options', ('departments',),
+        lambda: render_template('patient/_department_options.html', departments=Department.query.all()),
+        department_id=department_id
+    )
     
-    return render_template('patient/doctors.html', doctors=doctors, departments=departments)
+    return render_template('patient/doctors.html', doctor_list=doctor_list, department_options=department_options)
 
-@app.route('/patient/book/<int:doctor_id>', methods=['GET', 'POST'])
+@main.route('/patient/book/<int:doctor_id>', methods=['GET', 'POST'])
 @role_required('Patient')
 def patient_book_appointment(doctor_id):
     doctor = User.query.get_or_404(doctor_id)
     
     if request.method == 'POST':
-        date_str = request.form.get('date')
-        time_str = request.form.get('time')
         reason = request.form.get('reason')
+        slot = request.form.get('slot')
         
-        appointment_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        appointment_time = datetime.strptime(time_str, '%H:%M').time()
-        
-        availability = DoctorAvailability.query.filter(
-            DoctorAvailability.doctor_id == doctor_id,
-            DoctorAvailability.date == appointment_date,
-            DoctorAvailability.start_time <= appointment_time,
-            DoctorAvailability.end_time >= appointment_time,
-            DoctorAvailability.is_available == True
-        ).first()
+        try:
+            if slot:
+                slot_start = datetime.strptime(slot, '%Y-%m-%d %H:%M')
+                appointment_date, appointment_time = slot_start.date(), slot_start.time()
+            else:
+                appointment_date = datetime.strptime(request.form.get('date', ''), '%Y-%m-%d').date()
+                appointment_time = datetime.strptime(request.form.get('time', ''), '%H:%M').time()
+        except ValueError:
+            flash('Please choose an available time slot.', 'danger')
+            return redirect(url_for('main.patient_book_appointment', doctor_id=doctor_id))
         
-        if not availability:
-            flash('Doctor is not available at this time. Please choose a time within the available slots.', 'danger')
-            return redirect(url_for('patient_book_appointment', doctor_id=doctor_id))
-        
-        existing = Appointment.query.filter_by(
-            doctor_id=doctor_id,
-            date=appointment_date,
-            time=appointment_time,
-            status='Booked'
-        ).first()
-        
-        if existing:
-            flash('This time slot is already booked. Please choose another time.', 'danger')
-            return redirect(url_for('patient_book_appointment', doctor_id=doctor_id))
-        
-        appointment = Appointment(
-            patient_id=session['user_id'],
-            doctor_id=doctor_id,
-            date=appointment_date,
-            time=appointment_time,
-            reason=reason,
-            status='Pending'
-        )
-        
-        db.session.add(appointment)
-        db.session.commit()
+        try:
+            book_appointment(
+                patient_id=session['user_id'],
+                doctor_id=doctor_id,
+                appointment_date=appointment_date,
+                appointment_time=appointment_time,
+                reason=reason
+            )
+        except BookingError as exc:
+            flash(exc.message, 'danger')
+            return redirect(url_for('main.patient_book_appointment', doctor_id=doctor_id))
         
         flash('Appointment booked successfully!', 'success')
-        return redirect(url_for('patient_appointments'))
+        return redirect(url_for('main.patient_appointments'))
     
-    today = date.today()
-    week_later = today + timedelta(days=7)
+    start_date, end_date = booking_window()
+    slots = free_slots(doctor_id, start_date, end_date)
+    
+    return render_template('patient/book_appointment.html',
+                         doctor=doctor,
+                         slots=slots,
+                         window_days=current_app.config['BOOKING_WINDOW_DAYS'])
+
+@main.route('/doctors/<int:doctor_id>/slots')
+@login_required
+def doctor_free_slots(doctor_id):
+    User.query.filter_by(id=doctor_id, role='Doctor').first_or_404()
     
-    availabilities = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == doctor_id,
-        DoctorAvailability.date >= today,
-        DoctorAvailability.date <= week_later
-    ).order_by(DoctorAvailability.date).all()
+    start_date, end_date = booking_window()
+    start_date = parse_date_arg('start') or start_date
+    end_date = parse_date_arg('end') or end_date
+    if end_date < start_date or (end_date - start_date).days > 366:
+        abort(400)
     
-    return render_template('patient/book_appointment.html', doctor=doctor, availabilities=availabilities)
+    return jsonify(
+        doctor_id=doctor_id,
+        start=start_date.isoformat(),
+        end=end_date.isoformat(),
+        slots=serialize_slots(free_slots(doctor_id, start_date, end_date))
+    )
 
-@app.route('/patient/appointments')
+@main.route('/patient/appointments')
 @role_required('Patient')
 def patient_appointments():
-    patient = User.query.get(session['user_id'])
+    patient_id = session['user_id']
     
     upcoming = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
+        Appointment.patient_id == patient_id,
         Appointment.date >= date.today(),
         Appointment.status.in_(['Booked', 'Pending'])  # Show both approved and pending appointments
     ).order_by(Appointment.date, Appointment.time).all()
     
-    past = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
-        db.or_(
-            Appointment.status == 'Completed',
-            Appointment.status == 'Cancelled'
-        )
-    ).order_by(Appointment.date.desc(), Appointment.time.desc()).all()
+    include_archived = request.args.get('archived', type=int) == 1
+    past = archive.history(
+        lambda model: [model.patient_id == patient_id, model.status.in_(['Completed', 'Cancelled'])],
+        include_archived=include_archived,
+        page=request.args.get('page', 1, type=int)
+    )
     
-    return render_template('patient/appointments.html', upcoming=upcoming, past=past)
+    return render_template('patient/appointments.html', upcoming=upcoming, past=past,
+                         include_archived=include_archived)
 
-@app.route('/patient/appointment/cancel/<int:appointment_id>', methods=['POST'])
+@main.route('/patient/appointment/cancel/<int:appointment_id>', methods=['POST'])
 @role_required('Patient')
 def patient_cancel_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     
     if appointment.patient_id != session['user_id']:
         flash('Unauthorized access.', 'danger')
-        return redirect(url_for('patient_appointments'))
+        return redirect(url_for('main.patient_appointments'))
     
-    appointment.status = 'Cancelled'
-    db.session.commit()
-    
-    flash('Appointment cancelled successfully.', 'info')
-    return redirect(url_for('patient_appointments'))
+    result, status = cancel_appointment(appointment.id)
+    if result == 'updated':
+        flash('Appointment cancelled successfully.', 'info')
+    else:
+        flash(f'Only pending or booked appointments can be cancelled; this one is {status}.', 'danger')
+    return redirect(url_for('main.patient_appointments'))
 
-@app.route('/patient/profile', methods=['GET', 'POST'])
+@main.route('/patient/profile', methods=['GET', 'POST'])
 @role_required('Patient')
 def patient_profile():
-    patient = User.query.get(session['user_id'])
+    patient = get_current_user()
     
     if request.method == 'POST':
         patient.name = request.form.get('name')
@@ -574,44 +934,155 @@ def patient_profile():
         
         db.session.commit()
         flash('Profile updated successfully!', 'success')
-        return redirect(url_for('patient_profile'))
+        return redirect(url_for('main.patient_profile'))
     
     return render_template('patient/profile.html', patient=patient)
 
+@main.cli.command('init-db')
+def init_db_command():
+    init_db()
+    click.echo('Database initialized successfully!')
+
+@main.cli.command('db-upgrade')
+def db_upgrade_command():
+    applied = upgrade(db.engine)
+    for version, description in applied:
+        click.echo(f'Applied migration {version}: {description}')
+    if not applied:
+        click.echo('Database schema is up to date.')
+
+@main.cli.command('sync-replicas')
+@click.option('--interval', type=float, default=0, help='Copy again every INTERVAL seconds; 0 copies once.')
+def sync_replicas_command(interval):
+    while True:
+        try:
+            paths = replicas.sync_sqlite_replicas(db)
+        except RuntimeError as exc:
+            raise click.ClickException(str(exc))
+        for path in paths:
+            click.echo(f'Copied the primary database to {path}.')
+        if not paths:
+            click.echo('No SQLite replicas are configured in SQLALCHEMY_REPLICA_URIS.')
+            break
+        if not interval:
+            break
+        sleep(interval)
+
+@main.cli.command('stats-reconcile')
+def stats_reconcile_command():
+    counters = stats.reconcile()
+    click.echo(f'Reconciled {len(counters)} counters.')
+
+@main.cli.command('archive-appointments')
+@click.option('--before', type=click.DateTime(['%Y-%m-%d']), help='Defaults to ARCHIVE_AFTER_DAYS days ago.')
+@click.option('--batch-size', type=int)
+def archive_appointments_command(before, batch_size):
+    moved = archive.archive_old(before.date() if before else None, batch_size)
+    click.echo(f'Archived {moved} appointments.')
+
+@main.cli.command('report')
+@click.argument('period')
+@click.option('--format', 'fmt', type=click.Choice(['text', 'json']), default='text')
+@click.option('--refresh', is_flag=True, help='Rebuild the report even if it is cached.')
+def report_command(period, fmt, refresh):
+    try:
+        report = reports.get_report(period, refresh=refresh)
+    except reports.ReportError as exc:
+        raise click.ClickException(str(exc))
+    if fmt == 'json':
+        click.echo(json.dumps(report, indent=2))
+    else:
+        click.echo(reports.format_text(report))
+
+@main.cli.command('export-appointments')
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='csv')
+@click.option('--output', type=click.File('w'), default='-', help='File to write, stdout by default.')
+@click.option('--feed', help='Only export appointments created since the last export of this feed.')
+@click.option('--date-from', type=click.DateTime(['%Y-%m-%d']))
+@click.option('--date-to', type=click.DateTime(['%Y-%m-%d']))
+@click.option('--doctor-id', type=int)
+@click.option('--department-id', type=int)
+def export_appointments_command(fmt, output, feed, date_from, date_to, doctor_id, department_id):
+    for chunk in export_appointments(
+        fmt,
+        feed=feed,
+        date_from=date_from.date() if date_from else None,
+        date_to=date_to.date() if date_to else None,
+        doctor_id=doctor_id,
+        department_id=department_id
+    ):
+        output.write(chunk)
+
+@main.cli.command('import-data')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', type=int, default=1000)
+def import_data_command(kind, path, fmt, chunk_size):
+    fmt = fmt or {'jsonl': 'ndjson'}.get(path.rsplit('.', 1)[-1].lower(), path.rsplit('.', 1)[-1].lower())
+    if fmt not in IMPORT_FORMATS:
+        raise click.BadParameter('cannot guess the format from the file name; use --format')
+    
+    failed = None
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        try:
+            report = import_records(kind, stream, fmt, chunk_size=chunk_size)
+        except ImportReadError as exc:
+            report, failed = exc.report, exc
+    
+    for line, reason in report.rejected:
+        click.echo(f'line {line}: {reason}', err=True)
+    click.echo(f'Imported {report.inserted} of {report.total} {kind} records; {len(report.rejected)} rejected.')
+    if failed:
+        raise click.ClickException(f'{failed}: {failed.__cause__}')
+
+@main.cli.command('run-worker')
+@click.option('--threads', type=int, default=2)
+@click.option('--once', is_flag=True, help='Run the jobs that are due now, then exit.')
+def run_worker_command(threads, once):
+    if once:
+        count = jobs.run_pending()
+        click.echo(f'Ran {count} jobs.')
+        return
+    
+    worker = jobs.Worker(current_app._get_current_object(), threads, current_app.config['JOB_POLL_INTERVAL'])
+    worker.start()
+    click.echo(f'Job worker {worker.name} running with {threads} threads.')
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop(timeout=30)
+
 def init_db():
-    with app.app_context():
-        db.create_all()
-        
-        if not User.query.filter_by(email='admin@hospital.com').first():
-            admin = User(
-                name='Admin',
-                email='admin@hospital.com',
-                role='Admin',
-                phone='1234567890'
-            )
-            admin.set_password('admin123')
-            db.session.add(admin)
-        
-        departments_data = [
-            ('Cardiology', 'Heart and cardiovascular system'),
-            ('Neurology', 'Brain and nervous system'),
-            ('Orthopedics', 'Bones and joints'),
-            ('Pediatrics', 'Children healthcare'),
-            ('Dermatology', 'Skin conditions'),
-            ('General Medicine', 'General health issues')
-        ]
-        
-        for dept_name, dept_desc in departments_data:
-            if not Department.query.filter_by(name=dept_name).first():
-                dept = Department(name=dept_name, description=dept_desc)
-                db.session.add(dept)
-        
-        db.session.commit()
-        print("Database initialized successfully!")
+    """Create missing tables, then the admin account and the default departments.
+
+    Runs in the current app context and only adds what is missing, so it is
+    safe to repeat.
+    """
+    upgrade(db.engine)
+    
+    if not db.session.query(User.id).filter_by(email='admin@hospital.com').first():
+        admin = User(
+            name='Admin',
+            email='admin@hospital.com',
+            role='Admin',
+            phone='1234567890'
+        )
+        admin.set_password('admin123')
+        db.session.add(admin)
+    
+    names = [name for name, _ in DEFAULT_DEPARTMENTS]
+    existing = {name for (name,) in db.session.query(Department.name).filter(Department.name.in_(names))}
+    missing = [{'name': name, 'description': description} for name, description in DEFAULT_DEPARTMENTS
+               if name not in existing]
+    if missing:
+        db.session.execute(insert(Department), missing)
+        cache.changed('departments')
+    
+    db.session.commit()
 
 if __name__ == '__main__':
-    init_db()
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     if debug_mode:
         print("WARNING: Running in DEBUG mode. DO NOT USE IN PRODUCTION!")
-    app.run(host='0.0.0.0', port=5000, debug=debug_mode)
+    create_app().run(host='0.0.0.0', port=5000, debug=debug_mode)
@@ -0,0 +1,140 @@
+import logging
+from datetime import date, timedelta
+
+from flask import current_app
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import func, literal, union_all
+from sqlalchemy.orm import joinedload
+
+from jobs import task
+from models import db, User, Appointment, Treatment, SlotReservation, ArchivedAppointment, ArchivedTreatment
+from stats import apply_deltas, deletes_key
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ('Completed', 'Cancelled')
+
+APPOINTMENT_COLUMNS = ('id', 'patient_id', 'doctor_id', 'date', 'time', 'status', 'reason', 'created_at')
+TREATMENT_COLUMNS = ('id', 'appointment_id', 'diagnosis', 'prescription', 'notes', 'created_at')
+
+
+def cutoff_date(days=None):
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    return date.today() - timedelta(days=days)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to ``batch_size`` finished appointments dated before ``cutoff``.
+
+    Appointments are copied with their treatments into the archive tables
+    and deleted from the hot tables in one transaction. Returns how many
+    were moved.
+    """
+    ids = [i for (i,) in db.session.query(Appointment.id).filter(
+        Appointment.date < cutoff,
+        Appointment.status.in_(FINAL_STATUSES)
+    ).order_by(Appointment.id).limit(batch_size)]
+    if not ids:
+        return 0
+
+    conn = db.session.connection()
+    hot, cold = Appointment.__table__, ArchivedAppointment.__table__
+    conn.execute(cold.insert().from_select(
+        APPOINTMENT_COLUMNS,
+        db.select(*[hot.c[name] for name in APPOINTMENT_COLUMNS]).where(hot.c.id.in_(ids))
+    ))
+    hot_t, cold_t = Treatment.__table__, ArchivedTreatment.__table__
+    conn.execute(cold_t.insert().from_select(
+        TREATMENT_COLUMNS,
+        db.select(*[hot_t.c[name] for name in TREATMENT_COLUMNS]).where(hot_t.c.appointment_id.in_(ids))
+    ))
+    conn.execute(hot_t.delete().where(hot_t.c.appointment_id.in_(ids)))
+    conn.execute(SlotReservation.__table__.delete().where(SlotReservation.__table__.c.appointment_id.in_(ids)))
+    conn.execute(hot.delete().where(hot.c.id.in_(ids)))
+    apply_deltas(conn, {deletes_key(Appointment): len(ids)})
+    db.session.commit()
+    return len(ids)
+
+
+def archive_old(cutoff=None, batch_size=None, max_batches=None):
+    """Archive finished appointments older than ``cutoff`` in batches.
+
+    Each batch commits on its own, so concurrent requests only ever wait for
+    one batch. Returns the number of appointments moved.
+    """
+    cutoff = cutoff or cutoff_date()
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    moved = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        moved += count
+        batches += 1
+    if moved:
+        logger.info('Archived %d appointments dated before %s', moved, cutoff)
+    return moved
+
+
+@task(every='ARCHIVE_INTERVAL')
+def archive_appointments():
+    if current_app.config['ARCHIVE_AFTER_DAYS']:
+        archive_old()
+
+
+def _history_keys(model, source, criteria):
+    return db.select(
+        literal(source).label('source'), model.id.label('id'), model.date.label('date'), model.time.label('time')
+    ).where(*criteria(model))
+
+
+class HistoryPagination(Pagination):
+    """A page of appointments from the hot and, optionally, the archive table.
+
+    ``criteria(model)`` returns the filters for either model. Pages are
+    ordered newest first; one query picks the page's ids from both tables
+    and one query per table loads them with their doctor and treatment.
+    """
+
+    def _keys(self):
+        criteria = self._query_args['criteria']
+        selects = [_history_keys(Appointment, 'hot', criteria)]
+        if self._query_args['include_archived']:
+            selects.append(_history_keys(ArchivedAppointment, 'archive', criteria))
+        return union_all(*selects).subquery()
+
+    def _query_items(self):
+        keys = self._keys()
+        rows = db.session.execute(db.select(keys.c.source, keys.c.id).order_by(
+            keys.c.date.desc(), keys.c.time.desc(), keys.c.id.desc()
+        ).limit(self.per_page).offset(self._query_offset)).all()
+
+        loaded = {}
+        for source, model in (('hot', Appointment), ('archive', ArchivedAppointment)):
+            ids = [i for s, i in rows if s == source]
+            if ids:
+                for item in model.query.options(
+                    joinedload(model.doctor).joinedload(User.department), joinedload(model.treatment)
+                ).filter(model.id.in_(ids)):
+                    loaded[source, item.id] = item
+        return [loaded[source, i] for source, i in rows if (source, i) in loaded]
+
+    def _query_count(self):
+        keys = self._keys()
+        return db.session.execute(db.select(func.count()).select_from(keys)).scalar()
+
+
+def history(criteria, include_archived=False, page=1, per_page=None):
+    return HistoryPagination(
+        page=page,
+        per_page=per_page or current_app.config['HISTORY_PER_PAGE'],
+        error_out=False,
+        criteria=criteria,
+        include_archived=include_archived
+    )
+
+
+def init_app(app):
+    app.config.setdefault('ARCHIVE_AFTER_DAYS', 730)
+    app.config.setdefault('ARCHIVE_BATCH_SIZE', 500)
+    app.config.setdefault('ARCHIVE_INTERVAL', 24 * 3600)
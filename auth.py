@@ -0,0 +1,94 @@
+import time as timer
+from functools import wraps
+
+from flask import current_app, flash, g, redirect, session, url_for
+
+from models import db, User
+from passwords import hasher
+
+
+def get_current_user():
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = db.session.get(User, user_id) if user_id else None
+    return g.current_user
+
+
+def active_user():
+    """The logged-in user if they still exist and are active.
+
+    Otherwise any session is cleared, so a deactivated account is logged out
+    on its next request.
+    """
+    user = get_current_user()
+    if user and user.is_active:
+        return user
+    if 'user_id' in session:
+        session.clear()
+        g.current_user = None
+    return None
+
+
+def login_redirect():
+    flash('Please log in to access this page.', 'warning')
+    return redirect(url_for('main.login'))
+
+
+def remember_role(user):
+    session['user_role'] = user.role
+    session['role_verified_at'] = int(timer.time())
+
+
+def has_role(role):
+    # Within ROLE_CLAIM_TTL seconds of the last check the role stored in the
+    # signed session cookie is trusted, so hot pages skip the user lookup.
+    ttl = current_app.config['ROLE_CLAIM_TTL']
+    if ttl and session.get('user_role') == role and session.get('role_verified_at', 0) + ttl > timer.time():
+        return True
+    user = get_current_user()
+    if not user or not user.is_active or user.role != role:
+        return False
+    if ttl:
+        remember_role(user)
+    return True
+
+
+def authenticate(email, password):
+    user = User.query.filter_by(email=email).first()
+    if not (user and user.is_active and user.check_password(password)):
+        return None
+    if hasher.needs_rehash(user.password_hash):
+        user.set_password(password)
+        db.session.commit()
+    return user
+
+
+def start_session(user):
+    session['user_id'] = user.id
+    session['user_name'] = user.name
+    remember_role(user)
+
+
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session or not active_user():
+            return login_redirect()
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def role_required(role):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'user_id' not in session:
+                return login_redirect()
+            if not has_role(role):
+                if not active_user():
+                    return login_redirect()
+                flash('You do not have permission to access this page.', 'danger')
+                return redirect(url_for('main.index'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
@@ -0,0 +1,128 @@
+"""Concurrent booking load test for booking.book_appointment.
+
+Usage: python benchmarks/booking_load.py [--threads 32] [--requests 3000]
+
+Many threads race to book a small pool of slots on a file-backed SQLite
+database. The run fails loudly if any (doctor, date, time) slot ends up with
+more than one active appointment or more reservations than appointments.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time as timer
+from collections import Counter
+from datetime import date, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import func
+
+from models import db, User, Appointment, DoctorAvailability, SlotReservation
+from booking import book_appointment, BookingError, ACTIVE_STATUSES
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DEFAULT_SLOT_MINUTES'] = 15
+    db.init_app(app)
+    return app
+
+
+def seed(app, doctors, patients, day):
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            {'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+             'role': 'Doctor' if i <= doctors else 'Patient', 'is_active': True}
+            for i in range(1, doctors + patients + 1)
+        ])
+        db.session.execute(DoctorAvailability.__table__.insert(), [
+            {'doctor_id': d, 'date': day, 'start_time': time(8), 'end_time': time(12), 'is_available': True}
+            for d in range(1, doctors + 1)
+        ])
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--doctors', type=int, default=5)
+    parser.add_argument('--patients', type=int, default=500)
+    args = parser.parse_args()
+
+    day = date.today() + timedelta(days=1)
+    slots = [time(h, m) for h in range(8, 12) for m in (0, 15, 30, 45)]
+    app = make_app(os.path.join(tempfile.mkdtemp(), 'booking.db'))
+    seed(app, args.doctors, args.patients, day)
+
+    outcomes = Counter()
+    latencies = []
+    lock = threading.Lock()
+    per_thread = args.requests // args.threads
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        with app.app_context():
+            for _ in range(per_thread):
+                started = timer.perf_counter()
+                try:
+                    book_appointment(
+                        patient_id=rng.randint(args.doctors + 1, args.doctors + args.patients),
+                        doctor_id=rng.randint(1, args.doctors),
+                        appointment_date=day,
+                        appointment_time=rng.choice(slots)
+                    )
+                    outcome = 'booked'
+                except BookingError as exc:
+                    outcome = type(exc).__name__
+                except Exception as exc:
+                    db.session.rollback()
+                    outcome = f'error: {type(exc).__name__}'
+                elapsed = timer.perf_counter() - started
+                with lock:
+                    outcomes[outcome] += 1
+                    latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    started = timer.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = timer.perf_counter() - started
+
+    with app.app_context():
+        duplicates = db.session.query(
+            Appointment.doctor_id, Appointment.date, Appointment.time, func.count()
+        ).filter(Appointment.status.in_(ACTIVE_STATUSES)).group_by(
+            Appointment.doctor_id, Appointment.date, Appointment.time
+        ).having(func.count() > 1).all()
+        active = Appointment.query.filter(Appointment.status.in_(ACTIVE_STATUSES)).count()
+        reservations = SlotReservation.query.count()
+
+    latencies.sort()
+    total = sum(outcomes.values())
+    print(f'{total} booking attempts from {args.threads} threads in {wall:.2f}s '
+          f'({total / wall:.0f} req/s)')
+    print(f'p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms')
+    for outcome, count in sorted(outcomes.items()):
+        print(f'  {outcome}: {count}')
+    print(f'slots available: {args.doctors * len(slots)}, active appointments: {active}, '
+          f'reservations: {reservations}')
+
+    if duplicates or active != reservations or active > args.doctors * len(slots):
+        print(f'DOUBLE BOOKING DETECTED: {duplicates}')
+        sys.exit(1)
+    print('OK: no double bookings')
+
+
+if __name__ == '__main__':
+    main()
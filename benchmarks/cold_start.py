@@ -0,0 +1,148 @@
+"""Worker cold start and per-process memory.
+
+Usage: python benchmarks/cold_start.py [--runs 5] [--workers 4] [--requests 200]
+
+Cold start: each run is a fresh interpreter that imports app.py, calls
+create_app() and serves its first request, reporting the time taken by each
+step and the resident memory afterwards.
+
+Forked workers: the app is built once, as gunicorn does with preload_app,
+and --workers children are forked from it, each serving --requests
+requests. Private memory is what each worker does not share with the
+parent. It is measured as is, with gc.freeze() before the fork, and with
+the templates also compiled before the fork, which is what
+gunicorn.conf.py does. Needs Linux for /proc/self/smaps_rollup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COLD_START = """
+import json, sys, time as timer
+sys.path.insert(0, %r)
+from benchmarks.cold_start import memory
+
+t0 = timer.perf_counter()
+import app as module
+t1 = timer.perf_counter()
+app = module.create_app()
+t2 = timer.perf_counter()
+created_rss = memory()['rss']
+response = app.test_client().get('/login')
+t3 = timer.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'create_ms': (t2 - t1) * 1000,
+    'first_request_ms': (t3 - t2) * 1000,
+    'created_rss_mb': created_rss,
+    'served_rss_mb': memory()['rss'],
+    'numpy_loaded': 'numpy' in sys.modules,
+}))
+"""
+
+
+def memory():
+    """Resident and private (unshared) memory of this process in MB."""
+    result = {'rss': 0.0, 'private': 0.0}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith(' '))
+    except OSError:
+        import resource
+        result['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return result
+    kb = {name: int(value.split()[0]) for name, value in fields.items() if value.strip().endswith('kB')}
+    result['rss'] = kb.get('Rss', 0) / 1024
+    result['private'] = (kb.get('Private_Clean', 0) + kb.get('Private_Dirty', 0)) / 1024
+    return result
+
+
+def cold_start(runs, env):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', COLD_START % ROOT], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    print(f'cold start (median of {runs} runs)')
+    for key in ('import_ms', 'create_ms', 'first_request_ms', 'created_rss_mb', 'served_rss_mb'):
+        print(f'  {key:<18} {statistics.median(s[key] for s in samples):8.1f}')
+    print(f'  numpy loaded       {any(s["numpy_loaded"] for s in samples)}')
+
+
+def forked_workers(app, workers, requests, freeze, label):
+    import gc
+
+    gc.collect()
+    if freeze:
+        gc.freeze()
+    read_fd, write_fd = os.pipe()
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            client = app.test_client()
+            client.post('/login', data={'email': 'admin@hospital.com', 'password': 'admin123'})
+            for i in range(requests):
+                client.get(('/admin/dashboard', '/admin/doctors', '/admin/appointments', '/login')[i % 4])
+            gc.collect()
+            os.write(write_fd, (json.dumps(memory()) + '\n').encode())
+            os._exit(0)
+        children.append(pid)
+    os.close(write_fd)
+    for pid in children:
+        os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as f:
+        results = [json.loads(line) for line in f]
+    if freeze:
+        gc.unfreeze()
+    private = [r['private'] for r in results]
+    print(f'  {label:<22} private per worker {statistics.mean(private):6.1f} MB '
+          f'(max {max(private):.1f}), rss {statistics.mean(r["rss"] for r in results):6.1f} MB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(tmp, "cold_start.db")}')
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    os.environ.setdefault('JOB_WORKERS', '0')
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+    os.environ.setdefault('HOSPITAL_WTF_CSRF_ENABLED', 'false')
+
+    from app import create_app, init_db
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+
+    cold_start(args.runs, dict(os.environ))
+    if not hasattr(os, 'fork') or not os.path.exists('/proc/self/smaps_rollup'):
+        print('forked workers: skipped, needs Linux')
+        return
+    print(f'forked workers ({args.workers} workers, {args.requests} requests each)')
+    with app.app_context():
+        from models import db
+        db.engine.dispose()
+    forked_workers(app, args.workers, args.requests, False, 'plain fork')
+    forked_workers(app, args.workers, args.requests, True, 'gc.freeze')
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    forked_workers(app, args.workers, args.requests, True, 'gc.freeze + templates')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Read/write throughput with N concurrent worker processes per database configuration.
+
+Usage: python benchmarks/db_throughput.py [--workers 1 4 8] [--seconds 5] [--url URL]
+
+Each worker process opens its own engine, like a WSGI worker would, and
+runs a mix of indexed reads and single-row write transactions against the
+same database. Without --url two SQLite configurations are compared on a
+throwaway file: the driver defaults (rollback journal) and the tuned
+SQLITE_PRAGMAS from config.py. With --url the given server database is
+measured using the DB_POOL_* engine options.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time as timer
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+from database import engine_options, listen_sqlite_pragmas
+from models import db, User, Appointment
+
+CONFIG = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+
+
+def make_engine(url, pragmas):
+    engine = create_engine(url, **engine_options(CONFIG, url))
+    listen_sqlite_pragmas(engine, pragmas)
+    return engine
+
+
+def prepare(url, pragmas, doctors=20, patients=2000, appointments=20000):
+    engine = make_engine(url, pragmas)
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    rng = random.Random(1)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+             'role': 'Doctor' if i <= doctors else 'Patient', 'is_active': True}
+            for i in range(1, doctors + patients + 1)
+        ])
+        conn.execute(Appointment.__table__.insert(), [
+            {'doctor_id': rng.randint(1, doctors), 'patient_id': rng.randint(doctors + 1, doctors + patients),
+             'date': date.today() + timedelta(days=rng.randint(-200, 200)), 'time': time(rng.randint(8, 17)),
+             'status': 'Booked', 'created_at': datetime.utcnow()}
+            for _ in range(appointments)
+        ])
+    engine.dispose()
+
+
+def worker(url, pragmas, seconds, write_ratio, seed, results):
+    engine = make_engine(url, pragmas)
+    rng = random.Random(seed)
+    table = Appointment.__table__
+    reads = writes = errors = 0
+    deadline = timer.perf_counter() + seconds
+    while timer.perf_counter() < deadline:
+        try:
+            if rng.random() < write_ratio:
+                with engine.begin() as conn:
+                    conn.execute(table.insert().values(
+                        doctor_id=rng.randint(1, 20), patient_id=rng.randint(21, 2020),
+                        date=date.today(), time=time(9), status='Pending', created_at=datetime.utcnow()
+                    ))
+                writes += 1
+            else:
+                with engine.connect() as conn:
+                    conn.execute(select(table).where(
+                        table.c.doctor_id == rng.randint(1, 20),
+                        table.c.date >= date.today()
+                    ).limit(50)).fetchall()
+                reads += 1
+        except OperationalError:
+            errors += 1
+    results.put((reads, writes, errors))
+
+
+def run(url, pragmas, workers, seconds, write_ratio):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(url, pragmas, seconds, write_ratio, n, results))
+        for n in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    totals = [0, 0, 0]
+    for _ in processes:
+        for i, value in enumerate(results.get()):
+            totals[i] += value
+    for p in processes:
+        p.join()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--url', help='server database URL; omit to compare SQLite configurations')
+    args = parser.parse_args()
+
+    if args.url:
+        configurations = [('server', args.url, None)]
+    else:
+        url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'throughput.db')
+        configurations = [
+            ('sqlite default', url, {'journal_mode': 'DELETE'}),
+            ('sqlite tuned', url, Config.SQLITE_PRAGMAS),
+        ]
+
+    print(f'{"configuration":<16} {"workers":>7} {"reads/s":>10} {"writes/s":>10} {"lock errors":>12}')
+    for name, url, pragmas in configurations:
+        for workers in args.workers:
+            prepare(url, pragmas)
+            reads, writes, errors = run(url, pragmas, workers, args.seconds, args.write_ratio)
+            print(f'{name:<16} {workers:>7} {reads / args.seconds:>10.0f} '
+                  f'{writes / args.seconds:>10.0f} {errors:>12}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""Build a synthetic hospital database at a configurable scale.
+
+Usage: python benchmarks/generate_data.py OUTPUT.db [--doctors 50] [--patients 5000]
+       [--years 2] [--per-day 6] [--seed 1]
+
+Doctors are spread over the departments and work weekdays from weekly
+rules, with extra single-day sessions and some time off. Appointments cover
+``--years`` of history plus the next four weeks: past ones are completed
+(with a treatment) or cancelled, future ones pending or booked with their
+slot reservations. Every generated account uses the password "password";
+the admin account from init_db keeps "admin123". The same seed always
+produces the same data.
+"""
+import argparse
+import os
+import random
+import sys
+import time as timer
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'password'
+EXTRA_DEPARTMENTS = [
+    ('Oncology', 'Cancer care'), ('Gastroenterology', 'Digestive system'),
+    ('Ophthalmology', 'Eyes and vision'), ('Psychiatry', 'Mental health'),
+    ('Radiology', 'Medical imaging'), ('Urology', 'Urinary tract'),
+]
+FIRST_NAMES = ['Asha', 'Ben', 'Chen', 'Dara', 'Elif', 'Femi', 'Gita', 'Hugo', 'Ines', 'Jonas',
+               'Kofi', 'Lena', 'Maya', 'Nils', 'Omar', 'Priya', 'Quinn', 'Rosa', 'Sami', 'Tara']
+LAST_NAMES = ['Adams', 'Bose', 'Costa', 'Dubois', 'Eze', 'Fischer', 'Gupta', 'Haddad', 'Ito', 'Jensen',
+              'Kaur', 'Lopez', 'Moreau', 'Nakamura', 'Okafor', 'Petrov', 'Rossi', 'Silva', 'Tan', 'Varga']
+REASONS = ['Follow-up', 'Chest pain', 'Headache', 'Back pain', 'Rash', 'Check-up', 'Fever', 'Knee injury']
+DIAGNOSES = ['Hypertension', 'Migraine', 'Sprain', 'Dermatitis', 'Influenza', 'Healthy', 'Arrhythmia']
+
+
+def chunks(rows, size=5000):
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def generate(args):
+    from app import create_app, init_db
+    from models import (db, User, Department, Appointment, Treatment, SlotReservation,
+                        DoctorAvailability, AvailabilityRule, AvailabilityException)
+    from passwords import hasher
+    from schedule import weekday_mask
+    import roster
+    import stats
+
+    rng = random.Random(args.seed)
+    today = date.today()
+    start = today - timedelta(days=365 * args.years)
+    end = today + timedelta(days=28)
+
+    def insert(model, rows):
+        for chunk in chunks(rows):
+            db.session.execute(model.__table__.insert(), chunk)
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+        if User.query.filter(User.role != 'Admin').count():
+            sys.exit(f'{app.config["SQLALCHEMY_DATABASE_URI"]} already has users; use a new file')
+
+        existing = {d.name for d in Department.query}
+        insert(Department, [{'name': n, 'description': d} for n, d in EXTRA_DEPARTMENTS if n not in existing])
+        departments = [d for (d,) in db.session.query(Department.id)]
+        password_hash = hasher.hash(PASSWORD)
+        created = datetime.combine(start, time(8))
+
+        insert(User, [
+            {'name': f'Dr. {name(rng)}', 'email': f'doctor{i}@example.com', 'password_hash': password_hash,
+             'role': 'Doctor', 'phone': f'555{i:07d}', 'department_id': departments[i % len(departments)],
+             'is_active': True, 'created_at': created}
+            for i in range(1, args.doctors + 1)
+        ])
+        insert(User, [
+            {'name': name(rng), 'email': f'patient{i}@example.com', 'password_hash': password_hash,
+             'role': 'Patient', 'phone': f'777{i:07d}', 'gender': rng.choice(['Male', 'Female']),
+             'date_of_birth': date(rng.randint(1940, 2020), rng.randint(1, 12), rng.randint(1, 28)),
+             'is_active': True, 'created_at': created}
+            for i in range(1, args.patients + 1)
+        ])
+        doctors = [d for (d,) in db.session.query(User.id).filter(User.role == 'Doctor').order_by(User.id)]
+        patients = [p for (p,) in db.session.query(User.id).filter(User.role == 'Patient').order_by(User.id)]
+
+        # Weekday rules plus a Saturday clinic for a third of the doctors, a
+        # few evening sessions and a week of leave per doctor per year.
+        rules, sessions, leave = [], [], []
+        for doctor_id in doctors:
+            begin = rng.choice([8, 9])
+            rules.append({'doctor_id': doctor_id, 'weekdays': weekday_mask(range(5)),
+                          'start_time': time(begin), 'end_time': time(begin + 8)})
+            if doctor_id % 3 == 0:
+                rules.append({'doctor_id': doctor_id, 'weekdays': weekday_mask([5]),
+                              'start_time': time(9), 'end_time': time(13)})
+            for _ in range(args.years * 12):
+                sessions.append({'doctor_id': doctor_id, 'date': start + timedelta(days=rng.randint(0, (end - start).days)),
+                                 'start_time': time(18), 'end_time': time(20), 'is_available': True})
+            for year in range(args.years + 1):
+                first = start + timedelta(days=365 * year + rng.randint(0, 358))
+                leave.extend({'doctor_id': doctor_id, 'date': first + timedelta(days=n), 'reason': 'Leave'}
+                             for n in range(7))
+        insert(AvailabilityRule, rules)
+        insert(DoctorAvailability, sessions)
+        insert(AvailabilityException, leave)
+        db.session.commit()
+
+        appointments = []
+        day = start
+        while day <= end:
+            if day.weekday() < 5:
+                for doctor_id in doctors:
+                    for minutes in rng.sample(range(0, 8 * 60, 30), args.per_day):
+                        at = time(9 + minutes // 60, minutes % 60)
+                        if day < today:
+                            status = 'Completed' if rng.random() < 0.85 else 'Cancelled'
+                        else:
+                            status = rng.choice(['Pending', 'Booked'])
+                        appointments.append({
+                            'patient_id': rng.choice(patients), 'doctor_id': doctor_id,
+                            'date': day, 'time': at, 'status': status, 'reason': rng.choice(REASONS),
+                            'created_at': datetime.combine(day, time(7)) - timedelta(days=rng.randint(1, 30)),
+                        })
+            day += timedelta(days=1)
+        insert(Appointment, appointments)
+        db.session.commit()
+
+        completed = db.session.query(Appointment.id, Appointment.date).filter(Appointment.status == 'Completed').all()
+        insert(Treatment, ({
+            'appointment_id': appointment_id, 'diagnosis': rng.choice(DIAGNOSES),
+            'prescription': 'Rest and fluids', 'notes': 'Review in two weeks',
+            'created_at': datetime.combine(day, time(17)),
+        } for appointment_id, day in completed))
+        active = db.session.query(Appointment.id, Appointment.doctor_id, Appointment.date, Appointment.time).filter(
+            Appointment.status.in_(['Pending', 'Booked'])
+        ).all()
+        insert(SlotReservation, ({
+            'appointment_id': appointment_id, 'doctor_id': doctor_id, 'date': day, 'time': at,
+        } for appointment_id, doctor_id, day, at in active))
+        roster.rebuild(db.session.connection())
+        db.session.commit()
+        stats.reconcile()
+
+        return {
+            'doctors': len(doctors),
+            'patients': len(patients),
+            'appointments': len(appointments),
+            'treatments': Treatment.query.count(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output')
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--per-day', type=int, default=6, help='Appointments per doctor per working day.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        sys.exit(f'{args.output} exists; choose a new file')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.output)
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    os.environ.setdefault('JOB_WORKERS', '0')
+
+    started = timer.perf_counter()
+    counts = generate(args)
+    print(', '.join(f'{n} {what}' for what, n in counts.items()) +
+          f' written to {args.output} in {timer.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
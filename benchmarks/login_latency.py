@@ -0,0 +1,112 @@
+"""Login latency under concurrent load.
+
+Usage: python benchmarks/login_latency.py [--threads 16] [--logins 200] [--workers 0 4]
+
+Threads log in through POST /api/v1/session while a second group of threads
+keeps requesting a cheap page. The run is repeated for every value given to
+--workers (PASSWORD_HASH_WORKERS) and reports p50/p99 latency for both
+kinds of request, showing how much a login burst slows everything else down.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time as timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP = tempfile.mkdtemp()
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{os.path.join(TMP, "login.db")}')
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+from app import create_app
+from migrations import upgrade
+from models import db, User
+from passwords import hasher
+
+app = create_app()
+PASSWORD = 'correct horse battery staple'
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def seed(users):
+    with app.app_context():
+        upgrade(db.engine)
+        if User.query.count() >= users:
+            return
+        db.session.execute(User.__table__.insert(), [
+            {'name': f'Patient {i}', 'email': f'patient{i}@example.com', 'password_hash': h,
+             'role': 'Patient', 'is_active': True}
+            for i, h in enumerate(hasher.hash_many([PASSWORD] * users))
+        ])
+        db.session.commit()
+
+
+def run(workers, threads, logins, users):
+    hasher.shutdown()
+    hasher.configure(hasher.method, hasher.salt_length, workers)
+    login_times, page_times = [], []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def login(n):
+        client = app.test_client()
+        for i in range(n, logins, threads):
+            started = timer.perf_counter()
+            response = client.post('/api/v1/session', json={
+                'email': f'patient{i % users}@example.com', 'password': PASSWORD
+            })
+            elapsed = timer.perf_counter() - started
+            assert response.status_code == 200, response.status_code
+            with lock:
+                login_times.append(elapsed)
+
+    def browse():
+        client = app.test_client()
+        while not done.is_set():
+            started = timer.perf_counter()
+            client.get('/login')
+            with lock:
+                page_times.append(timer.perf_counter() - started)
+
+    browsers = [threading.Thread(target=browse) for _ in range(4)]
+    loggers = [threading.Thread(target=login, args=(n,)) for n in range(threads)]
+    started = timer.perf_counter()
+    for t in browsers + loggers:
+        t.start()
+    for t in loggers:
+        t.join()
+    done.set()
+    for t in browsers:
+        t.join()
+    elapsed = timer.perf_counter() - started
+
+    print(f'workers={workers:<3} logins/s={len(login_times) / elapsed:7.1f}  '
+          f'login p50={percentile(login_times, 50) * 1000:7.1f}ms p99={percentile(login_times, 99) * 1000:7.1f}ms  '
+          f'page p50={percentile(page_times, 50) * 1000:6.1f}ms p99={percentile(page_times, 99) * 1000:6.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, min(4, os.cpu_count() or 1)])
+    args = parser.parse_args()
+
+    seed(args.users)
+    print(f'method={hasher.method} cpus={os.cpu_count()}')
+    for workers in args.workers:
+        run(workers, args.threads, args.logins, args.users)
+    hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
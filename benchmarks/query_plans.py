@@ -0,0 +1,109 @@
+"""Show SQLite query plans for the hot query shapes before and after migration 1.
+
+Usage: python benchmarks/query_plans.py [--patients N] [--appointments N]
+
+A throwaway database is built from the current models with the migration-1
+indexes dropped (the pre-migration schema), seeded with synthetic rows, and
+each hot query is explained and timed. The migration is then applied with
+``migrations.upgrade`` and the same queries are run again.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time as timer
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+from models import db, User, Appointment, DoctorAvailability
+from migrations import upgrade
+
+QUERIES = {
+    'doctor schedule': (
+        "SELECT * FROM appointments WHERE doctor_id = :doctor AND date = :day AND status = 'Booked'"
+    ),
+    'patient upcoming': (
+        "SELECT * FROM appointments WHERE patient_id = :patient AND status IN ('Booked', 'Pending') "
+        "AND date >= :day ORDER BY date, time"
+    ),
+    'doctor availability': (
+        "SELECT * FROM doctor_availability WHERE doctor_id = :doctor AND date BETWEEN :day AND :week"
+    ),
+    'active doctors': "SELECT * FROM users WHERE role = 'Doctor' AND is_active = 1",
+    'recent appointments': "SELECT * FROM appointments ORDER BY created_at DESC LIMIT 10",
+}
+
+
+def seed(engine, doctors, patients, appointments):
+    rng = random.Random(42)
+    start = date.today() - timedelta(days=365)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+             'role': 'Doctor' if i <= doctors else 'Patient', 'is_active': True,
+             'created_at': datetime.utcnow()}
+            for i in range(1, doctors + patients + 1)
+        ])
+        conn.execute(DoctorAvailability.__table__.insert(), [
+            {'doctor_id': d, 'date': start + timedelta(days=n), 'start_time': time(9),
+             'end_time': time(17), 'is_available': True}
+            for d in range(1, doctors + 1) for n in range(0, 400, 2)
+        ])
+        conn.execute(Appointment.__table__.insert(), [
+            {'doctor_id': rng.randint(1, doctors),
+             'patient_id': rng.randint(doctors + 1, doctors + patients),
+             'date': start + timedelta(days=rng.randint(0, 400)),
+             'time': time(rng.randint(9, 16), rng.choice([0, 30])),
+             'status': rng.choice(['Pending', 'Booked', 'Completed', 'Cancelled']),
+             'created_at': datetime.utcnow() - timedelta(minutes=rng.randint(0, 500000))}
+            for _ in range(appointments)
+        ])
+
+
+def report(engine, label, params):
+    print(f'\n== {label} ==')
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            plan = conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params).fetchall()
+            started = timer.perf_counter()
+            for _ in range(20):
+                conn.execute(text(sql), params).fetchall()
+            elapsed = (timer.perf_counter() - started) / 20 * 1000
+            print(f'{name:<22} {elapsed:8.3f} ms  ' + ' | '.join(row[-1] for row in plan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--appointments', type=int, default=200000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'plans.db')
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in (User.__table__, Appointment.__table__, DoctorAvailability.__table__):
+            for index in table.indexes:
+                index.drop(bind=conn)
+
+    seed(engine, args.doctors, args.patients, args.appointments)
+    with engine.begin() as conn:
+        conn.execute(text('ANALYZE'))
+
+    params = {'doctor': 7, 'patient': args.doctors + 11, 'day': date.today(),
+              'week': date.today() + timedelta(days=7)}
+    report(engine, 'before', params)
+    for version, description in upgrade(engine):
+        print(f'\nApplied migration {version}: {description}')
+    with engine.begin() as conn:
+        conn.execute(text('ANALYZE'))
+    report(engine, 'after', params)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""Benchmark the key routes and compare them with a stored baseline.
+
+Usage: python benchmarks/run_benchmarks.py DATABASE.db [--requests 200] [--threads 8]
+       [--mode client http] [--baseline benchmarks/baseline.json] [--save-baseline]
+
+DATABASE.db should come from benchmarks/generate_data.py and is only read
+from, apart from the rows that logging in writes. Every scenario runs
+through the Flask test client (one thread, no network) and through a
+threaded HTTP server driven by --threads concurrent keep-alive
+connections. Throughput and p50/p99 latency are printed and written to
+--output; with --baseline, any scenario whose p99 grew or whose throughput
+fell by more than --tolerance is reported and the exit status is 1.
+Baselines are machine specific, so record one with --save-baseline on the
+machine that runs the comparison.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time as timer
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = 'password'
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def summarize(latencies, elapsed):
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def scenarios(app):
+    """Return ``{name: (login_email, make_request)}``.
+
+    ``make_request(rng)`` gives ``(method, path, form)`` for one request.
+    """
+    from models import db, User, Appointment
+
+    with app.app_context():
+        doctor = User.query.filter_by(email='doctor1@example.com').first()
+        if doctor is None:
+            sys.exit('No generated data found; run benchmarks/generate_data.py first')
+        doctors = [d for (d,) in db.session.query(User.id).filter(User.role == 'Doctor')]
+        patients = [p for (p,) in db.session.query(Appointment.patient_id).filter(
+            Appointment.doctor_id == doctor.id, Appointment.status == 'Completed'
+        ).distinct().limit(500)]
+        emails = [e for (e,) in db.session.query(User.email).filter(User.role == 'Patient').limit(500)]
+
+    statuses = ['', 'Pending', 'Booked', 'Completed']
+    return {
+        'login': (None, lambda rng: ('POST', '/login', {'email': rng.choice(emails), 'password': PASSWORD})),
+        'patient_dashboard': (emails[0], lambda rng: ('GET', '/patient/dashboard', None)),
+        'patient_book_appointment': (
+            emails[0], lambda rng: ('GET', f'/patient/book/{rng.choice(doctors)}', None)),
+        'admin_appointments': (
+            'admin@hospital.com', lambda rng: ('GET', '/admin/appointments?' + urlencode({'status': rng.choice(statuses)}), None)),
+        'doctor_patient_history': (
+            doctor.email, lambda rng: ('GET', f'/doctor/patient/{rng.choice(patients)}', None)),
+    }
+
+
+def password_for(email):
+    return 'admin123' if email == 'admin@hospital.com' else PASSWORD
+
+
+def run_client(app, login_email, make_request, requests):
+    client = app.test_client()
+    if login_email:
+        client.post('/login', data={'email': login_email, 'password': password_for(login_email)})
+    rng = random.Random(1)
+    latencies = []
+    started = timer.perf_counter()
+    for _ in range(requests):
+        method, path, form = make_request(rng)
+        t = timer.perf_counter()
+        response = client.open(path, method=method, data=form)
+        latencies.append(timer.perf_counter() - t)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status_code}')
+    return summarize(latencies, timer.perf_counter() - started)
+
+
+class HTTPSession:
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, form=None):
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        if response.status >= 400:
+            raise RuntimeError(f'{method} {path} returned {response.status}')
+        return response.status
+
+
+def run_http(port, login_email, make_request, requests, threads):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(n):
+        session = HTTPSession(port)
+        rng = random.Random(n)
+        try:
+            if login_email:
+                session.request('POST', '/login', {'email': login_email, 'password': password_for(login_email)})
+            for _ in range(n, requests, threads):
+                method, path, form = make_request(rng)
+                t = timer.perf_counter()
+                session.request(method, path, form)
+                with lock:
+                    latencies.append(timer.perf_counter() - t)
+        except Exception as exc:
+            errors.append(exc)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = timer.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    if errors:
+        raise errors[0]
+    return summarize(latencies, timer.perf_counter() - started)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, modes in results.items():
+        for mode, result in modes.items():
+            base = baseline.get(name, {}).get(mode)
+            if not base:
+                continue
+            if result['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+                regressions.append(f'{name} [{mode}]: p99 {base["p99_ms"]} -> {result["p99_ms"]} ms')
+            if result['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f'{name} [{mode}]: throughput {base["rps"]} -> {result["rps"]} req/s')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('database')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and mode.')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent connections in http mode.')
+    parser.add_argument('--mode', nargs='+', choices=['client', 'http'], default=['client', 'http'])
+    parser.add_argument('--scenario', nargs='+', help='Only run these scenarios.')
+    parser.add_argument('--output', default=os.path.join(HERE, 'results.json'))
+    parser.add_argument('--baseline', default=os.path.join(HERE, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database)
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    os.environ.setdefault('JOB_WORKERS', '0')
+    os.environ.setdefault('HOSPITAL_WTF_CSRF_ENABLED', 'false')
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from app import create_app
+
+    class KeepAliveHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    app = create_app()
+    selected = scenarios(app)
+    if args.scenario:
+        selected = {name: selected[name] for name in args.scenario}
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {}
+    print(f'{"scenario":<26} {"mode":<7} {"req/s":>8} {"p50 ms":>9} {"p99 ms":>9}')
+    for name, (login_email, make_request) in selected.items():
+        results[name] = {}
+        for mode in args.mode:
+            if mode == 'client':
+                result = run_client(app, login_email, make_request, args.requests)
+            else:
+                result = run_http(server.server_port, login_email, make_request, args.requests, args.threads)
+            results[name][mode] = result
+            print(f'{name:<26} {mode:<7} {result["rps"]:>8} {result["p50_ms"]:>9} {result["p99_ms"]:>9}')
+    server.shutdown()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}; run with --save-baseline to record one.')
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print('REGRESSIONS:')
+        for line in regressions:
+            print('  ' + line)
+        sys.exit(1)
+    print(f'No regressions beyond {args.tolerance:.0%} of the baseline.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Time schedule expansion over long windows for every doctor.
+
+Usage: python benchmarks/schedule_expand.py [--doctors 300] [--days 180]
+
+Each doctor gets a weekday rule, a Saturday rule valid for part of the
+window, a few single-day additions and some time off, plus a handful of
+hospital-wide holidays. The script then times ``schedule.expand`` for all
+doctors and for a single doctor, and compares the stored rows with the
+number of days they expand to.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time as timer
+from datetime import date, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models import db, User, DoctorAvailability, AvailabilityRule, AvailabilityException
+from schedule import expand, weekday_mask
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(doctors, days):
+    rng = random.Random(7)
+    today = date.today()
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {'name': f'Doctor {i}', 'email': f'doctor{i}@example.com', 'password_hash': 'x',
+         'role': 'Doctor', 'is_active': True}
+        for i in range(1, doctors + 1)
+    ])
+    rules = []
+    for d in range(1, doctors + 1):
+        rules.append({'doctor_id': d, 'weekdays': weekday_mask(range(5)),
+                      'start_time': time(rng.choice([8, 9])), 'end_time': time(rng.choice([16, 17]))})
+        rules.append({'doctor_id': d, 'weekdays': weekday_mask([5]), 'start_time': time(9), 'end_time': time(12),
+                      'valid_from': today, 'valid_until': today + timedelta(days=days // 2)})
+    db.session.execute(AvailabilityRule.__table__.insert(), rules)
+    db.session.execute(DoctorAvailability.__table__.insert(), [
+        {'doctor_id': d, 'date': today + timedelta(days=rng.randint(0, days)),
+         'start_time': time(17), 'end_time': time(19), 'is_available': True}
+        for d in range(1, doctors + 1) for _ in range(4)
+    ])
+    db.session.execute(AvailabilityException.__table__.insert(), [
+        {'doctor_id': d, 'date': today + timedelta(days=rng.randint(0, days))}
+        for d in range(1, doctors + 1) for _ in range(6)
+    ] + [
+        {'doctor_id': None, 'date': today + timedelta(days=n), 'reason': 'Holiday'}
+        for n in range(10, days, 45)
+    ])
+    db.session.commit()
+
+
+def timed(label, fn, repeat=5):
+    started = timer.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (timer.perf_counter() - started) / repeat * 1000
+    print(f'{label:<32} {elapsed:9.2f} ms  {result} working days')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int, default=300)
+    parser.add_argument('--days', type=int, default=180)
+    args = parser.parse_args()
+
+    app = make_app(os.path.join(tempfile.mkdtemp(), 'schedule.db'))
+    with app.app_context():
+        seed(args.doctors, args.days)
+        start, end = date.today(), date.today() + timedelta(days=args.days)
+        stored = sum(db.session.query(model).count()
+                     for model in (AvailabilityRule, DoctorAvailability, AvailabilityException))
+        print(f'{stored} stored schedule rows for {args.doctors} doctors over {args.days} days')
+
+        timed('all doctors', lambda: sum(1 for _ in expand(start, end)))
+        timed('one doctor', lambda: sum(1 for _ in expand(start, end, [args.doctors // 2])), repeat=50)
+
+
+if __name__ == '__main__':
+    main()
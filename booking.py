@@ -0,0 +1,207 @@
+import random
+import time as timer
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from events import publish_status
+from jobs import enqueue
+from models import db, User, Appointment, SlotReservation
+from notifications import status_changed
+from schedule import as_time, minutes
+from slots import slot_length, slot_times
+from stats import apply_deltas
+
+ACTIVE_STATUSES = ('Pending', 'Booked')
+
+
+class BookingError(Exception):
+    message = 'This appointment could not be booked.'
+
+
+class DoctorUnavailable(BookingError):
+    message = 'Doctor is not available at this time. Please choose a time within the available slots.'
+
+
+class SlotTaken(BookingError):
+    message = 'This time slot is already booked. Please choose another time.'
+
+
+def is_doctor_available(doctor_id, appointment_date, appointment_time):
+    if datetime.combine(appointment_date, appointment_time) < datetime.now():
+        return False
+    return appointment_time in slot_times(doctor_id, appointment_date)
+
+
+def _is_lock_error(exc):
+    message = str(exc.orig).lower()
+    return 'locked' in message or 'busy' in message or 'deadlock' in message
+
+
+def _claim_slot_if_free(doctor_id, appointment_date, appointment_time, length):
+    """Check that no reservation overlaps ``length`` minutes from the start.
+
+    The unique constraint only catches two bookings of the same start time;
+    after a doctor's slot length changes, slots starting at other times can
+    overlap too, exactly as ``free_slots`` sees them. The doctor's row is
+    locked for the rest of the transaction on databases that support it, so
+    concurrent bookings of one doctor are checked one after the other.
+    """
+    db.session.query(User.id).filter(User.id == doctor_id).with_for_update().first()
+    start = minutes(appointment_time)
+    bounds = []
+    if start - length >= 0:
+        bounds.append(SlotReservation.time > as_time(start - length))
+    if start + length < 24 * 60:
+        bounds.append(SlotReservation.time < as_time(start + length))
+    reservations = db.session.query(SlotReservation.id, Appointment.status).join(
+        Appointment, Appointment.id == SlotReservation.appointment_id
+    ).filter(
+        SlotReservation.doctor_id == doctor_id,
+        SlotReservation.date == appointment_date,
+        *bounds
+    ).all()
+    if any(status != 'Cancelled' for _, status in reservations):
+        return False
+    # Reservations of cancelled appointments (e.g. cancelled before
+    # reservations existed) must not block the slot forever. Completed
+    # appointments keep theirs.
+    if reservations:
+        SlotReservation.query.filter(
+            SlotReservation.id.in_([reservation_id for reservation_id, _ in reservations])
+        ).delete(synchronize_session=False)
+    return True
+
+
+def book_appointment(patient_id, doctor_id, appointment_date, appointment_time, reason=None,
+                     status='Pending', max_attempts=5):
+    """Atomically reserve a slot and create the appointment for it.
+
+    Reservations overlapping the slot are refused by
+    :func:`_claim_slot_if_free`; for two bookings of the same start the
+    unique (doctor_id, date, time) constraint on ``slot_reservations``
+    decides: whichever transaction inserts the reservation first wins and
+    every other one gets an IntegrityError. Conflicts and transient lock
+    errors are retried with jittered backoff.
+    """
+    length = slot_length(doctor_id)
+    for attempt in range(1, max_attempts + 1):
+        if not is_doctor_available(doctor_id, appointment_date, appointment_time):
+            raise DoctorUnavailable()
+        if not _claim_slot_if_free(doctor_id, appointment_date, appointment_time, length):
+            db.session.rollback()
+            raise SlotTaken()
+
+        appointment = Appointment(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            date=appointment_date,
+            time=appointment_time,
+            reason=reason,
+            status=status
+        )
+
+        try:
+            db.session.add(appointment)
+            db.session.flush()
+            db.session.add(SlotReservation(
+                doctor_id=doctor_id,
+                date=appointment_date,
+                time=appointment_time,
+                appointment_id=appointment.id
+            ))
+            enqueue('appointment_created', appointment_id=appointment.id)
+            db.session.commit()
+            return appointment
+        except IntegrityError:
+            # Lost the race; the next attempt re-reads the reservation and
+            # either reports the slot as taken or clears a stale one.
+            db.session.rollback()
+        except OperationalError as exc:
+            db.session.rollback()
+            if attempt == max_attempts or not _is_lock_error(exc):
+                raise
+        timer.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+    raise SlotTaken()
+
+
+# Allowed source statuses for each transition.
+TRANSITIONS = {
+    'Booked': ('Pending',),
+    'Cancelled': ACTIVE_STATUSES,
+    'Completed': ('Booked',),
+}
+
+BULK_ACTIONS = {
+    'approve': 'Booked',
+    'cancel': 'Cancelled',
+}
+
+
+def bulk_set_status(status, ids=None, criteria=None):
+    """Move many appointments to ``status`` in one transaction.
+
+    Appointments are selected by ``ids``, by a list of SQLAlchemy
+    ``criteria`` on ``Appointment``, or both. Only rows currently in one of
+    the allowed source statuses change. Returns ``{appointment_id: (result,
+    status)}`` where result is 'updated', 'skipped' or 'not_found' (ids
+    only). The change is a single set-based UPDATE, so it bypasses the ORM
+    flush hooks and adjusts the dashboard counters explicitly.
+    """
+    if ids is None and not criteria:
+        raise ValueError('bulk_set_status needs ids or criteria')
+
+    allowed = TRANSITIONS[status]
+    target = list(criteria or [])
+    if ids is not None:
+        ids = set(ids)
+        target.append(Appointment.id.in_(ids))
+
+    current = dict(db.session.query(Appointment.id, Appointment.status).filter(*target))
+    eligible = {i for i, old in current.items() if old in allowed}
+
+    if eligible:
+        # Rows changed by another request since the SELECT are left alone;
+        # everything below works from the ids this UPDATE really changed.
+        eligible = set(db.session.scalars(
+            db.update(Appointment)
+            .where(Appointment.id.in_(eligible), Appointment.status.in_(allowed))
+            .values(status=status)
+            .returning(Appointment.id)
+            .execution_options(synchronize_session=False)
+        ))
+    if eligible:
+        if status == 'Cancelled':
+            SlotReservation.query.filter(
+                SlotReservation.appointment_id.in_(eligible)
+            ).delete(synchronize_session=False)
+
+        deltas = Counter()
+        for appointment_id in eligible:
+            deltas['appointments:status:%s' % current[appointment_id]] -= 1
+            deltas['appointments:status:%s' % status] += 1
+        apply_deltas(db.session.connection(), deltas)
+        publish_status(eligible)
+        status_changed(eligible, status)
+    db.session.commit()
+
+    report = {}
+    for appointment_id in sorted(current if ids is None else ids):
+        if appointment_id not in current:
+            report[appointment_id] = ('not_found', None)
+        elif appointment_id in eligible:
+            report[appointment_id] = ('updated', status)
+        else:
+            report[appointment_id] = ('skipped', current[appointment_id])
+    return report
+
+
+def cancel_appointment(appointment_id):
+    """Cancel one active appointment and free its slot.
+
+    Returns ``(result, status)`` as reported by :func:`bulk_set_status`, so
+    a finished appointment is left alone and reported as 'skipped'.
+    """
+    return bulk_set_status('Cancelled', ids=[appointment_id])[appointment_id]
@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time as timer
+from collections import OrderedDict
+
+from flask import current_app, session
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+
+from models import db, User, Department, DoctorAvailability, AvailabilityRule, AvailabilityException
+from replicas import use_primary
+
+# Columns of a doctor that show up in cached fragments. Changes to anything
+# else (password hash, address, ...) leave the doctor fragments alone.
+DOCTOR_FIELDS = ('name', 'email', 'phone', 'role', 'department_id', 'is_active', 'slot_minutes')
+
+
+class MemoryCache:
+    """Per-process LRU cache with a TTL on every entry.
+
+    Tag generations live outside the LRU so that evicting one can never make
+    an outdated entry valid again.
+    """
+
+    def __init__(self, max_entries=1000, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < timer.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, timer.time() + (ttl or self.default_ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def generations(self, tags):
+        with self._lock:
+            return [self._generations.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+
+
+class SQLiteCache:
+    """Cache in a SQLite file shared by every worker process on the host.
+
+    Invalidations made by one worker are seen by all of them, which the
+    memory backend cannot offer. Least recently used entries are evicted
+    once the table grows past ``max_entries``.
+    """
+
+    def __init__(self, path, max_entries=1000, default_ttl=300):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._sets = 0
+        conn = self._connect()
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                     'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_used_at ON cache_entries (used_at)')
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_generations ('
+                     'tag TEXT PRIMARY KEY, generation INTEGER NOT NULL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        now = timer.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires_at, used_at FROM cache_entries WHERE key = ?', (key,)).fetchone()
+        if row is None or row[1] < now:
+            return None
+        # Recording every hit would turn reads into writes; a minute of
+        # resolution is plenty for choosing what to evict.
+        if row[2] + 60 < now:
+            conn.execute('UPDATE cache_entries SET used_at = ? WHERE key = ?', (now, key))
+        return row[0]
+
+    def set(self, key, value, ttl=None):
+        now = timer.time()
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)',
+                     (key, value, now + (ttl or self.default_ttl), now))
+        self._sets += 1
+        if self._sets % 100 == 0:
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM cache_entries WHERE expires_at < ?', (now,))
+        conn.execute('DELETE FROM cache_entries WHERE key IN ('
+                     'SELECT key FROM cache_entries ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache_entries')
+
+    def generations(self, tags):
+        placeholders = ', '.join('?' * len(tags))
+        found = dict(self._connect().execute(
+            f'SELECT tag, generation FROM cache_generations WHERE tag IN ({placeholders})', tuple(tags)
+        ))
+        return [found.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        conn = self._connect()
+        conn.executemany('INSERT INTO cache_generations (tag, generation) VALUES (?, 1) '
+                         'ON CONFLICT (tag) DO UPDATE SET generation = generation + 1', [(tag,) for tag in tags])
+
+
+class NullCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def clear(self):
+        pass
+
+    def generations(self, tags):
+        return [0] * len(tags)
+
+    def bump(self, tags):
+        pass
+
+
+def get_backend():
+    return current_app.extensions['cache']
+
+
+def cache_key(name, tags, generations, params):
+    role = session.get('user_role', 'anonymous')
+    versions = ','.join(f'{tag}={generation}' for tag, generation in zip(tags, generations))
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f'{role}:{name}:{versions}:{digest}'
+
+
+def fragment(name, tags, render, ttl=None, **params):
+    """Return the cached HTML for ``name``, calling ``render`` on a miss.
+
+    The key includes the viewer's role, ``params`` and the current generation
+    of every tag, so bumping a tag makes all fragments that depend on it miss
+    on their next lookup.
+    """
+    backend = get_backend()
+    key = cache_key(name, tags, backend.generations(tags), params)
+    html = backend.get(key)
+    if html is None:
+        # A fragment outlives the request, so never build it from a lagging replica.
+        use_primary()
+        html = str(render())
+        backend.set(key, html, ttl)
+    return Markup(html)
+
+
+def invalidate(*tags):
+    get_backend().bump(tags)
+
+
+def changed(*tags):
+    """Invalidate ``tags`` when the current transaction commits.
+
+    For writes that bypass the unit of work (executemany inserts, set-based
+    updates), which the flush hooks below cannot see.
+    """
+    db.session.info.setdefault('cache_tags', set()).update(tags)
+
+
+def tags_for(obj, changed=True):
+    """Tags affected by ``obj``; ``changed`` is False for a dirty object,
+    whose attribute history decides whether it matters."""
+    if isinstance(obj, Department):
+        return ('departments',)
+    if isinstance(obj, (DoctorAvailability, AvailabilityRule, AvailabilityException)):
+        return ('availability',)
+    if isinstance(obj, User):
+        state = inspect(obj)
+        if obj.role != 'Doctor' and 'Doctor' not in state.attrs.role.history.deleted:
+            return ()
+        if not changed and not any(state.attrs[field].history.has_changes() for field in DOCTOR_FIELDS):
+            return ()
+        return ('doctors',)
+    return ()
+
+
+def _collect_tags(session, flush_context):
+    tags = session.info.setdefault('cache_tags', set())
+    for obj in list(session.new) + list(session.deleted):
+        tags.update(tags_for(obj))
+    for obj in session.dirty:
+        tags.update(tags_for(obj, changed=False))
+
+
+def _invalidate_committed(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        invalidate(*sorted(tags))
+
+
+def _discard_tags(session):
+    session.info.pop('cache_tags', None)
+
+
+BACKENDS = ('memory', 'sqlite', 'null')
+
+
+def init_app(app):
+    app.config.setdefault('CACHE_BACKEND', 'memory')
+    app.config.setdefault('CACHE_MAX_ENTRIES', 1000)
+    app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+    app.config.setdefault('CACHE_PATH', os.path.join(app.instance_path, 'cache.db'))
+
+    name = app.config['CACHE_BACKEND']
+    if name == 'memory':
+        backend = MemoryCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_DEFAULT_TTL'])
+    elif name == 'sqlite':
+        os.makedirs(os.path.dirname(app.config['CACHE_PATH']) or '.', exist_ok=True)
+        backend = SQLiteCache(app.config['CACHE_PATH'], app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_DEFAULT_TTL'])
+    elif name == 'null':
+        backend = NullCache()
+    else:
+        raise ValueError(f'unknown cache backend {name!r}')
+    app.extensions['cache'] = backend
+
+    # Tags are gathered at flush time but only bumped once the transaction
+    # commits, so a rolled back edit never evicts anything and a reader can
+    # not re-cache the old data between the flush and the commit.
+    event.listen(db.session, 'after_flush', _collect_tags)
+    event.listen(db.session, 'after_commit', _invalidate_committed)
+    event.listen(db.session, 'after_rollback', _discard_tags)
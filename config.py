@@ -0,0 +1,117 @@
+import os
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SESSION_SECRET')
+    
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///hospital.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # Applied to every new SQLite connection (see database.py).
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'busy_timeout': env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    }
+    
+    # Read-only requests are spread over these databases (comma-separated
+    # DATABASE_REPLICA_URLS, see replicas.py). A browser that has just written
+    # reads from the primary for REPLICA_STICKY_SECONDS, which should cover
+    # the replicas' lag.
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+    REPLICA_STICKY_SECONDS = env_int('REPLICA_STICKY_SECONDS', 10)
+    
+    # Connection pool for server databases (PostgreSQL, MySQL).
+    DB_POOL_SIZE = env_int('DB_POOL_SIZE', 10)
+    DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 20)
+    DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 30)
+    DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+    
+    # Any method accepted by werkzeug.security.generate_password_hash, e.g.
+    # "scrypt:32768:8:1" or "pbkdf2:sha256:600000". Stored hashes made with
+    # other parameters are upgraded the next time their owner logs in.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SALT_LENGTH = env_int('PASSWORD_SALT_LENGTH', 16)
+    # Worker processes used for hashing; 0 hashes on the request thread.
+    PASSWORD_HASH_WORKERS = env_int('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1))
+    
+    # Rendered page fragments: "memory" (per process), "sqlite" (a file
+    # shared by every worker on the host, see CACHE_PATH) or "null".
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_MAX_ENTRIES = env_int('CACHE_MAX_ENTRIES', 1000)
+    CACHE_DEFAULT_TTL = env_int('CACHE_DEFAULT_TTL', 300)
+    
+    # Background job threads started in each web process; set to 0 when a
+    # separate `flask run-worker` process runs the queue.
+    JOB_WORKERS = env_int('JOB_WORKERS', 2)
+    JOB_POLL_INTERVAL = env_int('JOB_POLL_INTERVAL', 5)
+    REMINDER_HOURS_BEFORE = env_int('REMINDER_HOURS_BEFORE', 24)
+    
+    # Finished appointments older than ARCHIVE_AFTER_DAYS move to the archive
+    # tables once a day (see archive.py); 0 turns archiving off.
+    ARCHIVE_AFTER_DAYS = env_int('ARCHIVE_AFTER_DAYS', 730)
+    ARCHIVE_BATCH_SIZE = env_int('ARCHIVE_BATCH_SIZE', 500)
+    
+    # How long a cached report is reused: REPORT_CACHE_TTL for a period that
+    # includes today, REPORT_CACHE_TTL_CLOSED for one that has ended.
+    REPORT_CACHE_TTL = env_int('REPORT_CACHE_TTL', 600)
+    REPORT_CACHE_TTL_CLOSED = env_int('REPORT_CACHE_TTL_CLOSED', 24 * 3600)
+    
+    # Live appointment updates (see events.py). Each process polls the event
+    # table every EVENTS_POLL_INTERVAL seconds and sends idle streams a
+    # keepalive every EVENTS_HEARTBEAT seconds.
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 1.0))
+    EVENTS_HEARTBEAT = env_int('EVENTS_HEARTBEAT', 15)
+    EVENTS_MAX_SUBSCRIBERS = env_int('EVENTS_MAX_SUBSCRIBERS', 5000)
+    EVENTS_RETENTION_HOURS = env_int('EVENTS_RETENTION_HOURS', 24)
+    
+    # Instrumentation (see metrics.py). SLOW_QUERY_MS = 0 disables slow-query
+    # logging; METRICS_TOKEN, when set, is required as a bearer token on /metrics.
+    SLOW_QUERY_MS = env_int('SLOW_QUERY_MS', 200)
+    N_PLUS_ONE_THRESHOLD = env_int('N_PLUS_ONE_THRESHOLD', 20)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # With several worker processes, set METRICS_DIR (gunicorn.conf.py does)
+    # so each one writes its metrics there and any worker can serve them all.
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5.0))
+
+    # Response caching and compression (see responses.py). Compiled templates
+    # are kept in JINJA_CACHE_DIR (instance/jinja_cache by default). Bodies of
+    # at least COMPRESS_MIN_SIZE bytes are sent brotli- or gzip-compressed.
+    COMPRESS_MIN_SIZE = env_int('COMPRESS_MIN_SIZE', 1024)
+    COMPRESS_LEVEL = env_int('COMPRESS_LEVEL', 6)
+    COMPRESS_BROTLI_QUALITY = env_int('COMPRESS_BROTLI_QUALITY', 4)
+    STATIC_MAX_AGE = env_int('STATIC_MAX_AGE', 365 * 24 * 3600)
+
+    WTF_CSRF_ENABLED = True
+    APPOINTMENTS_PER_PAGE = 50
+    PATIENTS_PER_PAGE = 20
+    HISTORY_PER_PAGE = 20
+    DEFAULT_SLOT_MINUTES = 30
+    BOOKING_WINDOW_DAYS = 14
+    ROLE_CLAIM_TTL = env_int('ROLE_CLAIM_TTL', 0)
+
+
+class DevelopmentConfig(Config):
+    pass
+
+
+class ProductionConfig(Config):
+    # create_app refuses to start without SESSION_SECRET. Session cookies are
+    # only sent over HTTPS unless SESSION_COOKIE_SECURE=false.
+    SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'true').lower() == 'true'
+    # gunicorn runs several workers, and an edit must invalidate the cached
+    # fragments in all of them.
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')
+
+
+# Selected by HOSPITAL_ENV (see create_app in app.py).
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+}
@@ -0,0 +1,58 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from models import db
+
+
+def engine_options(config, uri=None):
+    url = make_url(uri or config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            if value is not None:
+                cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def listen_sqlite_pragmas(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+
+def init_app(app):
+    """Initialise ``db`` for ``app`` with backend-appropriate engine settings.
+
+    Explicit ``SQLALCHEMY_ENGINE_OPTIONS`` always win over the defaults
+    derived from the DB_POOL_* settings.
+    """
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    # Read replicas become the binds replica_0, replica_1, ... and share the
+    # primary's engine options (see replicas.py).
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for i, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()):
+        binds.setdefault(f'replica_{i}', uri)
+    db.init_app(app)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            listen_sqlite_pragmas(engine, app.config.get('SQLITE_PRAGMAS'))
@@ -0,0 +1,289 @@
+import json
+import logging
+import queue
+import threading
+from datetime import datetime, timedelta
+
+from flask import Response, abort, current_app, request
+from sqlalchemy import event, func, inspect
+
+from auth import get_current_user
+from jobs import task
+from models import db, Appointment, AppointmentEvent
+from replicas import use_primary
+
+logger = logging.getLogger(__name__)
+
+# Set when a transaction that published events commits, so the broker in
+# this process delivers them at once instead of at its next poll.
+_wakeup = threading.Event()
+_broker_lock = threading.Lock()
+
+
+def _event_row(appointment, kind):
+    return {
+        'appointment_id': appointment.id,
+        'kind': kind,
+        'status': appointment.status or 'Pending',
+        'doctor_id': appointment.doctor_id,
+        'patient_id': appointment.patient_id,
+        'date': appointment.date,
+        'time': appointment.time,
+    }
+
+
+def _collect_events(session, flush_context, instances):
+    pending = session.info.setdefault('appointment_events', [])
+    for obj in session.new:
+        if isinstance(obj, Appointment):
+            pending.append((obj, 'created'))
+    for obj in session.dirty:
+        if isinstance(obj, Appointment) and inspect(obj).attrs.status.history.has_changes():
+            pending.append((obj, 'status'))
+
+
+def _write_events(session, flush_context):
+    pending = session.info.pop('appointment_events', None)
+    if pending:
+        session.connection().execute(AppointmentEvent.__table__.insert(), [
+            _event_row(obj, kind) for obj, kind in pending
+        ])
+        session.info['events_published'] = True
+
+
+def publish_status(appointment_ids):
+    """Record status events for appointments changed by a set-based UPDATE.
+
+    The ORM flush hooks publish everything else; callers that bypass them
+    call this inside their own transaction, after the UPDATE.
+    """
+    if not appointment_ids:
+        return
+    table = AppointmentEvent.__table__
+    db.session.execute(table.insert().from_select(
+        ['appointment_id', 'kind', 'status', 'doctor_id', 'patient_id', 'date', 'time', 'created_at'],
+        db.select(
+            Appointment.id, db.literal('status'), Appointment.status, Appointment.doctor_id,
+            Appointment.patient_id, Appointment.date, Appointment.time, db.literal(datetime.utcnow())
+        ).where(Appointment.id.in_(appointment_ids))
+    ))
+    db.session.info['events_published'] = True
+
+
+def _notify_broker(session):
+    if session.info.pop('events_published', None):
+        _wakeup.set()
+
+
+def _discard(session):
+    session.info.pop('appointment_events', None)
+    session.info.pop('events_published', None)
+
+
+def serialize(row):
+    return {
+        'id': row.id,
+        'appointment_id': row.appointment_id,
+        'kind': row.kind,
+        'status': row.status,
+        'doctor_id': row.doctor_id,
+        'patient_id': row.patient_id,
+        'date': row.date.isoformat() if row.date else None,
+        'time': row.time.strftime('%H:%M') if row.time else None,
+    }
+
+
+def topics_for(event):
+    return ('all', f'doctor:{event["doctor_id"]}', f'patient:{event["patient_id"]}')
+
+
+def _topic_filter(topic):
+    if topic == 'all':
+        return db.true()
+    kind, _, value = topic.partition(':')
+    column = AppointmentEvent.doctor_id if kind == 'doctor' else AppointmentEvent.patient_id
+    return column == int(value)
+
+
+class Subscriber:
+    __slots__ = ('topics', 'queue')
+
+    def __init__(self, topics):
+        self.topics = topics
+        self.queue = queue.SimpleQueue()
+
+
+class Broker:
+    """Fans new appointment events out to the subscribers in this process.
+
+    One thread polls ``appointment_events`` for rows past the last id it
+    has seen, so events written by other processes arrive too, and hands
+    each event to the queues of the subscribers whose topic matches. Idle
+    subscribers cost a queue and a set entry; no thread or database
+    connection is held for them here.
+    """
+
+    def __init__(self, app, poll_interval=1.0, batch=500):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.batch = batch
+        self.last_id = None
+        self._topics = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return self._count
+
+    def subscribe(self, topics, limit=None):
+        """Register a subscriber, or return None if ``limit`` are already open."""
+        subscriber = Subscriber(tuple(topics))
+        with self._lock:
+            if limit is not None and self._count >= limit:
+                return None
+            for topic in subscriber.topics:
+                self._topics.setdefault(topic, set()).add(subscriber)
+            self._count += 1
+            if self._thread is None:
+                self._start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            for topic in subscriber.topics:
+                members = self._topics.get(topic)
+                if members is not None:
+                    members.discard(subscriber)
+                    if not members:
+                        del self._topics[topic]
+            self._count -= 1
+
+    def publish(self, event):
+        with self._lock:
+            receivers = set()
+            for topic in topics_for(event):
+                receivers.update(self._topics.get(topic, ()))
+        for subscriber in receivers:
+            subscriber.queue.put(event)
+
+    def poll(self):
+        rows = AppointmentEvent.query.filter(AppointmentEvent.id > self.last_id).order_by(
+            AppointmentEvent.id
+        ).limit(self.batch).all()
+        for row in rows:
+            self.publish(serialize(row))
+            self.last_id = row.id
+        return len(rows)
+
+    def _start(self):
+        # Only events committed from now on are delivered live; clients catch
+        # up on older ones with Last-Event-ID.
+        with self.app.app_context():
+            self.last_id = db.session.query(func.coalesce(func.max(AppointmentEvent.id), 0)).scalar()
+            db.session.remove()
+        self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        _wakeup.set()
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                count = 0
+                try:
+                    count = self.poll()
+                except Exception:
+                    logger.exception('Event broker poll failed; retrying')
+                finally:
+                    db.session.remove()
+                if count < self.batch:
+                    _wakeup.wait(self.poll_interval)
+                    _wakeup.clear()
+
+
+def get_broker():
+    app = current_app._get_current_object()
+    broker = app.extensions.get('event_broker')
+    if broker is None:
+        with _broker_lock:
+            broker = app.extensions.get('event_broker')
+            if broker is None:
+                broker = app.extensions['event_broker'] = Broker(app, app.config['EVENTS_POLL_INTERVAL'])
+    return broker
+
+
+def _format(event):
+    return f'id: {event["id"]}\nevent: appointment\ndata: {json.dumps(event)}\n\n'
+
+
+def stream_view():
+    user = get_current_user()
+    if not user or not user.is_active:
+        abort(401)
+    topics = {'Admin': ['all'], 'Doctor': [f'doctor:{user.id}'], 'Patient': [f'patient:{user.id}']}.get(user.role)
+    if not topics:
+        abort(403)
+
+    # The backlog has to line up with what the broker polls from the primary.
+    use_primary()
+    broker = get_broker()
+    subscriber = broker.subscribe(topics, current_app.config['EVENTS_MAX_SUBSCRIBERS'])
+    if subscriber is None:
+        abort(503)
+
+    # Subscribing first means nothing committed from here on is missed;
+    # events already in the backlog are skipped when they arrive again.
+    backlog = []
+    last_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('last_event_id', type=int)
+    if last_id:
+        backlog = [serialize(row) for row in AppointmentEvent.query.filter(
+            AppointmentEvent.id > last_id, db.or_(*[_topic_filter(t) for t in topics])
+        ).order_by(AppointmentEvent.id).limit(current_app.config['EVENTS_REPLAY_LIMIT'])]
+    heartbeat = current_app.config['EVENTS_HEARTBEAT']
+
+    def generate():
+        seen = backlog[-1]['id'] if backlog else 0
+        try:
+            yield 'retry: 5000\n\n'
+            for item in backlog:
+                yield _format(item)
+            while True:
+                try:
+                    item = subscriber.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if item['id'] > seen:
+                    yield _format(item)
+        finally:
+            broker.unsubscribe(subscriber)
+
+    # The generator runs after the request context is gone, so it holds no
+    # session or connection while the client sits idle.
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@task(every=3600)
+def purge_events():
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config['EVENTS_RETENTION_HOURS'])
+    AppointmentEvent.query.filter(AppointmentEvent.created_at < cutoff).delete(synchronize_session=False)
+
+
+def init_app(app):
+    app.config.setdefault('EVENTS_POLL_INTERVAL', 1.0)
+    app.config.setdefault('EVENTS_HEARTBEAT', 15)
+    app.config.setdefault('EVENTS_MAX_SUBSCRIBERS', 5000)
+    app.config.setdefault('EVENTS_REPLAY_LIMIT', 500)
+    app.config.setdefault('EVENTS_RETENTION_HOURS', 24)
+    event.listen(db.session, 'before_flush', _collect_events)
+    event.listen(db.session, 'after_flush', _write_events)
+    event.listen(db.session, 'after_commit', _notify_broker)
+    event.listen(db.session, 'after_rollback', _discard)
+    app.add_url_rule('/events/appointments', 'appointment_events', stream_view)
@@ -0,0 +1,133 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time
+
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import aliased
+
+from models import db, User, Department, Appointment, Treatment, ArchivedAppointment, ArchivedTreatment, ExportWatermark
+from replicas import use_primary
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+COLUMNS = [
+    'appointment_id', 'date', 'time', 'status', 'reason', 'created_at',
+    'patient_id', 'patient_name', 'patient_email',
+    'doctor_id', 'doctor_name', 'department',
+    'diagnosis', 'prescription', 'notes', 'treated_at',
+]
+
+
+def export_statement(date_from=None, date_to=None, doctor_id=None, department_id=None,
+                     after_id=None, upto_id=None):
+    """Appointments with their treatments, from the hot and the archive tables.
+
+    Archived rows keep their ids, so the union is still ordered by id and
+    feed watermarks work across both.
+    """
+    patient = aliased(User)
+    doctor = aliased(User)
+    selects = []
+    for appointment, treatment in ((Appointment, Treatment), (ArchivedAppointment, ArchivedTreatment)):
+        stmt = select(*[column.label(name) for name, column in zip(COLUMNS, (
+            appointment.id, appointment.date, appointment.time, appointment.status,
+            appointment.reason, appointment.created_at,
+            patient.id, patient.name, patient.email,
+            doctor.id, doctor.name, Department.name,
+            treatment.diagnosis, treatment.prescription, treatment.notes, treatment.created_at,
+        ))]).join(patient, patient.id == appointment.patient_id).join(
+            doctor, doctor.id == appointment.doctor_id
+        ).outerjoin(Department, Department.id == doctor.department_id).outerjoin(
+            treatment, treatment.appointment_id == appointment.id
+        )
+
+        if date_from:
+            stmt = stmt.where(appointment.date >= date_from)
+        if date_to:
+            stmt = stmt.where(appointment.date <= date_to)
+        if doctor_id:
+            stmt = stmt.where(appointment.doctor_id == doctor_id)
+        if department_id:
+            stmt = stmt.where(doctor.department_id == department_id)
+        if after_id:
+            stmt = stmt.where(appointment.id > after_id)
+        if upto_id:
+            stmt = stmt.where(appointment.id <= upto_id)
+        selects.append(stmt)
+
+    stmt = union_all(*selects)
+    return stmt.order_by(stmt.selected_columns.appointment_id)
+
+
+def iter_rows(stmt, batch_size=1000):
+    # stream_results asks the driver for a server-side cursor where it has
+    # one, and yield_per keeps only one batch of rows in memory at a time.
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+    for partition in result.partitions():
+        yield partition
+
+
+def _value(value):
+    if isinstance(value, (date, time, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        writer.writerows([[_value(v) for v in row] for row in batch])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_ndjson(batches):
+    for batch in batches:
+        yield ''.join(
+            json.dumps(dict(zip(COLUMNS, map(_value, row))), separators=(',', ':')) + '\n'
+            for row in batch
+        )
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson,
+}
+
+
+def export_appointments(fmt, feed=None, batch_size=1000, **filters):
+    """Yield the export as text chunks.
+
+    With ``feed`` set, only appointments created since the last completed
+    export of that feed are included, and the feed's watermark advances
+    once the final chunk has been produced. An export that is abandoned
+    part-way leaves the watermark where it was.
+    """
+    if feed:
+        # The watermark is advanced on the primary, so it must be read there
+        # too; a lagging replica would make the feed skip rows.
+        use_primary()
+    upto_id = max(db.session.query(func.max(model.id)).scalar() or 0 for model in (Appointment, ArchivedAppointment))
+    after_id = None
+    if feed:
+        watermark = db.session.get(ExportWatermark, feed)
+        after_id = watermark.last_id if watermark else 0
+
+    stmt = export_statement(after_id=after_id, upto_id=upto_id, **filters)
+    yield from ENCODERS[fmt](iter_rows(stmt, batch_size))
+
+    if feed:
+        watermark = db.session.get(ExportWatermark, feed) or ExportWatermark(name=feed)
+        watermark.last_id = upto_id
+        watermark.exported_at = datetime.utcnow()
+        db.session.add(watermark)
+        db.session.commit()
@@ -0,0 +1,60 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The app is imported once in the master and forked into the workers, so
+# worker start-up skips the imports and the workers share those pages.
+import gc
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+# A live-update stream holds a thread for as long as the page is open. On
+# thread-based workers, keep half of each worker's threads for ordinary
+# requests; pages over the limit just go without live updates.
+if worker_class == 'gthread':
+    os.environ.setdefault('EVENTS_MAX_SUBSCRIBERS', str(threads // 2))
+elif worker_class == 'sync':
+    os.environ.setdefault('EVENTS_MAX_SUBSCRIBERS', '0')
+
+# Every worker writes its metrics here so a /metrics scrape, whichever
+# worker answers it, reports all of them. Files from a previous run are
+# removed when the master starts.
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'hospital-metrics'))
+
+
+def on_starting(server):
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], '*.json')):
+        os.remove(path)
+
+
+def when_ready(server):
+    from wsgi import app
+
+    # Compile every template once here rather than once per worker.
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    # Move everything loaded so far out of the collector's reach. A full
+    # collection in a worker would otherwise write to every shared object's
+    # header and copy the page it lives on into that worker.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Connections must never be shared across processes; drop any the
+    # master's pools hold without closing them under the master.
+    from models import db
+    from wsgi import app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
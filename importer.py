@@ -0,0 +1,257 @@
+import csv
+import json
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert
+
+from models import db, User, Department, DoctorAvailability
+from passwords import hasher
+import cache
+from stats import apply_deltas
+
+KINDS = ('patients', 'doctors', 'availability')
+FORMATS = ('csv', 'json', 'ndjson')
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReadError(Exception):
+    """The file stopped being readable partway; ``report`` has what was imported before."""
+
+    def __init__(self, report):
+        super().__init__(f'the file could not be read after {report.inserted} imported records')
+        self.report = report
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.inserted = 0
+        self.rejected = []
+
+    def reject(self, line, reason):
+        self.rejected.append((line, reason))
+
+    @property
+    def total(self):
+        return self.inserted + len(self.rejected)
+
+
+def read_records(stream, fmt):
+    """Yield ``(line_number, dict)`` pairs from a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, None
+    else:
+        # A JSON array has to be parsed whole; use NDJSON for very large files.
+        for number, record in enumerate(json.load(stream), 1):
+            yield number, record
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _text(record, field, required=False):
+    value = record.get(field)
+    value = str(value).strip() if value is not None else ''
+    if required and not value:
+        raise RowError(f'{field} is required')
+    return value or None
+
+
+def _date(record, field, required=False):
+    value = _text(record, field, required)
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise RowError(f'{field} must be a date in YYYY-MM-DD format')
+
+
+def _time(record, field):
+    value = _text(record, field, required=True)
+    try:
+        return datetime.strptime(value, '%H:%M').time()
+    except ValueError:
+        raise RowError(f'{field} must be a time in HH:MM format')
+
+
+def _int(record, field):
+    value = _text(record, field)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise RowError(f'{field} must be an integer')
+
+
+class UserImporter:
+    def __init__(self, role):
+        self.role = role
+        self.seen_emails = set()
+        self.departments = {
+            name.lower(): department_id
+            for department_id, name in db.session.query(Department.id, Department.name)
+        }
+
+    def validate(self, record):
+        email = _text(record, 'email', required=True)
+        if '@' not in email:
+            raise RowError('email is not valid')
+        row = {
+            'name': _text(record, 'name', required=True),
+            'email': email,
+            'password': _text(record, 'password', required=True),
+            'role': self.role,
+            'phone': _text(record, 'phone'),
+            'is_active': True,
+            'created_at': datetime.utcnow(),
+        }
+        if self.role == 'Patient':
+            row['address'] = _text(record, 'address')
+            row['gender'] = _text(record, 'gender')
+            row['date_of_birth'] = _date(record, 'date_of_birth')
+        else:
+            department = _text(record, 'department')
+            department_id = _int(record, 'department_id')
+            if department:
+                department_id = self.departments.get(department.lower())
+                if department_id is None:
+                    raise RowError(f'unknown department {department!r}')
+            row['department_id'] = department_id
+            row['slot_minutes'] = _int(record, 'slot_minutes')
+        return row
+
+    def insert(self, rows, report):
+        existing = {email for (email,) in db.session.query(User.email).filter(
+            User.email.in_([row['email'] for _, row in rows])
+        )}
+
+        accepted = []
+        for line, row in rows:
+            if row['email'] in existing or row['email'] in self.seen_emails:
+                report.reject(line, 'email already registered')
+                continue
+            self.seen_emails.add(row['email'])
+            accepted.append(row)
+
+        hashes = hasher.hash_many([row.pop('password') for row in accepted])
+        for row, password_hash in zip(accepted, hashes):
+            row['password_hash'] = password_hash
+
+        if accepted:
+            db.session.execute(insert(User), accepted)
+            apply_deltas(db.session.connection(), Counter({'users:%s' % self.role: len(accepted)}))
+            if self.role == 'Doctor':
+                cache.changed('doctors')
+        return len(accepted)
+
+
+class AvailabilityImporter:
+    def validate(self, record):
+        start_time = _time(record, 'start_time')
+        end_time = _time(record, 'end_time')
+        if end_time <= start_time:
+            raise RowError('end_time must be after start_time')
+        doctor_email = _text(record, 'doctor_email')
+        doctor_id = _int(record, 'doctor_id')
+        if not doctor_email and not doctor_id:
+            raise RowError('doctor_email or doctor_id is required')
+        return {
+            'doctor_email': doctor_email,
+            'doctor_id': doctor_id,
+            'date': _date(record, 'date', required=True),
+            'start_time': start_time,
+            'end_time': end_time,
+            'is_available': True,
+        }
+
+    def insert(self, rows, report):
+        emails = {row['doctor_email'] for _, row in rows if row['doctor_email']}
+        ids = {row['doctor_id'] for _, row in rows if row['doctor_id']}
+        doctors = db.session.query(User.id, User.email).filter(
+            User.role == 'Doctor',
+            db.or_(User.email.in_(emails), User.id.in_(ids))
+        ).all()
+        by_email = {email: doctor_id for doctor_id, email in doctors}
+        known_ids = {doctor_id for doctor_id, _ in doctors}
+
+        accepted = []
+        for line, row in rows:
+            doctor_id = by_email.get(row.pop('doctor_email')) or row['doctor_id']
+            if doctor_id not in known_ids:
+                report.reject(line, 'unknown doctor')
+                continue
+            row['doctor_id'] = doctor_id
+            accepted.append(row)
+
+        if accepted:
+            db.session.execute(insert(DoctorAvailability), accepted)
+            cache.changed('availability')
+        return len(accepted)
+
+
+def make_importer(kind):
+    if kind == 'patients':
+        return UserImporter('Patient')
+    if kind == 'doctors':
+        return UserImporter('Doctor')
+    if kind == 'availability':
+        return AvailabilityImporter()
+    raise ValueError(f'unknown import kind {kind!r}')
+
+
+def import_records(kind, stream, fmt, chunk_size=1000):
+    """Validate and insert records from ``stream`` in chunked transactions.
+
+    Each chunk costs one lookup query for duplicate emails or unknown
+    doctors and one executemany INSERT, then commits. Rejected rows are
+    collected in the returned report with their line numbers. If the file
+    cannot be decoded or parsed partway, the chunks committed so far stay
+    and :class:`ImportReadError` carries the report of them.
+    """
+    importer = make_importer(kind)
+    report = ImportReport(kind)
+
+    try:
+        for chunk in _chunks(read_records(stream, fmt), chunk_size):
+            rows = []
+            for line, record in chunk:
+                if not isinstance(record, dict):
+                    report.reject(line, 'not a valid record')
+                    continue
+                try:
+                    rows.append((line, importer.validate(record)))
+                except RowError as exc:
+                    report.reject(line, str(exc))
+
+            if rows:
+                report.inserted += importer.insert(rows, report)
+                db.session.commit()
+    except (ValueError, csv.Error) as exc:
+        db.session.rollback()
+        report.rejected.sort()
+        raise ImportReadError(report) from exc
+
+    report.rejected.sort()
+    return report
@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time as timer
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+PERIODIC = []
+
+# Set when a transaction that enqueued jobs commits, so idle workers in this
+# process pick them up at once instead of at their next poll.
+_wakeup = threading.Event()
+
+
+def task(name=None, max_attempts=5, every=None):
+    """Register a function as a job task.
+
+    ``every`` makes the task periodic: a number of seconds, or the name of a
+    config key holding one.
+    """
+    def decorator(f):
+        f.task_name = name or f.__name__
+        f.max_attempts = max_attempts
+        TASKS[f.task_name] = f
+        if every is not None:
+            PERIODIC.append((f.task_name, every))
+        return f
+    return decorator
+
+
+def enqueue(name, run_at=None, unique_key=None, **payload):
+    """Queue ``name`` to run with ``payload`` at ``run_at`` (local time).
+
+    The job is added to the current session, so it is committed or rolled
+    back together with the change that caused it. A job with the same
+    ``unique_key`` is only queued once.
+    """
+    if unique_key:
+        existing = Job.query.filter_by(unique_key=unique_key).first()
+        if existing:
+            return existing
+    fn = TASKS.get(name)
+    job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        run_at=run_at or datetime.now(),
+        max_attempts=getattr(fn, 'max_attempts', 5),
+        unique_key=unique_key
+    )
+    db.session.add(job)
+    db.session.info['jobs_enqueued'] = True
+    return job
+
+
+def backoff(attempts):
+    config = current_app.config
+    delay = min(config['JOB_MAX_BACKOFF'], config['JOB_BACKOFF_BASE'] * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+def claim(worker_id, batch=5):
+    """Atomically take the next due job, or return None.
+
+    The conditional UPDATE only succeeds for one worker per job, so any
+    number of threads and processes can share the table.
+    """
+    now = datetime.now()
+    candidates = db.session.query(Job.id).filter(
+        Job.status == 'queued',
+        Job.run_at <= now
+    ).order_by(Job.run_at, Job.id).limit(batch).all()
+
+    for (job_id,) in candidates:
+        claimed = db.session.execute(update(Job).where(Job.id == job_id, Job.status == 'queued').values(
+            status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1
+        )).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome.
+
+    Whatever the task writes is committed together with the job's ``done``
+    status. A failure rolls the task's writes back and queues a retry with
+    exponential backoff until ``max_attempts`` is reached.
+    """
+    job_id = job.id
+    try:
+        fn = TASKS.get(job.name)
+        if fn is None:
+            raise LookupError(f'unknown task {job.name!r}')
+        fn(**json.loads(job.payload))
+    except Exception as exc:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = f'{type(exc).__name__}: {exc}'[:2000]
+        job.locked_by = None
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = datetime.now()
+            logger.exception('Job %s (%s) failed after %d attempts', job_id, job.name, job.attempts)
+        else:
+            job.status = 'queued'
+            job.run_at = datetime.now() + backoff(job.attempts)
+            logger.warning('Job %s (%s) failed, retrying at %s: %s', job_id, job.name, job.run_at, exc)
+    else:
+        job.status = 'done'
+        job.finished_at = datetime.now()
+        job.locked_by = None
+    db.session.commit()
+    return job.status
+
+
+def recover_stale():
+    """Requeue jobs whose worker died while running them."""
+    cutoff = datetime.now() - timedelta(seconds=current_app.config['JOB_LOCK_TIMEOUT'])
+    stale = [Job.status == 'running', Job.locked_at < cutoff]
+    db.session.execute(update(Job).where(*stale, Job.attempts >= Job.max_attempts).values(
+        status='failed', locked_by=None, last_error='worker lost', finished_at=datetime.now()
+    ))
+    db.session.execute(update(Job).where(*stale).values(status='queued', locked_by=None))
+    db.session.commit()
+
+
+def schedule_periodic(last_slots):
+    """Queue every periodic task whose interval has elapsed.
+
+    Each interval gets a unique key, so workers racing each other queue a
+    periodic task once per interval.
+    """
+    for name, every in PERIODIC:
+        interval = current_app.config[every] if isinstance(every, str) else every
+        if not interval:
+            continue
+        slot = int(timer.time() // interval)
+        if last_slots.get(name) == slot:
+            continue
+        last_slots[name] = slot
+        enqueue(name, unique_key=f'{name}:{slot}')
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+
+
+def run_pending(worker_id='inline', limit=None):
+    """Run due jobs in the calling thread; returns how many ran."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim(worker_id)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+class Worker:
+    """Background threads that run queued jobs for ``app``.
+
+    The first thread also requeues stale jobs and schedules periodic tasks.
+    """
+
+    def __init__(self, app, threads=2, poll_interval=5.0):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for n in range(self.threads):
+            thread = threading.Thread(target=self._loop, args=(n,), name=f'job-worker-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _loop(self, n):
+        worker_id = f'{self.name}:{n}'
+        last_slots = {}
+        last_recovery = 0
+        with self.app.app_context():
+            while not self._stop.is_set():
+                job = None
+                try:
+                    if n == 0:
+                        schedule_periodic(last_slots)
+                        if last_recovery + 60 < timer.time():
+                            recover_stale()
+                            last_recovery = timer.time()
+                    job = claim(worker_id)
+                    if job is not None:
+                        run_job(job)
+                except Exception:
+                    logger.exception('Job worker %s crashed; continuing', worker_id)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+                if job is None:
+                    _wakeup.wait(self.poll_interval)
+                    _wakeup.clear()
+
+
+@task(every=24 * 3600)
+def purge_jobs():
+    cutoff = datetime.now() - timedelta(days=current_app.config['JOB_RETENTION_DAYS'])
+    Job.query.filter(Job.status == 'done', Job.finished_at < cutoff).delete(synchronize_session=False)
+
+
+def _notify_workers(session):
+    if session.info.pop('jobs_enqueued', None):
+        _wakeup.set()
+
+
+def _discard(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+def init_app(app):
+    app.config.setdefault('JOB_WORKERS', 2)
+    app.config.setdefault('JOB_POLL_INTERVAL', 5)
+    app.config.setdefault('JOB_BACKOFF_BASE', 30)
+    app.config.setdefault('JOB_MAX_BACKOFF', 3600)
+    app.config.setdefault('JOB_LOCK_TIMEOUT', 600)
+    app.config.setdefault('JOB_RETENTION_DAYS', 7)
+    event.listen(db.session, 'after_commit', _notify_workers)
+    event.listen(db.session, 'after_rollback', _discard)
+
+    # Workers start with the first request, so CLI commands and the
+    # reloader's parent process never run any. JOB_WORKERS = 0 leaves the
+    # queue to a separate `flask run-worker` process.
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_workers():
+        if 'job_worker' in app.extensions or app.testing or not app.config['JOB_WORKERS']:
+            return
+        with lock:
+            if 'job_worker' not in app.extensions:
+                worker = Worker(app, app.config['JOB_WORKERS'], app.config['JOB_POLL_INTERVAL'])
+                worker.start()
+                app.extensions['job_worker'] = worker
@@ -0,0 +1,325 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time as timer
+import uuid
+from collections import Counter
+
+from flask import Response, abort, current_app, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+from auth import has_role
+from models import db
+
+logger = logging.getLogger('hospital.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: (list(b), s, c) for labels, (b, s, c) in self._series.items()}
+
+    @staticmethod
+    def merge(into, labels, value):
+        buckets, total, count = value
+        if labels in into:
+            old_buckets, old_total, old_count = into[labels]
+            buckets = [a + b for a, b in zip(old_buckets, buckets)]
+            total += old_total
+            count += old_count
+        into[labels] = (list(buckets), total, count)
+
+    def render(self, series):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (buckets, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(into, labels, value):
+        into[labels] = into.get(labels, 0) + value
+
+    def render(self, series):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(series.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'hospital_request_duration_seconds', 'Time spent handling a request.', ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = Histogram(
+    'hospital_request_queries', 'SQL statements executed per request.', ('endpoint',), QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_SECONDS = Histogram(
+    'hospital_request_query_seconds', 'Time spent in SQL per request.', ('endpoint',))
+TEMPLATE_SECONDS = Histogram(
+    'hospital_template_render_seconds', 'Time spent rendering a template, including its includes.', ('template',))
+SLOW_QUERIES = CounterMetric(
+    'hospital_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS.', ('endpoint',))
+
+METRICS = [REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_QUERY_SECONDS, TEMPLATE_SECONDS, SLOW_QUERIES]
+
+
+def redact(parameters):
+    """Replace bound values with their type names so logs carry no patient data."""
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    if parameters is None:
+        return None
+    return f'<{type(parameters).__name__}>'
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _request_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = timer.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    elapsed = timer.perf_counter() - started
+    stats = _request_stats()
+    if stats is not None:
+        stats['queries'] += 1
+        stats['query_seconds'] += elapsed
+        stats['statements'][statement] += 1
+
+    threshold = current_app.config['SLOW_QUERY_MS']
+    if threshold and elapsed * 1000 >= threshold:
+        endpoint = _endpoint() if has_request_context() else 'background'
+        SLOW_QUERIES.inc(endpoint)
+        logger.warning('Slow query (%.1f ms) in %s: %s; parameters %s',
+                       elapsed * 1000, endpoint, ' '.join(statement.split()), redact(parameters))
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None:
+        stats['render_started'].append(timer.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None and stats['render_started']:
+        elapsed = timer.perf_counter() - stats['render_started'].pop()
+        if not stats['render_started']:
+            stats['template_seconds'] += elapsed
+        TEMPLATE_SECONDS.observe(elapsed, template.name or 'string')
+
+
+def start_request():
+    g.request_stats = {
+        'started': timer.perf_counter(),
+        'queries': 0,
+        'query_seconds': 0.0,
+        'statements': Counter(),
+        'template_seconds': 0.0,
+        'render_started': [],
+    }
+
+
+def finish_request(response):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+    elapsed = timer.perf_counter() - stats['started']
+    endpoint = _endpoint()
+    REQUEST_SECONDS.observe(elapsed, endpoint, request.method, response.status_code)
+    REQUEST_QUERIES.observe(stats['queries'], endpoint)
+    REQUEST_QUERY_SECONDS.observe(stats['query_seconds'], endpoint)
+    if current_app.config['METRICS_DIR']:
+        _store.touch(current_app.config['METRICS_DIR'], current_app.config['METRICS_FLUSH_INTERVAL'])
+
+    # The same statement run many times in one request is almost always a
+    # lazy load inside a loop.
+    repeat = current_app.config['N_PLUS_ONE_THRESHOLD']
+    if repeat:
+        for statement, count in stats['statements'].items():
+            if count >= repeat:
+                logger.warning('Possible N+1 in %s: statement ran %d times: %s',
+                               endpoint, count, ' '.join(statement.split()))
+
+    if request.headers.get('X-Profile') and has_role('Admin'):
+        response.headers['Server-Timing'] = ', '.join([
+            'app;dur=%.1f' % (elapsed * 1000),
+            'db;dur=%.1f;desc="%d queries"' % (stats['query_seconds'] * 1000, stats['queries']),
+            'tpl;dur=%.1f' % (stats['template_seconds'] * 1000),
+        ])
+        response.headers['X-Query-Count'] = str(stats['queries'])
+    return response
+
+
+class _Store:
+    """Per-process snapshots in METRICS_DIR, summed when /metrics is scraped.
+
+    Each process rewrites its own file every METRICS_FLUSH_INTERVAL seconds
+    while it has new observations, so a scrape answered by any one gunicorn
+    worker covers all of them. Files of exited workers are kept, which keeps
+    the totals from going backwards when a worker is replaced.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._dirty = False
+
+    def _start(self, directory, interval):
+        self._pid = os.getpid()
+        self._path = os.path.join(directory, f'{self._pid}-{uuid.uuid4().hex[:8]}.json')
+        thread = threading.Thread(target=self._run, args=(interval,), name='metrics-flush', daemon=True)
+        thread.start()
+
+    def touch(self, directory, interval):
+        self._dirty = True
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start(directory, interval)
+
+    def _run(self, interval):
+        while True:
+            timer.sleep(interval)
+            if self._dirty:
+                self.flush()
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            self._dirty = False
+            state = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+                     for metric in METRICS}
+            tmp = f'{self._path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp, self._path)
+
+    def collect(self, directory):
+        self.flush()
+        series = {metric.name: {} for metric in METRICS}
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric in METRICS:
+                for labels, value in state.get(metric.name, ()):
+                    metric.merge(series[metric.name], tuple(labels), value)
+        return series
+
+
+_store = _Store()
+
+
+def render_metrics():
+    directory = current_app.config['METRICS_DIR']
+    if directory:
+        series = _store.collect(directory)
+    else:
+        series = {metric.name: metric.snapshot() for metric in METRICS}
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render(series[metric.name]))
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    app.config.setdefault('N_PLUS_ONE_THRESHOLD', 20)
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('METRICS_DIR', None)
+    app.config.setdefault('METRICS_FLUSH_INTERVAL', 5.0)
+    if app.config['METRICS_DIR']:
+        os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,121 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db, User, Department, Appointment, SchemaMigration
+from search import install_fts
+from roster import rebuild
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return f
+    return decorator
+
+
+def create_indexes(conn, *names):
+    """Create the model indexes called ``names`` if they do not exist.
+
+    Indexes are named rather than taken from a whole table because a table
+    can gain indexes on columns that only a later migration adds.
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(bind=conn, checkfirst=True)
+
+
+def add_column(conn, table_name, column_name, ddl):
+    columns = {c['name'] for c in inspect(conn).get_columns(table_name)}
+    if column_name not in columns:
+        conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {ddl}'))
+
+
+def applied_versions(conn):
+    table = SchemaMigration.__table__
+    return {row.version for row in conn.execute(table.select())}
+
+
+def upgrade(engine):
+    """Bring the schema at ``engine`` up to date.
+
+    Missing tables are created from the models, then every migration that
+    has not been recorded in ``schema_migrations`` runs in its own
+    transaction. Migrations must be idempotent so they are safe on a
+    database that was just created from the current models.
+    """
+    db.metadata.create_all(engine)
+    applied = []
+
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+
+    for version, description, fn in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+        applied.append((version, description))
+
+    return applied
+
+
+@migration(1, 'Composite indexes for appointment, availability and user lookups')
+def add_hot_query_indexes(conn):
+    create_indexes(conn, 'ix_users_role_active', 'ix_appointments_doctor_date_status',
+                   'ix_appointments_patient_status_date', 'ix_appointments_date_time',
+                   'ix_appointments_created_at', 'ix_doctor_availability_doctor_date')
+
+
+@migration(2, 'Slot reservations for active appointments')
+def backfill_slot_reservations(conn):
+    conn.execute(text("""
+        INSERT INTO slot_reservations (doctor_id, date, time, appointment_id, created_at)
+        SELECT a.doctor_id, a.date, a.time, MIN(a.id), CURRENT_TIMESTAMP
+        FROM appointments a
+        WHERE a.status IN ('Pending', 'Booked')
+          AND NOT EXISTS (
+              SELECT 1 FROM slot_reservations r
+              WHERE r.doctor_id = a.doctor_id AND r.date = a.date AND r.time = a.time
+          )
+        GROUP BY a.doctor_id, a.date, a.time
+    """))
+
+
+@migration(3, 'Per-doctor and per-department slot length')
+def add_slot_minutes(conn):
+    add_column(conn, 'users', 'slot_minutes', 'INTEGER')
+    add_column(conn, 'departments', 'slot_minutes', 'INTEGER')
+
+
+@migration(4, 'Full-text search index over users')
+def add_user_search_index(conn):
+    if conn.dialect.name == 'sqlite':
+        install_fts(conn)
+
+
+@migration(5, 'Date index for schedule range queries across all doctors')
+def add_availability_date_index(conn):
+    create_indexes(conn, 'ix_doctor_availability_date')
+
+
+@migration(6, 'Doctor patient roster built from appointment history')
+def backfill_doctor_patients(conn):
+    rebuild(conn)
+
+
+@migration(7, 'Row update timestamps for conditional page requests')
+def add_updated_at(conn):
+    for table in (User.__table__, Department.__table__, Appointment.__table__):
+        add_column(conn, table.name, 'updated_at', 'DATETIME')
+        conn.execute(table.update().where(table.c.updated_at.is_(None)).values(updated_at=table.c.created_at))
+    create_indexes(conn, 'ix_users_updated_at', 'ix_appointments_updated_at')
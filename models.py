@@ -1,8 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from passwords import hasher
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -17,16 +18,23 @@ class User(db.Model):
     date_of_birth = db.Column(db.Date)
     gender = db.Column(db.String(10))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    slot_minutes = db.Column(db.Integer)
     
     department_id = db.Column(db.Integer, db.ForeignKey('departments.id'))
     department = db.relationship('Department', backref='doctors')
     
+    __table_args__ = (
+        db.Index('ix_users_role_active', 'role', 'is_active'),
+        db.Index('ix_users_updated_at', 'updated_at'),
+    )
+    
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hasher.verify(self.password_hash, password)
 
 class Department(db.Model):
     __tablename__ = 'departments'
@@ -34,7 +42,9 @@ class Department(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
+    slot_minutes = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Appointment(db.Model):
     __tablename__ = 'appointments'
@@ -47,11 +57,20 @@ class Appointment(db.Model):
     status = db.Column(db.String(20), default='Pending')
     reason = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     patient = db.relationship('User', foreign_keys=[patient_id], backref='patient_appointments')
     doctor = db.relationship('User', foreign_keys=[doctor_id], backref='doctor_appointments')
     
     treatment = db.relationship('Treatment', backref='appointment', uselist=False, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_appointments_doctor_date_status', 'doctor_id', 'date', 'status'),
+        db.Index('ix_appointments_patient_status_date', 'patient_id', 'status', 'date'),
+        db.Index('ix_appointments_date_time', 'date', 'time', 'id'),
+        db.Index('ix_appointments_created_at', 'created_at'),
+        db.Index('ix_appointments_updated_at', 'updated_at'),
+    )
 
 class Treatment(db.Model):
     __tablename__ = 'treatments'
@@ -63,6 +82,57 @@ class Treatment(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Completed and cancelled appointments moved out of the hot tables by
+# archive.py. Rows keep their original ids.
+class ArchivedAppointment(db.Model):
+    __tablename__ = 'appointments_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    reason = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    patient = db.relationship('User', foreign_keys=[patient_id])
+    doctor = db.relationship('User', foreign_keys=[doctor_id])
+    
+    treatment = db.relationship('ArchivedTreatment', backref='appointment', uselist=False)
+    
+    archived = True
+    
+    __table_args__ = (
+        db.Index('ix_appointments_archive_patient_date', 'patient_id', 'date'),
+        db.Index('ix_appointments_archive_doctor_patient', 'doctor_id', 'patient_id'),
+    )
+
+class ArchivedTreatment(db.Model):
+    __tablename__ = 'treatments_archive'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments_archive.id'), nullable=False, unique=True)
+    diagnosis = db.Column(db.Text, nullable=False)
+    prescription = db.Column(db.Text)
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+
+class DoctorPatient(db.Model):
+    __tablename__ = 'doctor_patients'
+    
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    visit_count = db.Column(db.Integer, nullable=False, default=0)  # completed appointments
+    last_visit = db.Column(db.Date)
+    
+    patient = db.relationship('User', foreign_keys=[patient_id])
+    
+    __table_args__ = (
+        db.Index('ix_doctor_patients_doctor_last_visit', 'doctor_id', 'last_visit'),
+    )
+
 class DoctorAvailability(db.Model):
     __tablename__ = 'doctor_availability'
     
@@ -74,3 +144,117 @@ class DoctorAvailability(db.Model):
     is_available = db.Column(db.Boolean, default=True)
     
     doctor = db.relationship('User', backref='availability_slots')
+    
+    __table_args__ = (
+        db.Index('ix_doctor_availability_doctor_date', 'doctor_id', 'date'),
+        db.Index('ix_doctor_availability_date', 'date'),
+    )
+
+class AvailabilityRule(db.Model):
+    __tablename__ = 'availability_rules'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    weekdays = db.Column(db.Integer, nullable=False)  # bit 0 = Monday ... bit 6 = Sunday
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    valid_from = db.Column(db.Date)
+    valid_until = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    doctor = db.relationship('User', backref='availability_rules')
+    
+    __table_args__ = (
+        db.Index('ix_availability_rules_doctor', 'doctor_id'),
+    )
+
+class AvailabilityException(db.Model):
+    __tablename__ = 'availability_exceptions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # NULL = hospital-wide holiday
+    date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.Time)  # NULL start and end = the whole day
+    end_time = db.Column(db.Time)
+    reason = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    doctor = db.relationship('User', backref='availability_exceptions')
+    
+    __table_args__ = (
+        db.Index('ix_availability_exceptions_date_doctor', 'date', 'doctor_id'),
+    )
+
+class SlotReservation(db.Model):
+    __tablename__ = 'slot_reservations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'date', 'time', name='uq_slot_reservations_doctor_date_time'),
+    )
+
+# Change feed read by events.py; appointment_id has no foreign key because
+# archived appointments leave the appointments table.
+class AppointmentEvent(db.Model):
+    __tablename__ = 'appointment_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # created, status
+    status = db.Column(db.String(20))
+    doctor_id = db.Column(db.Integer, nullable=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.Date)
+    time = db.Column(db.Time)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_appointment_events_created_at', 'created_at'),
+    )
+
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+    
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class ExportWatermark(db.Model):
+    __tablename__ = 'export_watermarks'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    exported_at = db.Column(db.DateTime)
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False)
+    unique_key = db.Column(db.String(200), unique=True)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
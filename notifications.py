@@ -0,0 +1,85 @@
+import logging
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.orm import joinedload
+
+from jobs import enqueue, task
+from models import Appointment
+
+logger = logging.getLogger('hospital.notifications')
+
+STATUS_MESSAGES = {
+    'Booked': 'Your appointment with {doctor} on {when} is confirmed.',
+    'Cancelled': 'Your appointment with {doctor} on {when} has been cancelled.',
+    'Completed': 'Your visit with {doctor} on {when} is complete. Your treatment notes are in your appointment history.',
+}
+
+
+def send(user, subject, body):
+    """Deliver a message to ``user``.
+
+    Messages are written to the ``hospital.notifications`` log; an email or
+    SMS gateway plugs in here.
+    """
+    logger.info('To %s <%s>: %s - %s', user.name, user.email, subject, body)
+
+
+def _load(appointment_ids):
+    return Appointment.query.options(
+        joinedload(Appointment.patient), joinedload(Appointment.doctor)
+    ).filter(Appointment.id.in_(appointment_ids)).all()
+
+
+def _when(appointment):
+    return '%s at %s' % (appointment.date.strftime('%Y-%m-%d'), appointment.time.strftime('%H:%M'))
+
+
+def schedule_reminder(appointment):
+    hours = current_app.config['REMINDER_HOURS_BEFORE']
+    remind_at = datetime.combine(appointment.date, appointment.time) - timedelta(hours=hours)
+    if remind_at > datetime.now():
+        enqueue('send_reminder', run_at=remind_at, unique_key=f'reminder:{appointment.id}',
+                appointment_id=appointment.id)
+
+
+@task()
+def appointment_created(appointment_id):
+    for appointment in _load([appointment_id]):
+        if appointment.status == 'Pending':
+            send(appointment.patient, 'Appointment requested',
+                 f'Your request to see {appointment.doctor.name} on {_when(appointment)} is awaiting approval.')
+        elif appointment.status in STATUS_MESSAGES:
+            send(appointment.patient, f'Appointment {appointment.status.lower()}',
+                 STATUS_MESSAGES[appointment.status].format(doctor=appointment.doctor.name, when=_when(appointment)))
+        schedule_reminder(appointment)
+
+
+@task()
+def appointment_status_changed(appointment_ids, status):
+    template = STATUS_MESSAGES.get(status)
+    if template is None:
+        return
+    for appointment in _load(appointment_ids):
+        # A later change supersedes this one; only the latest is announced.
+        if appointment.status != status:
+            continue
+        send(appointment.patient, f'Appointment {status.lower()}',
+             template.format(doctor=appointment.doctor.name, when=_when(appointment)))
+
+
+@task()
+def send_reminder(appointment_id):
+    for appointment in _load([appointment_id]):
+        if appointment.status in ('Pending', 'Booked'):
+            send(appointment.patient, 'Appointment reminder',
+                 f'You have an appointment with {appointment.doctor.name} on {_when(appointment)}.')
+
+
+def status_changed(appointment_ids, status):
+    """Queue the notification for appointments that moved to ``status``."""
+    enqueue('appointment_status_changed', appointment_ids=sorted(appointment_ids), status=status)
+
+
+def init_app(app):
+    app.config.setdefault('REMINDER_HOURS_BEFORE', 24)
@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def _mp_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class PasswordHasher:
+    """Password hashing with a configurable method and an optional process pool.
+
+    With ``workers`` > 0 every hash and verification runs in a bounded pool
+    of worker processes, so a burst of logins can use at most that many
+    CPUs and leaves the request threads free to serve everything else.
+    """
+
+    def __init__(self, method='scrypt', salt_length=16, workers=0):
+        self.configure(method, salt_length, workers)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+    def configure(self, method, salt_length, workers):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self._prefix = None
+
+    def _pool(self):
+        # A pool inherited across fork() is unusable, so every process
+        # creates its own on first use. Its workers are started from a
+        # forkserver (spawned where that is missing) rather than forked
+        # from a process running request threads, whose locks they could
+        # inherit held.
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        return self._pool().submit(fn, *args).result()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def hash_many(self, passwords):
+        passwords = list(passwords)
+        args = ([self.method] * len(passwords), [self.salt_length] * len(passwords))
+        if not self.workers:
+            return list(map(generate_password_hash, passwords, *args))
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self._pool().map(generate_password_hash, passwords, *args, chunksize=chunksize))
+
+    @property
+    def prefix(self):
+        # Werkzeug stores the fully expanded method ("scrypt:32768:8:1"),
+        # so hash once to learn what the configured method expands to.
+        if self._prefix is None:
+            self._prefix = generate_password_hash('', self.method, 1).split('$', 1)[0]
+        return self._prefix
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.prefix
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+
+
+hasher = PasswordHasher()
+
+
+def init_app(app):
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config.setdefault('PASSWORD_SALT_LENGTH', 16)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', 0)
+    hasher.configure(
+        app.config['PASSWORD_HASH_METHOD'],
+        app.config['PASSWORD_SALT_LENGTH'],
+        app.config['PASSWORD_HASH_WORKERS']
+    )
@@ -0,0 +1,109 @@
+import random
+import sqlite3
+import time
+
+from flask import current_app, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_keys(app):
+    return [f'replica_{i}' for i in range(len(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()))]
+
+
+class RoutingSession(Session):
+    """``db.session`` that can send reads to a replica bind.
+
+    ``info['replica']`` holds the bind key chosen for the current request.
+    Statements go to the primary while it is unset, while flushing, for
+    INSERT/UPDATE/DELETE, and for ``connection()`` calls that name no
+    table, which is how the set-based write paths get their connection.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        key = self.info.get('replica')
+        if (key is not None and bind is None and not self._flushing
+                and (mapper is not None or clause is not None) and not getattr(clause, 'is_dml', False)):
+            return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_primary():
+    """Send the rest of this request's statements to the primary."""
+    current_app.extensions['sqlalchemy'].session.info.pop('replica', None)
+
+
+def _pin_on_flush(db_session, flush_context, instances):
+    db_session.info.pop('replica', None)
+
+
+def _pin_on_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info.pop('replica', None)
+
+
+def _route_request():
+    keys = current_app.extensions['replicas']
+    if not keys or request.method not in SAFE_METHODS:
+        return
+    # Read your own writes: a browser that changed something recently reads
+    # from the primary until the replicas have had time to catch up.
+    if session.get('primary_until', 0) > time.time():
+        return
+    current_app.extensions['sqlalchemy'].session.info['replica'] = random.choice(keys)
+
+
+def _remember_write(response):
+    window = current_app.config['REPLICA_STICKY_SECONDS']
+    if current_app.extensions['replicas'] and window and request.method not in SAFE_METHODS \
+            and response.status_code < 500:
+        session['primary_until'] = time.time() + window
+    return response
+
+
+def copy_sqlite(source, target):
+    """Copy the SQLite database at ``source`` over ``target`` with the backup API.
+
+    Readers of ``target`` keep working during the copy and see the new
+    contents from their next transaction.
+    """
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target, timeout=30)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def sync_sqlite_replicas(db):
+    """Refresh every SQLite replica file from the primary; returns their paths."""
+    engines = db.engines
+    primary = engines[None].url
+    if primary.get_backend_name() != 'sqlite':
+        raise RuntimeError('Replica files can only be copied from a SQLite primary.')
+    paths = []
+    for key in replica_keys(current_app):
+        url = engines[key].url
+        if url.get_backend_name() == 'sqlite':
+            copy_sqlite(primary.database, url.database)
+            paths.append(url.database)
+    return paths
+
+
+def init_app(app):
+    """Route read-only requests to the replicas in SQLALCHEMY_REPLICA_URIS.
+
+    ``database.init_app`` creates an engine for each replica as the bind
+    ``replica_<n>``; without replicas every request uses the primary.
+    """
+    app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+    app.extensions['replicas'] = replica_keys(app)
+    db_session = app.extensions['sqlalchemy'].session
+    event.listen(db_session, 'before_flush', _pin_on_flush)
+    event.listen(db_session, 'do_orm_execute', _pin_on_write)
+    app.before_request(_route_request)
+    app.after_request(_remember_write)
@@ -0,0 +1,290 @@
+import calendar
+import json
+import re
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import func, type_coerce, union_all
+
+from cache import get_backend
+from models import db, User, Department, Appointment, Treatment, ArchivedAppointment, ArchivedTreatment
+from schedule import expand
+
+# NumPy is imported when the first report is built (see _load_numpy), so
+# workers that never build one skip its import time and memory.
+np = None
+
+PERIOD_RE = re.compile(r'^(\d{4})(?:-(Q[1-4]|\d{2}))?$')
+TOP_DIAGNOSES = 20
+
+
+class ReportError(Exception):
+    pass
+
+
+def parse_period(period):
+    """``YYYY``, ``YYYY-Qn`` or ``YYYY-MM`` -> (start, end), both inclusive."""
+    match = PERIOD_RE.match(period or '')
+    if not match:
+        raise ReportError('Use a period like 2025, 2025-Q2 or 2025-07.')
+    year, part = int(match.group(1)), match.group(2)
+    if part is None:
+        first, last = 1, 12
+    elif part.startswith('Q'):
+        first = (int(part[1]) - 1) * 3 + 1
+        last = first + 2
+    else:
+        first = last = int(part)
+        if not 1 <= first <= 12:
+            raise ReportError('Months run from 01 to 12.')
+    return date(year, first, 1), date(year, last, calendar.monthrange(year, last)[1])
+
+
+def _fetch_columns(select, count):
+    rows = db.session.connection().execute(select).all()
+    if not rows:
+        return [()] * count
+    return list(zip(*rows))
+
+
+def extract(start, end):
+    """Columns of every appointment dated from ``start`` to ``end``, hot and archived.
+
+    One pass over each table fetches everything the report needs, with the
+    diagnosis of completed visits alongside. Dates come back as ISO strings
+    (or dates on databases that return them natively) and are parsed by
+    NumPy for the whole column at once.
+    """
+    selects = [
+        db.select(
+            model.doctor_id,
+            func.coalesce(model.status, 'Pending'),
+            type_coerce(model.date, db.String),
+            func.date(model.created_at),
+            func.coalesce(treatment.diagnosis, '')
+        ).outerjoin(treatment, treatment.appointment_id == model.id).where(model.date >= start, model.date <= end)
+        for model, treatment in ((Appointment, Treatment), (ArchivedAppointment, ArchivedTreatment))
+    ]
+    doctor, status, day, created, diagnosis = _fetch_columns(union_all(*selects), 5)
+    return {
+        'doctor_id': np.array(doctor, dtype=np.int64),
+        'status': np.array(status, dtype='U10'),
+        'date': np.array(day, dtype='datetime64[D]'),
+        'created': np.array(created, dtype='datetime64[D]'),
+        'diagnosis': np.array(diagnosis, dtype=str),
+    }
+
+
+def slot_capacity(start, end):
+    """Bookable slots per doctor between two dates, from their expanded schedules."""
+    default = current_app.config['DEFAULT_SLOT_MINUTES']
+    lengths = {
+        doctor_id: doctor_minutes or department_minutes or default
+        for doctor_id, doctor_minutes, department_minutes in db.session.query(
+            User.id, User.slot_minutes, Department.slot_minutes
+        ).outerjoin(Department, Department.id == User.department_id).filter(User.role == 'Doctor')
+    }
+    capacity = dict.fromkeys(lengths, 0)
+    for doctor_id, day, intervals in expand(start, end):
+        length = lengths.get(doctor_id, default)
+        capacity[doctor_id] = capacity.get(doctor_id, 0) + sum((e - s) // length for s, e in intervals)
+    return capacity
+
+
+def _group(keys, **masks):
+    """Row count and the number of rows matching each mask, per distinct key."""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = {'appointments': np.bincount(inverse, minlength=len(unique))}
+    for name, mask in masks.items():
+        counts[name] = np.bincount(inverse, weights=mask, minlength=len(unique)).astype(np.int64)
+    return unique, inverse, counts
+
+
+def _rate(part, whole):
+    return round(float(part) / float(whole), 4) if whole else None
+
+
+def _lead_time(days):
+    if not len(days):
+        return {'mean': None, 'median': None, 'p90': None}
+    return {
+        'mean': round(float(days.mean()), 1),
+        'median': float(np.median(days)),
+        'p90': float(np.percentile(days, 90)),
+    }
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ReportError('Reports need NumPy; install it with "pip install numpy".')
+        np = numpy
+
+
+def build_report(start, end):
+    _load_numpy()
+
+    columns = extract(start, end)
+    status = columns['status']
+    completed = status == 'Completed'
+    cancelled = status == 'Cancelled'
+    # A no-show is a past appointment that was never completed or cancelled.
+    past = columns['date'] < np.datetime64(date.today())
+    no_show = past & ~completed & ~cancelled
+    active = ~cancelled
+
+    lead = (columns['date'] - columns['created']).astype(np.float64)
+    has_lead = ~np.isnat(columns['created']) & (lead >= 0)
+
+    capacity = slot_capacity(start, end)
+    doctors = {
+        doctor_id: (name, department_id)
+        for doctor_id, name, department_id in db.session.query(User.id, User.name, User.department_id).filter(
+            User.role == 'Doctor'
+        )
+    }
+    departments = dict(db.session.query(Department.id, Department.name))
+    weeks = ((end - start).days + 1) / 7
+
+    report = {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'totals': {
+            'appointments': int(len(status)),
+            'completed': int(completed.sum()),
+            'cancelled': int(cancelled.sum()),
+            'no_shows': int(no_show.sum()),
+            'cancellation_rate': _rate(cancelled.sum(), len(status)),
+            'no_show_rate': _rate(no_show.sum(), (past & ~cancelled).sum()),
+        },
+        'lead_time_days': _lead_time(lead[has_lead]),
+    }
+
+    doctor_ids, doctor_index = np.unique(columns['doctor_id'], return_inverse=True)
+    department_of = np.array([doctors.get(int(d), (None, None))[1] or 0 for d in doctor_ids], dtype=np.int64)
+    unique, inverse, counts = _group(department_of[doctor_index], completed=completed, cancelled=cancelled,
+                                     active=active, no_show=no_show)
+    department_capacity = {}
+    for doctor_id, slots in capacity.items():
+        department_id = doctors.get(doctor_id, (None, None))[1] or 0
+        department_capacity[department_id] = department_capacity.get(department_id, 0) + slots
+    order = np.argsort(inverse, kind='stable')
+    boundaries = np.cumsum(counts['appointments'])[:-1]
+    lead_by_department = np.split(lead[order], boundaries)
+    has_lead_by_department = np.split(has_lead[order], boundaries)
+    report['departments'] = sorted([
+        {
+            'department': departments.get(int(key), 'No Department'),
+            'appointments': int(counts['appointments'][i]),
+            'completed': int(counts['completed'][i]),
+            'cancelled': int(counts['cancelled'][i]),
+            'no_shows': int(counts['no_show'][i]),
+            'capacity': department_capacity.get(int(key), 0),
+            'utilization': _rate(counts['active'][i], department_capacity.get(int(key), 0)),
+            'cancellation_rate': _rate(counts['cancelled'][i], counts['appointments'][i]),
+            'lead_time_median': _lead_time(lead_by_department[i][has_lead_by_department[i]])['median'],
+        }
+        for i, key in enumerate(unique)
+    ], key=lambda row: -row['appointments'])
+
+    unique, inverse, counts = _group(columns['doctor_id'], completed=completed, cancelled=cancelled,
+                                     active=active, no_show=no_show)
+    report['doctors'] = sorted([
+        {
+            'doctor': doctors.get(int(key), ('Unknown', None))[0],
+            'department': departments.get(doctors.get(int(key), (None, None))[1], 'No Department'),
+            'appointments': int(counts['appointments'][i]),
+            'completed': int(counts['completed'][i]),
+            'cancelled': int(counts['cancelled'][i]),
+            'no_shows': int(counts['no_show'][i]),
+            'per_week': round(float(counts['active'][i]) / weeks, 1),
+            'capacity': capacity.get(int(key), 0),
+            'utilization': _rate(counts['active'][i], capacity.get(int(key), 0)),
+        }
+        for i, key in enumerate(unique)
+    ], key=lambda row: -row['appointments'])
+
+    months = columns['date'].astype('datetime64[M]')
+    unique, inverse, counts = _group(months, completed=completed, cancelled=cancelled, no_show=no_show)
+    report['months'] = [
+        {
+            'month': str(key),
+            'appointments': int(counts['appointments'][i]),
+            'completed': int(counts['completed'][i]),
+            'cancelled': int(counts['cancelled'][i]),
+            'no_shows': int(counts['no_show'][i]),
+        }
+        for i, key in enumerate(unique)
+    ]
+
+    diagnoses = np.char.lower(np.char.strip(columns['diagnosis'][completed]))
+    diagnoses = diagnoses[diagnoses != '']
+    unique, totals = np.unique(diagnoses, return_counts=True)
+    top = np.argsort(-totals, kind='stable')[:TOP_DIAGNOSES]
+    report['diagnoses'] = [
+        {'diagnosis': str(unique[i]), 'count': int(totals[i]), 'share': _rate(totals[i], len(diagnoses))}
+        for i in top
+    ]
+    return report
+
+
+def get_report(period, refresh=False):
+    """The report for ``period``, from the cache when possible.
+
+    Reports for periods that have ended are kept for REPORT_CACHE_TTL_CLOSED
+    seconds, the current period's for REPORT_CACHE_TTL.
+    """
+    start, end = parse_period(period)
+    backend = get_backend()
+    key = f'report:{start}:{end}'
+    if not refresh:
+        cached = backend.get(key)
+        if cached is not None:
+            return json.loads(cached)
+
+    report = build_report(start, end)
+    report['period'] = period
+    config = current_app.config
+    ttl = config['REPORT_CACHE_TTL_CLOSED'] if end < date.today() else config['REPORT_CACHE_TTL']
+    backend.set(key, json.dumps(report), ttl)
+    return report
+
+
+def _percent(rate):
+    return '-' if rate is None else f'{rate:.1%}'
+
+
+def format_text(report):
+    """Plain-text rendering of a report for the CLI."""
+    totals, lead = report['totals'], report['lead_time_days']
+    lines = [
+        f"Report {report['period']} ({report['start']} to {report['end']}), generated {report['generated_at']}",
+        '',
+        f"Appointments {totals['appointments']}, completed {totals['completed']}, "
+        f"cancelled {totals['cancelled']} ({_percent(totals['cancellation_rate'])}), "
+        f"no-shows {totals['no_shows']} ({_percent(totals['no_show_rate'])})",
+        f"Lead time in days: mean {lead['mean']}, median {lead['median']}, 90th percentile {lead['p90']}",
+        '',
+        f"{'Department':<24} {'Appts':>7} {'Done':>7} {'Cancel':>7} {'Util':>7} {'Lead':>5}",
+    ]
+    for row in report['departments']:
+        lines.append(f"{row['department'][:24]:<24} {row['appointments']:>7} {row['completed']:>7} "
+                     f"{_percent(row['cancellation_rate']):>7} {_percent(row['utilization']):>7} "
+                     f"{row['lead_time_median'] if row['lead_time_median'] is not None else '-':>5}")
+    lines += ['', f"{'Doctor':<24} {'Department':<18} {'Appts':>7} {'/week':>6} {'Util':>7}"]
+    for row in report['doctors']:
+        lines.append(f"{row['doctor'][:24]:<24} {row['department'][:18]:<18} {row['appointments']:>7} "
+                     f"{row['per_week']:>6} {_percent(row['utilization']):>7}")
+    lines += ['', f"{'Diagnosis':<32} {'Count':>7} {'Share':>7}"]
+    for row in report['diagnoses']:
+        lines.append(f"{row['diagnosis'][:32]:<32} {row['count']:>7} {_percent(row['share']):>7}")
+    return '\n'.join(lines)
+
+
+def init_app(app):
+    app.config.setdefault('REPORT_CACHE_TTL', 600)
+    app.config.setdefault('REPORT_CACHE_TTL_CLOSED', 24 * 3600)
@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import json
+import os
+import time as timer
+from functools import wraps
+
+from flask import current_app, get_flashed_messages, make_response, request, session, url_for
+from flask_wtf.csrf import generate_csrf
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import func
+
+from auth import get_current_user
+from models import db, StatCounter
+from stats import deletes_key
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE = {'text/html', 'text/css', 'text/csv', 'text/plain', 'application/json', 'application/javascript'}
+
+_static_versions = {}
+
+
+def version_of(*models):
+    """Query for the current data version of each of ``models``' tables.
+
+    Inserts and updates move the latest ``updated_at``, which is read from
+    its index; deletes move the deleted-row count stats.py keeps. Neither
+    part scans the table, so checking a version costs the same at any size.
+    """
+    columns = []
+    for model in models:
+        columns.append(db.select(func.max(model.updated_at)).scalar_subquery())
+        columns.append(db.select(StatCounter.value).where(StatCounter.key == deletes_key(model)).scalar_subquery())
+    return db.select(*columns)
+
+
+def _etag(versions):
+    user = get_current_user()
+    parts = [request.full_path, versions]
+    if user:
+        parts += [user.id, user.updated_at]
+    # Cached pages embed a CSRF token, which is tied to the session and
+    # expires after WTF_CSRF_TIME_LIMIT; move to a new tag halfway through
+    # so a page is never reused with a stale token. The token is created
+    # up front so the first render does not change the tag.
+    generate_csrf()
+    parts.append(session.get('csrf_token'))
+    limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if limit:
+        parts.append(int(timer.time() // (limit / 2)))
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def conditional(*models):
+    """Answer conditional GETs of a page from the version of the data it shows.
+
+    ``models`` are the tables the page lists. Their :func:`version_of`, the
+    full URL (so the page's filters and cursor) and the viewer make the ETag,
+    so a browser revalidating an unchanged page gets a 304 without the
+    view's queries or template rendering.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Flashed messages are shown once, so those pages always render.
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+            etag = _etag(list(db.session.execute(version_of(*models)).one()))
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or get_flashed_messages():
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def static_url(filename):
+    """URL of a file in static/ with a content hash, so it can be cached forever."""
+    path = os.path.join(current_app.static_folder, filename)
+    mtime = os.stat(path).st_mtime
+    cached = _static_versions.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = _static_versions[filename] = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+    return url_for('static', filename=filename, v=cached[1])
+
+
+def _cache_static(response):
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['STATIC_MAX_AGE']
+        response.cache_control.immutable = True
+    return response
+
+
+def _encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(response):
+    config = current_app.config
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE
+            or response.content_length is None or response.content_length < config['COMPRESS_MIN_SIZE']):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if encoding == 'br':
+        data = brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    else:
+        data = gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    # A strong ETag names exact bytes; the compressed body is only
+    # equivalent to the one it was computed from.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+    app.config.setdefault('STATIC_MAX_AGE', 365 * 24 * 3600)
+
+    # Compiled templates are kept on disk, so new workers and restarts load
+    # them instead of compiling every template again.
+    if app.config['JINJA_CACHE_DIR']:
+        os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+    app.add_template_global(static_url)
+    app.after_request(_cache_static)
+    if app.config['COMPRESS_MIN_SIZE'] is not None:
+        app.after_request(_compress)
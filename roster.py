@@ -0,0 +1,96 @@
+from sqlalchemy import case, event, func, inspect, or_, text
+
+from models import db, Appointment, ArchivedAppointment, DoctorPatient
+
+
+def _old_status(state):
+    history = state.attrs.status.history
+    return history.deleted[0] if history.deleted else state.object.status
+
+
+def _collect_changes(session, flush_context, instances):
+    changes = session.info.setdefault('roster_changes', {})
+
+    def change(appointment, visits):
+        if appointment.doctor_id is None or appointment.patient_id is None:
+            return
+        key = (appointment.doctor_id, appointment.patient_id)
+        visits_delta, last_visit = changes.get(key, (0, None))
+        if visits > 0 and (last_visit is None or appointment.date > last_visit):
+            last_visit = appointment.date
+        changes[key] = (visits_delta + visits, last_visit)
+
+    for obj in session.new:
+        if isinstance(obj, Appointment):
+            change(obj, 1 if obj.status == 'Completed' else 0)
+
+    for obj in session.dirty:
+        if isinstance(obj, Appointment):
+            state = inspect(obj)
+            if not state.attrs.status.history.has_changes():
+                continue
+            old, new = _old_status(state), obj.status
+            if old != new and 'Completed' in (old, new):
+                change(obj, 1 if new == 'Completed' else -1)
+
+
+def _write_changes(session, flush_context):
+    changes = session.info.pop('roster_changes', None)
+    if changes:
+        apply_changes(session.connection(), changes)
+
+
+def apply_changes(conn, changes):
+    """Apply ``{(doctor_id, patient_id): (visit_delta, visit_date)}`` to the roster.
+
+    A pair seen for the first time gets a row. A negative delta recomputes
+    the last visit from the appointments of that pair.
+    """
+    table = DoctorPatient.__table__
+    for (doctor_id, patient_id), (delta, visit_date) in changes.items():
+        pair = (table.c.doctor_id == doctor_id) & (table.c.patient_id == patient_id)
+        values = {'visit_count': table.c.visit_count + delta}
+        if delta < 0:
+            values['last_visit'] = func.coalesce(*[
+                db.select(func.max(model.date)).where(
+                    model.doctor_id == doctor_id,
+                    model.patient_id == patient_id,
+                    model.status == 'Completed'
+                ).scalar_subquery()
+                for model in (Appointment, ArchivedAppointment)
+            ])
+        elif visit_date is not None:
+            values['last_visit'] = case(
+                (or_(table.c.last_visit == None, table.c.last_visit < visit_date), visit_date),
+                else_=table.c.last_visit
+            )
+        result = conn.execute(table.update().where(pair).values(**values))
+        if result.rowcount == 0:
+            conn.execute(table.insert().values(
+                doctor_id=doctor_id,
+                patient_id=patient_id,
+                visit_count=max(delta, 0),
+                last_visit=visit_date
+            ))
+
+
+def rebuild(conn):
+    """Recompute the whole roster from the hot and archived appointments on ``conn``."""
+    conn.execute(DoctorPatient.__table__.delete())
+    conn.execute(text("""
+        INSERT INTO doctor_patients (doctor_id, patient_id, visit_count, last_visit)
+        SELECT doctor_id, patient_id,
+               SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END),
+               MAX(CASE WHEN status = 'Completed' THEN date END)
+        FROM (
+            SELECT doctor_id, patient_id, status, date FROM appointments
+            UNION ALL
+            SELECT doctor_id, patient_id, status, date FROM appointments_archive
+        ) AS visits
+        GROUP BY doctor_id, patient_id
+    """))
+
+
+def init_app(app):
+    event.listen(db.session, 'before_flush', _collect_changes)
+    event.listen(db.session, 'after_flush', _write_changes)
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+
+from models import db, DoctorAvailability, AvailabilityRule, AvailabilityException
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+WHOLE_DAY = (0, 24 * 60)
+
+
+def minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def as_time(minutes):
+    return (datetime.min + timedelta(minutes=minutes)).time()
+
+
+def weekday_mask(weekdays):
+    mask = 0
+    for weekday in weekdays:
+        mask |= 1 << weekday
+    return mask
+
+
+def mask_weekdays(mask):
+    return [weekday for weekday in range(7) if mask & (1 << weekday)]
+
+
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def subtract_intervals(intervals, removed):
+    """Remove ``removed`` from ``intervals``; both must be merged and sorted."""
+    result = []
+    for start, end in intervals:
+        for removed_start, removed_end in removed:
+            if removed_end <= start or removed_start >= end:
+                continue
+            if removed_start > start:
+                result.append([start, removed_start])
+            start = max(start, removed_end)
+            if start >= end:
+                break
+        if start < end:
+            result.append([start, end])
+    return result
+
+
+def _rules(start_date, end_date, doctor_ids):
+    query = db.session.query(
+        AvailabilityRule.doctor_id, AvailabilityRule.weekdays,
+        AvailabilityRule.start_time, AvailabilityRule.end_time,
+        AvailabilityRule.valid_from, AvailabilityRule.valid_until
+    ).filter(
+        db.or_(AvailabilityRule.valid_from == None, AvailabilityRule.valid_from <= end_date),
+        db.or_(AvailabilityRule.valid_until == None, AvailabilityRule.valid_until >= start_date)
+    )
+    if doctor_ids is not None:
+        query = query.filter(AvailabilityRule.doctor_id.in_(doctor_ids))
+
+    # doctor -> weekday -> [(start, end, valid_from, valid_until)]
+    rules = {}
+    for doctor_id, mask, start, end, valid_from, valid_until in query:
+        by_weekday = rules.setdefault(doctor_id, [[] for _ in range(7)])
+        for weekday in mask_weekdays(mask):
+            by_weekday[weekday].append((minutes(start), minutes(end), valid_from, valid_until))
+    return rules
+
+
+def _single_days(start_date, end_date, doctor_ids):
+    query = db.session.query(
+        DoctorAvailability.doctor_id, DoctorAvailability.date,
+        DoctorAvailability.start_time, DoctorAvailability.end_time, DoctorAvailability.is_available
+    ).filter(DoctorAvailability.date >= start_date, DoctorAvailability.date <= end_date)
+    if doctor_ids is not None:
+        query = query.filter(DoctorAvailability.doctor_id.in_(doctor_ids))
+
+    extra, blocked = {}, {}
+    for doctor_id, day, start, end, is_available in query:
+        target = extra if is_available else blocked
+        target.setdefault((doctor_id, day), []).append((minutes(start), minutes(end)))
+    return extra, blocked
+
+
+def _exceptions(start_date, end_date, doctor_ids, blocked):
+    query = db.session.query(
+        AvailabilityException.doctor_id, AvailabilityException.date,
+        AvailabilityException.start_time, AvailabilityException.end_time
+    ).filter(AvailabilityException.date >= start_date, AvailabilityException.date <= end_date)
+    if doctor_ids is not None:
+        query = query.filter(db.or_(
+            AvailabilityException.doctor_id == None,
+            AvailabilityException.doctor_id.in_(doctor_ids)
+        ))
+
+    for doctor_id, day, start, end in query:
+        interval = (minutes(start), minutes(end)) if start is not None and end is not None else WHOLE_DAY
+        blocked.setdefault((doctor_id, day), []).append(interval)
+    return blocked
+
+
+def expand(start_date, end_date, doctor_ids=None):
+    """Yield ``(doctor_id, day, intervals)`` for every working day in the window.
+
+    Weekly rules, single-day entries and exceptions are each read with one
+    range query, whatever the window size and number of doctors, and the
+    days are then generated in memory: the rules and single-day entries of
+    a day are merged, then exceptions and hospital-wide holidays (exceptions
+    without a doctor) are cut out. Intervals are ``[start, end)`` minute
+    offsets from midnight. Days come in date order, doctors by id.
+    """
+    if doctor_ids is not None:
+        doctor_ids = list(doctor_ids)
+    rules = _rules(start_date, end_date, doctor_ids)
+    extra, blocked = _single_days(start_date, end_date, doctor_ids)
+    blocked = _exceptions(start_date, end_date, doctor_ids, blocked)
+    doctors = sorted(set(rules) | {doctor_id for doctor_id, _ in extra})
+    no_rules = [[] for _ in range(7)]
+
+    day = start_date
+    while day <= end_date:
+        weekday = day.weekday()
+        holiday = blocked.get((None, day), [])
+        for doctor_id in doctors:
+            intervals = [
+                (start, end) for start, end, valid_from, valid_until in rules.get(doctor_id, no_rules)[weekday]
+                if (valid_from is None or valid_from <= day) and (valid_until is None or day <= valid_until)
+            ]
+            intervals += extra.get((doctor_id, day), [])
+            if not intervals:
+                continue
+            intervals = merge_intervals(intervals)
+            removed = holiday + blocked.get((doctor_id, day), [])
+            if removed:
+                intervals = subtract_intervals(intervals, merge_intervals(removed))
+            if intervals:
+                yield doctor_id, day, intervals
+        day += timedelta(days=1)
+
+
+def availability_by_day(doctor_id, start_date, end_date):
+    return {day: intervals for _, day, intervals in expand(start_date, end_date, [doctor_id])}
+
+
+def available_doctor_ids(start_date, end_date):
+    return {doctor_id for doctor_id, _, _ in expand(start_date, end_date)}
@@ -0,0 +1,155 @@
+import difflib
+import re
+
+from flask import current_app
+from sqlalchemy import column, table, text
+
+from models import db, User
+
+FTS_TABLE = 'users_fts'
+FTS_COLUMNS = ('name', 'email', 'phone')
+
+users_fts = table(FTS_TABLE, column('rowid'))
+
+
+class SearchResults:
+    def __init__(self, pagination, corrected=False):
+        self.pagination = pagination
+        self.corrected = corrected
+
+    def __getattr__(self, name):
+        return getattr(self.pagination, name)
+
+    def __iter__(self):
+        return iter(self.pagination.items)
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class SearchEngine:
+    """Finds users matching free text within ``fields``.
+
+    ``filters`` are extra SQLAlchemy criteria on ``User`` (role, active flag,
+    department) applied inside the same query.
+    """
+
+    def search(self, query, fields, filters=(), page=1, per_page=20):
+        raise NotImplementedError
+
+    def _paginate(self, query, page, per_page):
+        return query.paginate(page=page, per_page=per_page, error_out=False)
+
+
+class LikeSearchEngine(SearchEngine):
+    def search(self, query, fields, filters=(), page=1, per_page=20):
+        pattern = f'%{query}%'
+        q = User.query.filter(*filters).filter(
+            db.or_(*[getattr(User, field).ilike(pattern) for field in fields])
+        ).order_by(User.name, User.id)
+        return SearchResults(self._paginate(q, page, per_page))
+
+
+class FTS5SearchEngine(SearchEngine):
+    """SQLite FTS5 index over users, kept in sync by triggers.
+
+    Every token is matched as a prefix so results appear while typing. When
+    nothing matches, unknown tokens are swapped for close terms from the
+    index vocabulary, which gives a cheap form of typo tolerance.
+    """
+
+    def search(self, query, fields, filters=(), page=1, per_page=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return SearchResults(self._paginate(User.query.filter(db.false()), page, per_page))
+
+        results = self._paginate(self._query(tokens, fields, filters), page, per_page)
+        if results.total or page > 1:
+            return SearchResults(results)
+
+        alternatives = self._corrections(tokens)
+        if alternatives == [[t] for t in tokens]:
+            return SearchResults(results)
+        return SearchResults(
+            self._paginate(self._query(alternatives, fields, filters), page, per_page),
+            corrected=True
+        )
+
+    def _query(self, tokens, fields, filters):
+        terms = []
+        for options in tokens:
+            if isinstance(options, str):
+                options = [options]
+            terms.append('(' + ' OR '.join(f'"{t}"*' for t in options) + ')')
+        expression = '{%s} : (%s)' % (' '.join(fields), ' AND '.join(terms))
+
+        return User.query.join(users_fts, users_fts.c.rowid == User.id).filter(
+            text(f'{FTS_TABLE} MATCH :fts_query').bindparams(fts_query=expression),
+            *filters
+        ).order_by(text(f'bm25({FTS_TABLE}, 10.0, 2.0, 1.0)'), User.id)
+
+    def _corrections(self, tokens):
+        alternatives = []
+        for token in tokens:
+            candidates = [row[0] for row in db.session.execute(
+                text(f'SELECT term FROM {FTS_TABLE}_vocab WHERE term >= :low AND term < :high LIMIT 5000'),
+                {'low': token[0], 'high': token[0] + '\U0010ffff'}
+            )]
+            if token in candidates:
+                alternatives.append([token])
+                continue
+            close = difflib.get_close_matches(token, candidates, n=3, cutoff=0.7)
+            alternatives.append(close or [token])
+        return alternatives
+
+
+def install_fts(conn):
+    conn.execute(text(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            name, email, phone,
+            content='users', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """))
+    conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}_vocab USING fts5vocab({FTS_TABLE}, 'row')"))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON users BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, email, phone) VALUES (new.id, new.name, new.email, new.phone);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON users BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email, phone)
+            VALUES ('delete', old.id, old.name, old.email, old.phone);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, email, phone ON users BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email, phone)
+            VALUES ('delete', old.id, old.name, old.email, old.phone);
+            INSERT INTO {FTS_TABLE}(rowid, name, email, phone) VALUES (new.id, new.name, new.email, new.phone);
+        END
+    """))
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+ENGINES = {
+    'like': LikeSearchEngine,
+    'fts5': FTS5SearchEngine,
+}
+
+
+def search_users(query, fields, filters=(), page=1, per_page=None):
+    engine = current_app.extensions['search']
+    per_page = per_page or current_app.config['SEARCH_PER_PAGE']
+    return engine.search(query, fields, filters=filters, page=page, per_page=per_page)
+
+
+def init_app(app):
+    app.config.setdefault('SEARCH_PER_PAGE', 20)
+    name = app.config.get('SEARCH_ENGINE')
+    if not name:
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        name = 'fts5' if uri.startswith('sqlite') else 'like'
+    app.extensions['search'] = ENGINES[name]()
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+from models import db, User, Department, SlotReservation
+from schedule import availability_by_day, as_time as _as_time, minutes as _minutes
+
+
+def slot_length(doctor_id):
+    doctor_minutes, department_minutes = db.session.query(
+        User.slot_minutes, Department.slot_minutes
+    ).outerjoin(Department, Department.id == User.department_id).filter(
+        User.id == doctor_id
+    ).first() or (None, None)
+    return doctor_minutes or department_minutes or current_app.config['DEFAULT_SLOT_MINUTES']
+
+
+def _slot_starts(intervals, length):
+    for start, end in intervals:
+        for minute in range(start, end - length + 1, length):
+            yield minute
+
+
+def slot_times(doctor_id, day, length=None):
+    """All slot start times on ``day``, booked or not."""
+    length = length or slot_length(doctor_id)
+    intervals = availability_by_day(doctor_id, day, day).get(day, [])
+    return [_as_time(m) for m in _slot_starts(intervals, length)]
+
+
+def free_slots(doctor_id, start_date, end_date, length=None):
+    """Open slots for ``doctor_id`` between two dates, inclusive.
+
+    Availability ranges and reservations for the whole window are each read
+    with one range query, then the reservations are swept against the
+    merged availability per day. The cost is three queries whatever the
+    window size. Returns an ordered mapping of date -> list of times.
+    """
+    length = length or slot_length(doctor_id)
+    availability = availability_by_day(doctor_id, start_date, end_date)
+
+    reserved = {}
+    for day, reserved_time in db.session.query(SlotReservation.date, SlotReservation.time).filter(
+        SlotReservation.doctor_id == doctor_id,
+        SlotReservation.date >= start_date,
+        SlotReservation.date <= end_date
+    ).order_by(SlotReservation.date, SlotReservation.time):
+        reserved.setdefault(day, []).append(_minutes(reserved_time))
+
+    now = datetime.now()
+    result = OrderedDict()
+    for day in sorted(availability):
+        taken = reserved.get(day, [])
+        earliest = _minutes(now) if day == now.date() else 0
+        i = 0
+        open_times = []
+        for minute in _slot_starts(availability[day], length):
+            if minute < earliest:
+                continue
+            # Reservations are sorted, so skip the ones that end before this
+            # slot starts; the next one overlaps only if it starts before
+            # this slot ends.
+            while i < len(taken) and taken[i] + length <= minute:
+                i += 1
+            if i < len(taken) and taken[i] < minute + length:
+                continue
+            open_times.append(_as_time(minute))
+        if open_times:
+            result[day] = open_times
+    return result
+
+
+def serialize_slots(slots):
+    return {day.isoformat(): [t.strftime('%H:%M') for t in times] for day, times in slots.items()}
+
+
+def booking_window(days=None):
+    start = date.today()
+    return start, start + timedelta(days=(days or current_app.config['BOOKING_WINDOW_DAYS']) - 1)
@@ -0,0 +1,159 @@
+import time as timer
+from collections import Counter
+
+from sqlalchemy import event, func, inspect
+
+from jobs import task
+from models import db, User, Department, Appointment, ArchivedAppointment, StatCounter
+from replicas import use_primary
+
+RECONCILED_AT = 'stats:reconciled_at'
+# Rows ever deleted from a table, which responses.py folds into page ETags.
+# These are not recomputed by reconcile().
+DELETES = 'deletes:'
+
+
+def deletes_key(model):
+    return DELETES + model.__tablename__
+
+
+def _user_keys(role, is_active):
+    return ['users:%s' % role] if role and is_active is not False else []
+
+
+def _appointment_keys(status, department_id):
+    return [
+        'appointments:total',
+        'appointments:status:%s' % (status or 'Pending'),
+        'appointments:department:%s' % (department_id or 'none'),
+    ]
+
+
+def _old_value(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, attr)
+
+
+def _doctor_department(session, doctor_id):
+    doctor = session.get(User, doctor_id) if doctor_id else None
+    return doctor.department_id if doctor else None
+
+
+def _collect_deltas(session, flush_context, instances):
+    with session.no_autoflush:
+        _count_changes(session, session.info.setdefault('stat_deltas', Counter()))
+
+
+def _count_changes(session, deltas):
+    for obj in session.new:
+        if isinstance(obj, User):
+            for key in _user_keys(obj.role, obj.is_active):
+                deltas[key] += 1
+        elif isinstance(obj, Appointment):
+            for key in _appointment_keys(obj.status, _doctor_department(session, obj.doctor_id)):
+                deltas[key] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, (User, Department, Appointment)):
+            deltas[deletes_key(type(obj))] += 1
+        if isinstance(obj, User):
+            for key in _user_keys(obj.role, obj.is_active):
+                deltas[key] -= 1
+        elif isinstance(obj, Appointment):
+            for key in _appointment_keys(obj.status, _doctor_department(session, obj.doctor_id)):
+                deltas[key] -= 1
+
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if not (state.attrs.role.history.has_changes() or state.attrs.is_active.history.has_changes()):
+                continue
+            for key in _user_keys(_old_value(state, 'role'), _old_value(state, 'is_active')):
+                deltas[key] -= 1
+            for key in _user_keys(obj.role, obj.is_active):
+                deltas[key] += 1
+        elif isinstance(obj, Appointment):
+            state = inspect(obj)
+            if not state.attrs.status.history.has_changes():
+                continue
+            deltas['appointments:status:%s' % _old_value(state, 'status')] -= 1
+            deltas['appointments:status:%s' % obj.status] += 1
+
+
+def _write_deltas(session, flush_context):
+    deltas = session.info.pop('stat_deltas', None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def apply_deltas(conn, deltas):
+    """Add ``deltas`` (key -> increment) to the counters on ``conn``.
+
+    Writers that bypass the ORM unit of work (set-based updates, bulk
+    inserts) call this directly inside their own transaction.
+    """
+    table = StatCounter.__table__
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        result = conn.execute(
+            table.update().where(table.c.key == key).values(value=table.c.value + delta)
+        )
+        if result.rowcount == 0:
+            conn.execute(table.insert().values(key=key, value=delta))
+
+
+def reconcile():
+    """Recompute every counter from the base tables."""
+    # The counts overwrite the primary's counters, so they must not come
+    # from a replica that may be behind it.
+    use_primary()
+    counts = Counter()
+
+    for role, total in db.session.query(User.role, func.count()).filter(
+        User.is_active == True
+    ).group_by(User.role):
+        counts['users:%s' % role] = total
+
+    # Archived appointments still count towards the totals.
+    for model in (Appointment, ArchivedAppointment):
+        for status, department_id, total in db.session.query(
+            model.status, User.department_id, func.count()
+        ).join(User, User.id == model.doctor_id).group_by(model.status, User.department_id):
+            for key in _appointment_keys(status, department_id):
+                counts[key] += total
+
+    counts[RECONCILED_AT] = int(timer.time())
+
+    StatCounter.query.filter(~StatCounter.key.startswith(DELETES)).delete(synchronize_session=False)
+    db.session.execute(StatCounter.__table__.insert(), [
+        {'key': key, 'value': value} for key, value in counts.items()
+    ])
+    db.session.commit()
+    return counts
+
+
+@task(every='STATS_RECONCILE_INTERVAL')
+def reconcile_stats():
+    reconcile()
+
+
+def get_counters():
+    """All counters in one query.
+
+    Only reads them: the flush hooks keep them current and the periodic
+    ``reconcile_stats`` job (or ``flask stats-reconcile``) corrects drift.
+    """
+    return Counter(dict(db.session.query(StatCounter.key, StatCounter.value)))
+
+
+def breakdown(counters, prefix):
+    return {key[len(prefix):]: value for key, value in counters.items() if key.startswith(prefix)}
+
+
+def init_app(app):
+    app.config.setdefault('STATS_RECONCILE_INTERVAL', 3600)
+    event.listen(db.session, 'before_flush', _collect_deltas)
+    event.listen(db.session, 'after_flush', _write_deltas)
@@ -0,0 +1,71 @@
+import os
+import sys
+from datetime import date, time, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, init_db
+from models import db, DoctorAvailability, User
+
+
+def make_app(tmp_path, **config):
+    return create_app({
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "hospital.db"}',
+        'SQLALCHEMY_REPLICA_URIS': [],
+        'WTF_CSRF_ENABLED': False,
+        'JOB_WORKERS': 0,
+        'PASSWORD_HASH_WORKERS': 0,
+        'JINJA_CACHE_DIR': None,
+        **config,
+    })
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    with app.app_context():
+        init_db()
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def add_user(role, email, password='secret', **fields):
+    user = User(name=email.split('@')[0].title(), email=email, role=role, **fields)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, email, password='secret'):
+    client.get('/logout')
+    response = client.post('/login', data={'email': email, 'password': password})
+    assert response.status_code == 302
+
+
+@pytest.fixture
+def doctor(app):
+    doctor = add_user('Doctor', 'doctor@example.com', department_id=1)
+    day = date.today() + timedelta(days=1)
+    db.session.add(DoctorAvailability(doctor_id=doctor.id, date=day, start_time=time(9), end_time=time(12)))
+    db.session.commit()
+    return doctor
+
+
+@pytest.fixture
+def patient(app):
+    return add_user('Patient', 'patient@example.com')
+
+
+@pytest.fixture
+def admin_client(client):
+    login(client, 'admin@hospital.com', 'admin123')
+    return client
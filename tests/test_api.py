@@ -0,0 +1,20 @@
+from datetime import date, time, timedelta
+
+from conftest import login
+from models import db, AvailabilityException, AvailabilityRule
+from schedule import weekday_mask
+
+
+def test_availability_includes_weekly_rules_and_time_off(client, doctor, patient):
+    day = date.today() + timedelta(days=1)
+    db.session.add(AvailabilityRule(doctor_id=doctor.id, weekdays=weekday_mask([day.weekday()]),
+                                    start_time=time(11), end_time=time(15)))
+    db.session.add(AvailabilityException(doctor_id=doctor.id, date=day, start_time=time(9), end_time=time(10)))
+    db.session.commit()
+    login(client, 'patient@example.com')
+
+    response = client.get(f'/api/v1/availability?doctor_id={doctor.id}&start={day}&end={day}')
+
+    assert response.get_json()['items'] == [
+        {'doctor_id': doctor.id, 'date': day.isoformat(), 'start_time': '10:00', 'end_time': '15:00'},
+    ]
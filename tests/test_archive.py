@@ -0,0 +1,42 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from archive import archive_old
+from conftest import login
+from export import export_appointments
+from models import db, Appointment, Treatment
+
+
+@pytest.fixture
+def history(doctor, patient):
+    old = date.today() - timedelta(days=1000)
+    recent = date.today() - timedelta(days=10)
+    for day in (old, recent):
+        appointment = Appointment(doctor_id=doctor.id, patient_id=patient.id, date=day,
+                                  time=time(9), status='Completed')
+        db.session.add(appointment)
+        db.session.flush()
+        db.session.add(Treatment(appointment_id=appointment.id, diagnosis=f'seen {day}'))
+    db.session.commit()
+    assert archive_old() == 1
+    return old, recent
+
+
+def test_export_includes_archived_appointments(history):
+    old, recent = history
+    lines = ''.join(export_appointments('csv')).splitlines()
+
+    assert len(lines) == 3
+    assert [line.split(',')[1] for line in lines[1:]] == [old.isoformat(), recent.isoformat()]
+    assert ''.join(export_appointments('csv', date_to=old)).count(f'seen {old}') == 1
+
+
+def test_api_lists_archived_treatments(client, history):
+    login(client, 'patient@example.com')
+
+    first = client.get('/api/v1/treatments?per_page=1').get_json()
+    second = client.get(f'/api/v1/treatments?per_page=1&cursor={first["next_cursor"]}').get_json()
+
+    assert [t['date'] for t in first['items'] + second['items']] == [d.isoformat() for d in reversed(history)]
+    assert second['next_cursor'] is None
@@ -0,0 +1,24 @@
+from conftest import login
+from models import db
+
+
+def test_deactivated_user_is_logged_out(client, patient):
+    login(client, 'patient@example.com')
+    assert client.get('/').headers['Location'].endswith('/patient/dashboard')
+
+    patient.is_active = False
+    db.session.commit()
+
+    assert client.get('/').headers['Location'].endswith('/login')
+    with client.session_transaction() as session:
+        assert 'user_id' not in session
+    assert client.get('/').status_code == 200
+
+
+def test_deactivated_user_cannot_open_role_pages(client, patient):
+    login(client, 'patient@example.com')
+    patient.is_active = False
+    db.session.commit()
+
+    assert client.get('/patient/dashboard').headers['Location'].endswith('/login')
+    assert client.get('/patient/dashboard').headers['Location'].endswith('/login')
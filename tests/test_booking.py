@@ -0,0 +1,96 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from booking import SlotTaken, book_appointment, bulk_set_status
+from conftest import login
+from models import db, Appointment, SlotReservation, Treatment
+from slots import free_slots
+
+
+def test_bulk_cancel_by_filter_releases_slots(admin_client, doctor, patient):
+    day = date.today() + timedelta(days=1)
+    booked = book_appointment(patient.id, doctor.id, day, time(9))
+    book_appointment(patient.id, doctor.id, day, time(10))
+    bulk_set_status('Booked', ids=[booked.id])
+
+    response = admin_client.post('/admin/appointments/bulk', data={
+        'action': 'cancel', 'scope': 'filter', 'status': 'Booked', 'doctor_id': doctor.id,
+    })
+
+    assert response.status_code == 200
+    statuses = dict(Appointment.query.with_entities(Appointment.id, Appointment.status))
+    assert sorted(statuses.values()) == ['Cancelled', 'Pending']
+    remaining = [r.appointment_id for r in SlotReservation.query]
+    assert remaining == [id for id, status in statuses.items() if status == 'Pending']
+    assert time(9) in free_slots(doctor.id, day, day)[day]
+    assert time(10) not in free_slots(doctor.id, day, day)[day]
+
+
+def test_bulk_set_status_skips_disallowed_transitions(app, doctor, patient):
+    day = date.today() + timedelta(days=1)
+    appointment = book_appointment(patient.id, doctor.id, day, time(9))
+    bulk_set_status('Cancelled', ids=[appointment.id])
+
+    report = bulk_set_status('Booked', ids=[appointment.id, 999])
+
+    assert report == {appointment.id: ('skipped', 'Cancelled'), 999: ('not_found', None)}
+    assert SlotReservation.query.count() == 0
+
+
+def test_approve_only_moves_pending_appointments(admin_client, doctor, patient):
+    day = date.today() + timedelta(days=1)
+    cancelled = book_appointment(patient.id, doctor.id, day, time(9))
+    bulk_set_status('Cancelled', ids=[cancelled.id])
+    rebooked = book_appointment(patient.id, doctor.id, day, time(9))
+
+    admin_client.post(f'/admin/appointment/approve/{cancelled.id}')
+    admin_client.post(f'/admin/appointment/approve/{rebooked.id}')
+
+    statuses = dict(Appointment.query.with_entities(Appointment.id, Appointment.status))
+    assert statuses == {cancelled.id: 'Cancelled', rebooked.id: 'Booked'}
+    assert admin_client.post('/admin/appointment/approve/999').status_code == 404
+
+
+def test_finished_appointments_cannot_be_cancelled_or_completed_again(client, doctor, patient):
+    day = date.today() + timedelta(days=1)
+    appointment = book_appointment(patient.id, doctor.id, day, time(9))
+    login(client, 'doctor@example.com')
+
+    client.post(f'/doctor/appointment/complete/{appointment.id}', data={'diagnosis': 'flu'})
+    assert db.session.get(Appointment, appointment.id).status == 'Pending'
+
+    bulk_set_status('Booked', ids=[appointment.id])
+    client.post(f'/doctor/appointment/complete/{appointment.id}', data={'diagnosis': 'flu'})
+    response = client.post(f'/doctor/appointment/complete/{appointment.id}', data={'diagnosis': 'flu'})
+    assert response.status_code == 302
+
+    client.post(f'/doctor/appointment/cancel/{appointment.id}')
+    login(client, 'patient@example.com')
+    client.post(f'/patient/appointment/cancel/{appointment.id}')
+    login(client, 'admin@hospital.com', 'admin123')
+    client.post(f'/admin/appointment/cancel/{appointment.id}')
+
+    db.session.expire_all()
+    assert db.session.get(Appointment, appointment.id).status == 'Completed'
+    assert Treatment.query.count() == 1
+
+
+def test_booking_refuses_slots_overlapping_other_reservations(app, doctor, patient):
+    day = date.today() + timedelta(days=1)
+    doctor.slot_minutes = 60
+    db.session.commit()
+    booked = book_appointment(patient.id, doctor.id, day, time(10))
+    completed = book_appointment(patient.id, doctor.id, day, time(11))
+    bulk_set_status('Booked', ids=[booked.id, completed.id])
+    bulk_set_status('Completed', ids=[completed.id])
+
+    with pytest.raises(SlotTaken):
+        book_appointment(patient.id, doctor.id, day, time(11))
+
+    doctor.slot_minutes = 45
+    db.session.commit()
+    assert free_slots(doctor.id, day, day)[day] == [time(9)]
+    with pytest.raises(SlotTaken):
+        book_appointment(patient.id, doctor.id, day, time(9, 45))
+    book_appointment(patient.id, doctor.id, day, time(9))
@@ -0,0 +1,9 @@
+import cache
+from conftest import make_app
+
+
+def test_production_shares_the_fragment_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOSPITAL_ENV', 'production')
+    app = make_app(tmp_path, CACHE_PATH=str(tmp_path / 'cache.db'))
+
+    assert isinstance(app.extensions['cache'], cache.SQLiteCache)
@@ -0,0 +1,16 @@
+from conftest import login
+
+
+def test_streams_over_the_limit_are_refused(app, client):
+    app.config['EVENTS_MAX_SUBSCRIBERS'] = 1
+    login(client, 'admin@hospital.com', 'admin123')
+
+    first = client.get('/events/appointments', buffered=False)
+    assert first.status_code == 200
+    assert client.get('/events/appointments').status_code == 503
+
+    first.close()
+    second = client.get('/events/appointments', buffered=False)
+    assert second.status_code == 200
+    second.close()
+    app.extensions['event_broker'].stop()
@@ -0,0 +1,18 @@
+import io
+from datetime import date, timedelta
+
+from models import DoctorAvailability
+
+
+def test_unreadable_tail_reports_the_records_already_imported(admin_client, doctor):
+    day = date.today() + timedelta(days=2)
+    rows = ''.join(f'doctor@example.com,{day},13:00,14:00\n' for _ in range(1500))
+    data = ('doctor_email,date,start_time,end_time\n' + rows).encode() + b'\xff\n'
+
+    response = admin_client.post('/admin/import', data={
+        'kind': 'availability', 'file': (io.BytesIO(data), 'availability.csv'),
+    })
+
+    assert response.status_code == 200
+    assert b'The 1000 records before the error were imported' in response.data
+    assert DoctorAvailability.query.filter_by(date=day).count() == 1000
@@ -0,0 +1,18 @@
+import json
+
+from conftest import make_app
+
+
+def test_metrics_sum_every_worker(tmp_path):
+    directory = tmp_path / 'metrics'
+    app = make_app(tmp_path, METRICS_DIR=str(directory))
+    other = {'hospital_request_duration_seconds': [
+        [['main.login', 'GET', 200], [[1] + [0] * 10, 0.004, 1]],
+    ]}
+    (directory / '1-other.json').write_text(json.dumps(other))
+
+    client = app.test_client()
+    client.get('/login')
+    body = client.get('/metrics').get_data(as_text=True)
+
+    assert 'hospital_request_duration_seconds_count{endpoint="main.login",method="GET",status="200"} 2' in body
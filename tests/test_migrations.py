@@ -0,0 +1,80 @@
+import sqlite3
+
+from sqlalchemy import create_engine, inspect
+
+from migrations import MIGRATIONS, upgrade
+
+# The schema as it was before the first migration.
+BASELINE_SCHEMA = """
+CREATE TABLE departments (
+    id INTEGER NOT NULL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    description TEXT,
+    created_at DATETIME
+);
+CREATE TABLE users (
+    id INTEGER NOT NULL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    email VARCHAR(120) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL,
+    role VARCHAR(20) NOT NULL,
+    phone VARCHAR(15),
+    address TEXT,
+    date_of_birth DATE,
+    gender VARCHAR(10),
+    created_at DATETIME,
+    is_active BOOLEAN,
+    department_id INTEGER REFERENCES departments (id)
+);
+CREATE TABLE appointments (
+    id INTEGER NOT NULL PRIMARY KEY,
+    patient_id INTEGER NOT NULL REFERENCES users (id),
+    doctor_id INTEGER NOT NULL REFERENCES users (id),
+    date DATE NOT NULL,
+    time TIME NOT NULL,
+    status VARCHAR(20),
+    reason TEXT,
+    created_at DATETIME
+);
+CREATE TABLE doctor_availability (
+    id INTEGER NOT NULL PRIMARY KEY,
+    doctor_id INTEGER NOT NULL REFERENCES users (id),
+    date DATE NOT NULL,
+    start_time TIME NOT NULL,
+    end_time TIME NOT NULL,
+    is_available BOOLEAN
+);
+CREATE TABLE treatments (
+    id INTEGER NOT NULL PRIMARY KEY,
+    appointment_id INTEGER NOT NULL UNIQUE REFERENCES appointments (id),
+    diagnosis TEXT NOT NULL,
+    prescription TEXT,
+    notes TEXT,
+    created_at DATETIME
+);
+INSERT INTO departments (id, name, created_at) VALUES (1, 'Cardiology', '2024-01-01 09:00:00');
+INSERT INTO users (id, name, email, password_hash, role, created_at, is_active, department_id) VALUES
+    (1, 'Doctor', 'doctor@hospital.com', 'x', 'Doctor', '2024-01-01 09:00:00', 1, 1),
+    (2, 'Patient', 'patient@hospital.com', 'x', 'Patient', '2024-01-02 09:00:00', 1, NULL);
+INSERT INTO appointments (id, patient_id, doctor_id, date, time, status, created_at) VALUES
+    (1, 2, 1, '2024-02-01', '09:00:00.000000', 'Booked', '2024-01-03 09:00:00');
+"""
+
+
+def test_upgrade_baseline_database(tmp_path):
+    path = tmp_path / 'baseline.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+    engine = create_engine(f'sqlite:///{path}')
+
+    applied = upgrade(engine)
+
+    assert [version for version, _ in applied] == [version for version, _, _ in MIGRATIONS]
+    indexes = {index['name'] for index in inspect(engine).get_indexes('appointments')}
+    assert {'ix_appointments_doctor_date_status', 'ix_appointments_updated_at'} <= indexes
+    with engine.connect() as conn:
+        row = conn.exec_driver_sql('SELECT updated_at, created_at FROM appointments').one()
+        assert row[0] == row[1]
+        assert conn.exec_driver_sql('SELECT COUNT(*) FROM slot_reservations').scalar() == 1
+    assert upgrade(engine) == []
+    engine.dispose()
@@ -0,0 +1,12 @@
+from passwords import PasswordHasher
+
+
+def test_pool_workers_are_not_forked_from_the_web_process():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+    try:
+        pwhash = hasher.hash('secret')
+        assert hasher.verify(pwhash, 'secret')
+        assert hasher.hash_many(['a', 'b'])[1].startswith('pbkdf2:sha256:1000$')
+        assert hasher._executor._mp_context.get_start_method() in ('forkserver', 'spawn')
+    finally:
+        hasher.shutdown()
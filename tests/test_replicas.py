@@ -0,0 +1,54 @@
+from datetime import date, time
+
+from app import init_db
+from conftest import add_user, login, make_app
+from export import export_appointments
+from models import db, Appointment, ExportWatermark, StatCounter
+from replicas import sync_sqlite_replicas
+from stats import RECONCILED_AT, reconcile
+
+
+def replica_app(tmp_path):
+    app = make_app(tmp_path, SQLALCHEMY_REPLICA_URIS=[f'sqlite:///{tmp_path / "replica.db"}'],
+                   REPLICA_STICKY_SECONDS=0)
+    with app.app_context():
+        init_db()
+        sync_sqlite_replicas(db)
+    return app
+
+
+def test_dashboard_reads_counters_and_reconcile_reads_the_primary(tmp_path):
+    app = replica_app(tmp_path)
+    with app.app_context():
+        add_user('Patient', 'patient@example.com')
+        StatCounter.query.filter_by(key='users:Patient').update({'value': 5})
+        StatCounter.query.filter_by(key=RECONCILED_AT).update({'value': 0})
+        db.session.commit()
+
+    client = app.test_client()
+    login(client, 'admin@hospital.com', 'admin123')
+    assert client.get('/admin/dashboard').status_code == 200
+    with app.app_context():
+        assert db.session.get(StatCounter, 'users:Patient').value == 5
+
+    with app.test_request_context('/admin/dashboard'):
+        app.preprocess_request()
+        assert reconcile()['users:Patient'] == 1
+        assert db.session.get(StatCounter, 'users:Patient').value == 1
+
+
+def test_export_feed_reads_the_primary(tmp_path):
+    app = replica_app(tmp_path)
+    with app.app_context():
+        doctor = add_user('Doctor', 'doctor@example.com')
+        patient = add_user('Patient', 'patient@example.com')
+        for hour in (9, 10):
+            db.session.add(Appointment(doctor_id=doctor.id, patient_id=patient.id,
+                                       date=date(2024, 1, 1), time=time(hour)))
+        db.session.commit()
+
+    with app.test_request_context('/admin/export'):
+        app.preprocess_request()
+        lines = ''.join(export_appointments('csv', feed='nightly')).splitlines()
+        assert len(lines) == 3
+        assert db.session.get(ExportWatermark, 'nightly').last_id == 2
@@ -0,0 +1,47 @@
+from datetime import date, time, timedelta
+
+from sqlalchemy import event
+
+from archive import archive_old
+from models import db, Appointment
+
+
+def etag(client, url='/admin/appointments'):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def test_unchanged_page_is_not_modified(admin_client):
+    admin_client.get('/admin/dashboard')
+    tag = etag(admin_client)
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = admin_client.get('/admin/appointments', headers={'If-None-Match': tag})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert response.status_code == 304
+    assert not any('count(' in statement.lower() for statement in statements)
+    assert etag(admin_client, '/admin/appointments?status=Pending') != tag
+
+
+def test_tag_follows_updates_and_deletes(admin_client, doctor, patient):
+    admin_client.get('/admin/dashboard')
+    appointment = Appointment(doctor_id=doctor.id, patient_id=patient.id,
+                              date=date.today() - timedelta(days=1000), time=time(9), status='Pending')
+    db.session.add(appointment)
+    db.session.commit()
+    tags = [etag(admin_client)]
+
+    appointment.status = 'Completed'
+    db.session.commit()
+    tags.append(etag(admin_client))
+
+    assert archive_old() == 1
+    tags.append(etag(admin_client))
+
+    assert len(set(tags)) == 3
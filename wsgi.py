@@ -0,0 +1,8 @@
+"""Production entry point: ``gunicorn -c gunicorn.conf.py wsgi:app``."""
+import os
+
+os.environ.setdefault('HOSPITAL_ENV', 'production')
+
+from app import create_app
+
+app = create_app()